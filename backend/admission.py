@@ -0,0 +1,175 @@
+"""
+Admission control for the HTTP API: per-client rate limits and bulkheads.
+
+Requests are sorted into route classes by method and path (public reads,
+file downloads, pipeline runs); everything else is admitted untouched.
+Each class has
+
+- a token bucket per client IP: `rate` tokens per second, up to `burst`
+  banked. An empty bucket answers 429 with the seconds until the next
+  token in `Retry-After`.
+- a bulkhead: at most `concurrency` requests of the class in flight at
+  once, across all clients. A full bulkhead answers 429 immediately
+  instead of queueing, so a burst of slow downloads can't starve the
+  Mongo pool or the event loop for the other classes.
+
+State is per process; with several uvicorn workers each enforces its own
+share.
+"""
+import math
+import re
+import time
+from dataclasses import dataclass
+
+import orjson
+
+import metrics
+
+# (route class, method, path pattern); first match wins
+ROUTE_CLASSES = [
+    ("pipeline", "POST", re.compile(r"^/api/process/")),
+    ("pipeline", "POST", re.compile(r"^/api/cities/upload$")),
+    ("pipeline", "POST", re.compile(r"^/api/queue/[^/]+/review$")),
+    ("downloads", "GET", re.compile(r"^/api/cities/[^/]+/(layer/\d+(/.*)?|stage1|estimate)$")),
+    ("downloads", "GET", re.compile(r"^/api/process/[^/]+/[^/]+/preview(/meta)?$")),
+    ("downloads", "GET", re.compile(r"^/api/docs/download$")),
+    ("public", "GET", re.compile(r"^/api/(featured|cities(/search|/[^/]+(/all-layers)?)?)$")),
+]
+
+
+def classify(method: str, path: str):
+    """Route class for a request, or None if it is not limited"""
+    for route_class, route_method, pattern in ROUTE_CLASSES:
+        if method == route_method and pattern.match(path):
+            return route_class
+    return None
+
+
+def parse_rate(spec: str) -> tuple:
+    """'10/40' -> (10.0 tokens per second, burst 40)"""
+    rate, _, burst = spec.partition("/")
+    rate = float(rate)
+    return rate, int(burst) if burst else max(1, math.ceil(rate))
+
+
+@dataclass
+class RouteLimit:
+    rate: float  # tokens per second; 0 disables the rate limit
+    burst: int
+    concurrency: int  # 0 disables the bulkhead
+
+
+class RateLimiter:
+    """Token buckets keyed by (client, route class)"""
+
+    def __init__(self, max_keys: int = 10_000):
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> [tokens, last refill, RouteLimit]
+
+    def take(self, key, limit: RouteLimit, now: float = None) -> float:
+        """Spend one token; returns 0 if admitted, else seconds until a token is available"""
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune(now)
+            bucket = self._buckets[key] = [float(limit.burst), now, limit]
+        tokens = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / limit.rate
+
+    def _prune(self, now: float):
+        """Drop buckets that have refilled (idle clients); clear all if that frees nothing"""
+        full = [key for key, (tokens, last, limit) in self._buckets.items()
+                if tokens + (now - last) * limit.rate >= limit.burst]
+        for key in full:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_keys:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class Bulkhead:
+    """Non-blocking concurrency cap: acquire() fails instead of waiting"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.in_flight = 0
+
+    def acquire(self) -> bool:
+        if self.limit and self.in_flight >= self.limit:
+            return False
+        self.in_flight += 1
+        metrics.BULKHEAD_IN_FLIGHT.labels(self.name).set(self.in_flight)
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        metrics.BULKHEAD_IN_FLIGHT.labels(self.name).set(self.in_flight)
+
+
+def client_ip(scope, trust_forwarded: bool) -> str:
+    if trust_forwarded:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying RateLimiter and Bulkhead per route class"""
+
+    def __init__(self, app, limits: dict, trust_forwarded: bool = False, enabled: bool = True):
+        self.app = app
+        self.limits = limits
+        self.trust_forwarded = trust_forwarded
+        self.enabled = enabled
+        self.limiter = RateLimiter()
+        self.bulkheads = {name: Bulkhead(name, limit.concurrency) for name, limit in limits.items()}
+
+    async def __call__(self, scope, receive, send):
+        route_class = classify(scope["method"], scope["path"]) if scope["type"] == "http" and self.enabled else None
+        limit = self.limits.get(route_class)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        if limit.rate > 0:
+            wait = self.limiter.take((client_ip(scope, self.trust_forwarded), route_class), limit)
+            if wait:
+                metrics.ADMISSION_REJECTED.labels(route_class, "rate_limit").inc()
+                await self._reject(send, wait, "Too many requests - slow down")
+                return
+
+        bulkhead = self.bulkheads[route_class]
+        if not bulkhead.acquire():
+            metrics.ADMISSION_REJECTED.labels(route_class, "bulkhead").inc()
+            await self._reject(send, 1, "Server busy - try again shortly")
+            return
+        metrics.ADMISSION_ADMITTED.labels(route_class).inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            bulkhead.release()
+
+    @staticmethod
+    async def _reject(send, retry_after: float, detail: str):
+        body = orjson.dumps({"detail": detail})
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
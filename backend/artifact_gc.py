@@ -0,0 +1,140 @@
+"""
+Garbage collection for files stored under UPLOAD_DIR.
+
+Files are reconciled against the `queue`, `processed` and `styles`
+collections. Anything no document points at (directly by path, or by the
+city id prefix used for derived files) is an orphan and gets deleted.
+Files under `cache/` can always be rebuilt from other artifacts, so when a
+disk quota is configured they are evicted least-recently-used first.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Sub-directories whose files may carry a `{city_id}_...` name prefix
+DERIVED_DIRS = ("processed", "cache")
+
+# Sub-directories holding regenerable caches (LRU-evicted under quota)
+REGENERABLE_DIRS = ("cache",)
+
+# Collections whose documents reference files on disk
+TRACKED_COLLECTIONS = ("queue", "processed", "styles")
+
+
+def _collect_doc_paths(doc: dict, upload_dir: str, paths: set):
+    """Add every string field of a document that points into upload_dir"""
+    for key, value in doc.items():
+        if isinstance(value, str) and value.startswith(upload_dir):
+            paths.add(value)
+        elif isinstance(value, dict):
+            _collect_doc_paths(value, upload_dir, paths)
+
+
+async def collect_references(db, upload_dir: Path) -> tuple:
+    """Return (referenced file paths, live document ids) from the tracked collections"""
+    prefix = str(upload_dir)
+    paths, ids = set(), set()
+    for name in TRACKED_COLLECTIONS:
+        async for doc in db[name].find({}, {"_id": 0}):
+            if doc.get("id"):
+                ids.add(doc["id"])
+            _collect_doc_paths(doc, prefix, paths)
+    return paths, ids
+
+
+def is_regenerable(path: Path, upload_dir: Path) -> bool:
+    """True for files that can be rebuilt and are therefore safe to evict"""
+    try:
+        top = path.relative_to(upload_dir).parts[0]
+    except (ValueError, IndexError):
+        return False
+    return top in REGENERABLE_DIRS
+
+
+def _owner_id(path: Path, upload_dir: Path):
+    """City/style id encoded in a derived file name, e.g. `{id}_stage1.svg`"""
+    rel = path.relative_to(upload_dir).parts
+    if not rel or rel[0] not in DERIVED_DIRS:
+        return None
+    return path.name.split("_", 1)[0].split(".", 1)[0]
+
+
+def _sweep(upload_dir: Path, referenced: set, live_ids: set, quota_bytes: int, grace_seconds: int) -> dict:
+    """Filesystem half of the GC; runs in a worker thread"""
+    now = time.time()
+    report = {
+        "scanned_files": 0,
+        "scanned_bytes": 0,
+        "orphans_removed": 0,
+        "orphan_bytes": 0,
+        "evicted": 0,
+        "evicted_bytes": 0,
+    }
+    survivors = []
+
+    for root, _dirs, files in os.walk(upload_dir):
+        for name in files:
+            path = Path(root) / name
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            report["scanned_files"] += 1
+            report["scanned_bytes"] += st.st_size
+
+            # Never touch files that are still being written by a request
+            young = now - st.st_mtime < grace_seconds
+            owned = str(path) in referenced or _owner_id(path, upload_dir) in live_ids
+            if owned or young:
+                survivors.append((path, st))
+                continue
+
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            report["orphans_removed"] += 1
+            report["orphan_bytes"] += st.st_size
+
+    total = sum(st.st_size for _, st in survivors)
+    if quota_bytes and total > quota_bytes:
+        # Least recently used first; atime is unreliable on noatime mounts
+        candidates = sorted(
+            (item for item in survivors if is_regenerable(item[0], upload_dir)),
+            key=lambda item: max(item[1].st_atime, item[1].st_mtime)
+        )
+        for path, st in candidates:
+            if total <= quota_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            total -= st.st_size
+            report["evicted"] += 1
+            report["evicted_bytes"] += st.st_size
+
+    report["total_bytes_after"] = total
+    report["over_quota"] = bool(quota_bytes) and total > quota_bytes
+    return report
+
+
+async def collect_garbage(db, upload_dir: Path, quota_bytes: int = 0, grace_seconds: int = 3600) -> dict:
+    """Delete orphaned files and enforce the disk quota. Returns a report."""
+    started = time.perf_counter()
+    referenced, live_ids = await collect_references(db, upload_dir)
+    report = await asyncio.to_thread(_sweep, upload_dir, referenced, live_ids, quota_bytes, grace_seconds)
+    report["reclaimed_bytes"] = report["orphan_bytes"] + report["evicted_bytes"]
+    report["quota_bytes"] = quota_bytes
+    report["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    report["finished_at"] = datetime.now(timezone.utc).isoformat()
+    logger.info(
+        f"GC: removed {report['orphans_removed']} orphans, evicted {report['evicted']} cache files, "
+        f"reclaimed {report['reclaimed_bytes']} bytes"
+    )
+    return report
@@ -0,0 +1,168 @@
+"""
+Build-system bookkeeping for pipeline artifacts.
+
+The pipeline is a chain of nodes, each producing files from its input:
+
+    photo -> stage1 (Gemini) -> spaced (expand_horizontal) -> layers (Gemini)
+
+A node's *key* hashes everything its output depends on: the content
+digest of its input and its own parameters (prompt text, model,
+temperature, tiling, precision, spacing percentage, ...). When a node is
+built its record {key, inputs, params, outputs: {name: digest}, digest}
+is stored on the queue item under `builds.<node>`, and a copy of its
+files goes into the build cache under the key.
+
+A node is current when its recorded key equals the key computed from the
+current input and its files still have the recorded digests. A node that
+is not current but whose key was built before (e.g. a spacing percentage
+that was already separated into layers) is restored from the cache
+instead of recomputed. Gemini output isn't deterministic, so a node's key
+uses the digest of what its input node actually produced: re-running
+Stage 1 changes that digest and makes the spaced SVG and layers stale.
+
+The `geometry` outputs (.npz) are saved alongside the SVGs but left out
+of a node's digest: zip entries carry a timestamp, so identical drawings
+would otherwise hash differently.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+NODES = ("stage1", "spaced", "layers")
+AUXILIARY_OUTPUTS = ("geometry",)
+
+
+def bytes_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def text_digest(text: str) -> str:
+    return bytes_digest(text.encode())
+
+
+def file_digest(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _canonical(value) -> bytes:
+    return json.dumps(value, sort_keys=True, separators=(",", ":")).encode()
+
+
+def node_key(node: str, inputs: dict, params: dict) -> str:
+    """Hash of a node's input digests and parameters"""
+    return bytes_digest(_canonical({"node": node, "inputs": inputs, "params": params}))
+
+
+def combined_digest(digests: dict) -> str:
+    """Digest of a node's outputs, as seen by the nodes built from it"""
+    return bytes_digest(_canonical({k: v for k, v in digests.items() if k not in AUXILIARY_OUTPUTS}))
+
+
+def outputs_digest(paths: dict) -> str:
+    """`combined_digest` of output files on disk (missing auxiliary files are skipped)"""
+    return combined_digest({
+        name: file_digest(path) for name, path in paths.items()
+        if name not in AUXILIARY_OUTPUTS and path
+    })
+
+
+def record(key: str, inputs: dict, params: dict, paths: dict) -> dict:
+    """Build record for a node whose files were just written"""
+    digests = {name: file_digest(path) for name, path in paths.items()}
+    return {
+        "key": key,
+        "inputs": inputs,
+        "params": params,
+        "outputs": digests,
+        "digest": combined_digest(digests),
+        "built_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def is_current(build: dict, key: str, paths: dict) -> bool:
+    """True if `build` was made for `key` and its files are unchanged"""
+    if not build or build.get("key") != key:
+        return False
+    for name, digest in build["outputs"].items():
+        path = paths.get(name)
+        if not path or not Path(path).exists() or file_digest(path) != digest:
+            return False
+    return True
+
+
+def _atomic_copy(source: Path, dest: Path):
+    fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=f".{dest.name}.")
+    os.close(fd)
+    try:
+        shutil.copyfile(source, tmp)
+        os.replace(tmp, dest)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+class BuildCache:
+    """
+    Files of past builds, by node key. Entries are named
+    `{city_id}_{node}_{key prefix}...` so artifact GC keeps them while the
+    city exists, and may evict them under quota like any other cache.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _manifest(self, city_id: str, node: str, key: str) -> Path:
+        return self.root / f"{city_id}_{node}_{key[:16]}.json"
+
+    def save(self, city_id: str, node: str, build: dict, paths: dict, meta: dict = None):
+        """Copy a node's files (already described by `build`) into the cache"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        prefix = f"{city_id}_{node}_{build['key'][:16]}"
+        files = {}
+        for name, path in paths.items():
+            files[name] = f"{prefix}_{name}"
+            _atomic_copy(Path(path), self.root / files[name])
+        manifest = self._manifest(city_id, node, build["key"])
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=f".{manifest.name}.")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"build": build, "files": files, "meta": meta or {}}, f)
+        os.replace(tmp, manifest)
+
+    def lookup(self, city_id: str, node: str, key: str):
+        """The cached manifest for `key` if all its files are still intact, else None"""
+        try:
+            manifest = json.loads(self._manifest(city_id, node, key).read_text())
+        except (OSError, ValueError):
+            return None
+        if manifest["build"].get("key") != key:
+            return None
+        for name, filename in manifest["files"].items():
+            path = self.root / filename
+            if not path.exists() or file_digest(path) != manifest["build"]["outputs"][name]:
+                logger.warning(f"Build cache entry {node} {key[:12]} for {city_id} is incomplete")
+                return None
+        return manifest
+
+    def restore(self, city_id: str, node: str, key: str, paths: dict):
+        """
+        Copy the cached files for `key` to `paths` (same output names).
+        Returns the manifest ({build, files, meta}) or None on a miss.
+        """
+        manifest = self.lookup(city_id, node, key)
+        if not manifest:
+            return None
+        for name, filename in manifest["files"].items():
+            _atomic_copy(self.root / filename, Path(paths[name]))
+        manifest["build"]["restored_at"] = datetime.now(timezone.utc).isoformat()
+        return manifest
@@ -0,0 +1,179 @@
+"""
+Stub of the Gemini `generateContent` REST endpoint for offline load tests.
+
+Requests carrying inline image data are answered like Stage 1 (a skyline
+SVG), text-only requests like Stage 2 (a JSON object of three layers).
+Latency follows a log-normal distribution around a configurable median;
+a configurable share of requests fails with an HTTP error instead.
+
+`cachedContents` (context caching) is stubbed too: create, TTL update,
+get and delete, with expiry. A generateContent call referencing an
+unknown or expired cache gets 404. `--no-context-cache` makes creation
+fail with 400, to exercise the API's inline-prompt fallback.
+
+Usage (from backend/):
+    python -m bench.fake_gemini --port 8900 --latency-ms 800 --error-rate 0.02
+Then start the API with GEMINI_BASE_URL=http://127.0.0.1:8900
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from bench import synthetic
+
+
+class FakeGeminiConfig:
+    def __init__(self, latency_ms: float = 500, latency_sigma: float = 0.5, error_rate: float = 0.0,
+                 error_status: int = 503, svg_elements: int = 500, seed: int = 0, context_cache: bool = True):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.svg_elements = svg_elements
+        self.context_cache = context_cache
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.caches = {}  # id -> {"model", "contents", "expires" (monotonic), "display_name"}
+        self.cache_stats = {"created": 0, "updated": 0, "cached_requests": 0, "missing": 0}
+
+    def latency(self) -> float:
+        """Seconds to wait: log-normal with the configured median"""
+        if self.latency_ms <= 0:
+            return 0.0
+        return self.rng.lognormvariate(math.log(self.latency_ms / 1000), self.latency_sigma)
+
+
+def _has_inline_data(body: dict) -> bool:
+    for content in body.get("contents", []):
+        for part in content.get("parts", []):
+            if "inlineData" in part or "inline_data" in part:
+                return True
+    return False
+
+
+def _ttl_seconds(ttl: str) -> float:
+    return float(str(ttl).rstrip("s") or 0)
+
+
+def _error(code: int, message: str, status: str) -> JSONResponse:
+    return JSONResponse({"error": {"code": code, "message": message, "status": status}}, status_code=code)
+
+
+def _candidate(text: str) -> dict:
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {"promptTokenCount": 0, "candidatesTokenCount": len(text) // 4},
+    }
+
+
+def create_app(config: FakeGeminiConfig) -> Starlette:
+    # Responses are deterministic per stage, so build them once
+    svg = synthetic.skyline_svg(config.svg_elements)
+    stage1 = synthetic.stage1_response(svg)
+    stage2 = synthetic.stage2_response(svg)
+
+    def live_cache(name: str):
+        entry = config.caches.get(name.rsplit("/", 1)[-1])
+        if entry and entry["expires"] > time.monotonic():
+            return entry
+        return None
+
+    def cache_resource(cache_id: str) -> dict:
+        entry = config.caches[cache_id]
+        expire_time = datetime.now(timezone.utc) + timedelta(seconds=entry["expires"] - time.monotonic())
+        return {
+            "name": f"cachedContents/{cache_id}",
+            "model": entry["model"],
+            "displayName": entry["display_name"],
+            "expireTime": expire_time.isoformat().replace("+00:00", "Z"),
+        }
+
+    async def generate_content(request: Request):
+        config.requests += 1
+        body = json.loads(await request.body() or b"{}")
+        await asyncio.sleep(config.latency())
+        if body.get("cachedContent"):
+            if not live_cache(body["cachedContent"]):
+                config.cache_stats["missing"] += 1
+                return _error(404, f"CachedContent not found: {body['cachedContent']}", "NOT_FOUND")
+            config.cache_stats["cached_requests"] += 1
+        if config.rng.random() < config.error_rate:
+            return _error(config.error_status, "Injected failure", "UNAVAILABLE")
+        return JSONResponse(_candidate(stage1 if _has_inline_data(body) else stage2))
+
+    async def create_cache(request: Request):
+        if not config.context_cache:
+            return _error(400, "Context caching is not supported for this model", "INVALID_ARGUMENT")
+        body = json.loads(await request.body() or b"{}")
+        cache_id = uuid.uuid4().hex[:12]
+        config.caches[cache_id] = {
+            "model": body.get("model", ""),
+            "contents": body.get("contents", []),
+            "display_name": body.get("displayName", ""),
+            "expires": time.monotonic() + _ttl_seconds(body.get("ttl", "3600s")),
+        }
+        config.cache_stats["created"] += 1
+        return JSONResponse(cache_resource(cache_id))
+
+    async def cache(request: Request):
+        cache_id = request.path_params["cache_id"]
+        if not live_cache(cache_id):
+            return _error(404, f"CachedContent not found: {cache_id}", "NOT_FOUND")
+        if request.method == "DELETE":
+            del config.caches[cache_id]
+            return JSONResponse({})
+        if request.method == "PATCH":
+            body = json.loads(await request.body() or b"{}")
+            if "ttl" in body:
+                config.caches[cache_id]["expires"] = time.monotonic() + _ttl_seconds(body["ttl"])
+            config.cache_stats["updated"] += 1
+        return JSONResponse(cache_resource(cache_id))
+
+    async def route(request: Request):
+        # google-genai calls /{version}/models/{model}:generateContent
+        if request.path_params["action"].endswith(":generateContent"):
+            return await generate_content(request)
+        return JSONResponse({"error": {"code": 404, "message": "Not stubbed"}}, status_code=404)
+
+    async def stats(request: Request):
+        return JSONResponse({"requests": config.requests, "caches": len(config.caches), **config.cache_stats})
+
+    return Starlette(routes=[
+        Route("/{version}/cachedContents", create_cache, methods=["POST"]),
+        Route("/{version}/cachedContents/{cache_id}", cache, methods=["GET", "PATCH", "DELETE"]),
+        Route("/{version}/models/{action}", route, methods=["POST"]),
+        Route("/stats", stats),
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stub Gemini generateContent server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=500, help="median latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal sigma (0 = fixed)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--svg-elements", type=int, default=500, help="response size in SVG elements")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-context-cache", action="store_true", help="reject cachedContents creation")
+    args = parser.parse_args(argv)
+
+    config = FakeGeminiConfig(args.latency_ms, args.latency_sigma, args.error_rate,
+                              args.error_status, args.svg_elements, args.seed, not args.no_context_cache)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Micro-benchmarks for the CPU-bound backend hot paths.
+
+Usage (from backend/):
+    python -m bench.hotpaths --output bench_results.json
+    python -m bench.hotpaths --sizes 10,1000 --filter spacing
+    python -m bench.hotpaths --output new.json --compare bench_results.json
+
+Each case is run against synthetic skylines / PDFs of every requested
+size. Results are written as JSON (with the git commit and interpreter)
+so runs from different commits can be compared with --compare.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+# server.py reads these at import time; nothing connects until a query runs
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+
+import dedupe  # noqa: E402
+import geometry  # noqa: E402
+import server  # noqa: E402
+import svg_compact  # noqa: E402
+import tiling  # noqa: E402
+from bench import synthetic  # noqa: E402
+
+DEFAULT_SIZES = (10, 100, 1_000, 10_000, 100_000)
+
+
+def case_spacing(size: int, workdir: Path):
+    svg = synthetic.skyline_svg(size)
+    return len(svg), lambda: server.expand_horizontal_spacing(svg, 50)
+
+
+def case_geometry_parse(size: int, workdir: Path):
+    svg = synthetic.skyline_svg(size)
+    return len(svg), lambda: geometry.parse_svg(svg)
+
+
+def case_geometry_spacing(size: int, workdir: Path):
+    store = geometry.parse_svg(synthetic.skyline_svg(size))
+    return store.coords.nbytes, lambda: store.expand_horizontal(50)
+
+
+def case_geometry_export(size: int, workdir: Path):
+    store = geometry.parse_svg(synthetic.skyline_svg(size)).expand_horizontal(50)
+    return store.coords.nbytes, store.to_svg
+
+
+def case_compact_export(size: int, workdir: Path):
+    store = geometry.parse_svg(synthetic.skyline_svg(size)).expand_horizontal(50)
+    return store.coords.nbytes, lambda: svg_compact.serialize(store)
+
+
+def case_dedupe(size: int, workdir: Path):
+    store = geometry.parse_svg(synthetic.skyline_svg(size))
+    return store.coords.nbytes, lambda: dedupe.dedupe_store(store)
+
+
+def case_tiling(size: int, workdir: Path):
+    store = geometry.parse_svg(synthetic.skyline_svg(size))
+
+    def split_and_stitch():
+        strips = tiling.plan_strips(store, 8)
+        return tiling.stitch(strips, [strip.svg for strip in strips], store.meta)
+    return store.coords.nbytes, split_and_stitch
+
+
+def case_stage1_parse(size: int, workdir: Path):
+    response = synthetic.stage1_response(synthetic.skyline_svg(size))
+    return len(response), lambda: server.extract_svg_from_response(response)
+
+
+def case_stage2_parse(size: int, workdir: Path):
+    svg = synthetic.skyline_svg(size)
+    response = synthetic.stage2_response(svg)
+    return len(response), lambda: server.parse_layers_response(response, svg)
+
+
+def case_pdf_extract(size: int, workdir: Path):
+    path = workdir / f"style_{size}.pdf"
+    path.write_bytes(synthetic.style_pdf(size))
+    return path.stat().st_size, lambda: asyncio.run(server.extract_text_from_pdf(str(path)))
+
+
+CASES = {
+    "expand_horizontal_spacing": case_spacing,
+    "geometry_parse": case_geometry_parse,
+    "geometry_expand": case_geometry_spacing,
+    "geometry_to_svg": case_geometry_export,
+    "compact_svg": case_compact_export,
+    "dedupe_segments": case_dedupe,
+    "stage2_tiling": case_tiling,
+    "stage1_extract_svg": case_stage1_parse,
+    "stage2_parse_layers": case_stage2_parse,
+    "extract_text_from_pdf": case_pdf_extract,
+}
+
+# pdfplumber needs ~1 s per 1,000 drawing operators, so 100k would take minutes
+MAX_SIZE = {"extract_text_from_pdf": 10_000}
+
+
+def measure(fn, min_runs: int, min_time: float) -> list:
+    """Run fn until both min_runs and min_time are reached; returns per-run seconds"""
+    fn()  # warm-up
+    times = []
+    budget_start = time.perf_counter()
+    while len(times) < min_runs or time.perf_counter() - budget_start < min_time:
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+        if len(times) >= 1000:
+            break
+    return times
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, baseline_path: str):
+    baseline = json.loads(Path(baseline_path).read_text())
+    old = {(r["name"], r["size"]): r for r in baseline["results"]}
+    print(f"\nvs {baseline_path} ({baseline['meta'].get('commit')})")
+    print(f"{'case':<28}{'size':>8}{'old ms':>12}{'new ms':>12}{'ratio':>8}")
+    for r in current["results"]:
+        prev = old.get((r["name"], r["size"]))
+        if not prev:
+            continue
+        ratio = r["median_s"] / prev["median_s"] if prev["median_s"] else float("nan")
+        flag = "  <-- slower" if ratio > 1.1 else ""
+        print(f"{r['name']:<28}{r['size']:>8}{prev['median_s'] * 1000:>12.3f}{r['median_s'] * 1000:>12.3f}{ratio:>8.2f}{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark SVG/PDF hot paths")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="comma-separated element counts")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--min-runs", type=int, default=3)
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds per case/size")
+    parser.add_argument("--no-size-cap", action="store_true", help="run every case at every size")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, build in CASES.items():
+            if args.filter and args.filter not in name:
+                continue
+            for size in sizes:
+                if not args.no_size_cap and size > MAX_SIZE.get(name, size):
+                    continue
+                input_bytes, fn = build(size, Path(tmp))
+                times = measure(fn, args.min_runs, args.min_time)
+                row = {
+                    "name": name,
+                    "size": size,
+                    "input_bytes": input_bytes,
+                    "runs": len(times),
+                    "min_s": min(times),
+                    "median_s": statistics.median(times),
+                    "mean_s": statistics.fmean(times),
+                    "stdev_s": statistics.stdev(times) if len(times) > 1 else 0.0,
+                }
+                results.append(row)
+                print(f"{name:<28}{size:>8}  median {row['median_s'] * 1000:10.3f} ms  ({row['runs']} runs, {input_bytes} B)", flush=True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        },
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\nWrote {args.output}")
+    if args.compare:
+        compare(report, args.compare)
+    return report
+
+
+if __name__ == "__main__":
+    main()
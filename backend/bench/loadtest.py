@@ -0,0 +1,334 @@
+"""
+Offline end-to-end load harness.
+
+Starts the stub Gemini server (bench/fake_gemini.py) and the FastAPI app
+under uvicorn against a local MongoDB, seeds a style and a few processed
+cities, then drives an open-loop mix of uploads, full pipeline runs,
+searches, city lookups and layer downloads at a target request rate.
+Reports throughput and p50/p95/p99 latency per route.
+
+Usage (from backend/, with mongod listening on localhost:27017):
+    python -m bench.loadtest --rps 20 --duration 60
+    python -m bench.loadtest --rps 50 --mix search=10,download=5,pipeline=1 \\
+        --gemini-latency-ms 1500 --gemini-error-rate 0.05 --output load.json
+    python -m bench.loadtest --base-url http://127.0.0.1:8001   # drive a running server
+
+Each run uses a fresh database (loadtest_<timestamp>) unless --db-name is given.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+from PIL import Image, ImageDraw
+
+from bench import synthetic
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+DEFAULT_MIX = "search=8,featured=4,list=2,city=4,download=6,upload=1,pipeline=1"
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def skyline_photo(width: int = 1280, height: int = 720, seed: int = 0) -> bytes:
+    """A JPEG of dark rectangles on a light sky, standing in for a city photo"""
+    rng = random.Random(seed)
+    img = Image.new("RGB", (width, height), (200, 220, 240))
+    draw = ImageDraw.Draw(img)
+    x = 0
+    while x < width:
+        w = rng.randint(40, 140)
+        draw.rectangle([x, rng.randint(height // 5, height - 80), x + w, height], fill=(60, 60, 70))
+        x += w + rng.randint(0, 30)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, route: str, seconds: float, ok: bool):
+        self.latencies[route].append(seconds)
+        if not ok:
+            self.errors[route] += 1
+
+    def report(self, elapsed: float) -> dict:
+        routes = {}
+        for route, values in sorted(self.latencies.items()):
+            values.sort()
+            routes[route] = {
+                "count": len(values),
+                "errors": self.errors[route],
+                "throughput_rps": round(len(values) / elapsed, 2),
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+                "max_ms": round(values[-1] * 1000, 1),
+            }
+        total = sum(r["count"] for r in routes.values())
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0,
+            "routes": routes,
+        }
+
+
+class Workload:
+    """The request mix; every scenario records its own route names"""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, style_id: str, seed: int = 0):
+        self.client = client
+        self.recorder = recorder
+        self.style_id = style_id
+        self.rng = random.Random(seed)
+        self.city_ids = []
+        self.city_names = []
+        self.photo = skyline_photo()
+
+    async def call(self, route: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        ok = False
+        response = None
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            pass
+        self.recorder.add(route, time.perf_counter() - started, ok)
+        return response if ok else None
+
+    async def upload(self):
+        name = f"Loadtown {self.rng.randint(0, 10**6)}"
+        r = await self.call(
+            "POST /cities/upload", "POST", "/api/cities/upload",
+            files={"file": ("city.jpg", self.photo, "image/jpeg")},
+            data={"city_name": name, "style_id": self.style_id},
+        )
+        return r.json()["id"] if r else None
+
+    async def pipeline(self):
+        started = time.perf_counter()
+        city_id = await self.upload()
+        ok = bool(city_id)
+        if ok:
+            ok = await self.call("POST /process/stage1", "POST", f"/api/process/stage1/{city_id}") is not None
+        if ok:
+            ok = await self.call("POST /process/spacing", "POST", f"/api/process/spacing/{city_id}",
+                                 json={"expansion_percentage": self.rng.choice((0, 25, 50, 100))}) is not None
+        if ok:
+            ok = await self.call("POST /process/stage2", "POST", f"/api/process/stage2/{city_id}") is not None
+        self.recorder.add("pipeline (end-to-end)", time.perf_counter() - started, ok)
+        if ok:
+            self.city_ids.append(city_id)
+
+    async def search(self):
+        q = self.rng.choice(self.city_names or ["Loadtown"]).split()[0] if self.rng.random() < 0.8 else "Atlantis"
+        await self.call("GET /cities/search", "GET", "/api/cities/search", params={"q": q})
+
+    async def featured(self):
+        await self.call("GET /featured", "GET", "/api/featured")
+
+    async def list(self):
+        await self.call("GET /cities", "GET", "/api/cities")
+
+    async def city(self):
+        if self.city_ids:
+            await self.call("GET /cities/{id}", "GET", f"/api/cities/{self.rng.choice(self.city_ids)}")
+
+    async def download(self):
+        if self.city_ids:
+            layer = self.rng.randint(1, 3)
+            await self.call("GET /cities/{id}/layer/{n}", "GET",
+                            f"/api/cities/{self.rng.choice(self.city_ids)}/layer/{layer}")
+
+
+def parse_mix(spec: str) -> list:
+    mix = []
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+
+async def seed(client: httpx.AsyncClient, workload: Workload, cities: int):
+    """Configure a Gemini key, upload a style and push a few cities through the pipeline"""
+    await client.post("/api/settings", json={"gemini_api_key": "loadtest"})
+    r = await client.post(
+        "/api/styles",
+        files={"file": ("style.pdf", synthetic.style_pdf(200), "application/pdf")},
+        data={"name": "Load Test Style", "description": "synthetic"},
+    )
+    r.raise_for_status()
+    workload.style_id = r.json()["id"]
+    await asyncio.gather(*(workload.pipeline() for _ in range(cities)))
+    cities_list = (await client.get("/api/cities")).json()
+    workload.city_names = [c["city_name"] for c in cities_list]
+    workload.city_ids = [c["id"] for c in cities_list]
+
+
+async def drive(workload: Workload, mix: list, rps: float, duration: float, max_in_flight: int) -> float:
+    """Open-loop arrivals at a fixed rate; returns elapsed seconds"""
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    in_flight = set()
+    interval = 1 / rps
+    started = time.perf_counter()
+    next_at = started
+    dropped = 0
+    while time.perf_counter() - started < duration:
+        now = time.perf_counter()
+        if now < next_at:
+            await asyncio.sleep(next_at - now)
+        next_at += interval
+        if len(in_flight) >= max_in_flight:
+            dropped += 1
+            continue
+        scenario = getattr(workload, workload.rng.choices(names, weights)[0])
+        task = asyncio.create_task(scenario())
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.wait(in_flight)
+    if dropped:
+        print(f"warning: {dropped} arrivals skipped, {max_in_flight} requests already in flight")
+    return time.perf_counter() - started
+
+
+def print_report(report: dict):
+    print(f"\n{report['requests']} requests in {report['elapsed_s']} s = {report['throughput_rps']} req/s\n")
+    print(f"{'route':<32}{'count':>7}{'err':>6}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for route, r in report["routes"].items():
+        print(f"{route:<32}{r['count']:>7}{r['errors']:>6}{r['throughput_rps']:>8}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}")
+
+
+def wait_for(url: str, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def start_services(args) -> list:
+    """Launch the stub Gemini server and the API; returns the processes"""
+    gemini = subprocess.Popen([
+        sys.executable, "-m", "bench.fake_gemini",
+        "--port", str(args.gemini_port),
+        "--latency-ms", str(args.gemini_latency_ms),
+        "--latency-sigma", str(args.gemini_latency_sigma),
+        "--error-rate", str(args.gemini_error_rate),
+        "--svg-elements", str(args.gemini_svg_elements),
+    ], cwd=BACKEND_DIR)
+    env = dict(
+        os.environ,
+        MONGO_URL=args.mongo_url,
+        DB_NAME=args.db_name,
+        GEMINI_BASE_URL=f"http://127.0.0.1:{args.gemini_port}",
+        GC_INTERVAL_SECONDS="0",
+        RATE_LIMIT_ENABLED="0",  # one client IP drives all the load
+    )
+    api = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "server:app",
+        "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning",
+    ], cwd=BACKEND_DIR, env=env)
+    procs = [gemini, api]
+    try:
+        wait_for(f"http://127.0.0.1:{args.gemini_port}/stats")
+        wait_for(f"http://127.0.0.1:{args.port}/api/health")
+    except Exception:
+        stop_services(procs)
+        raise
+    return procs
+
+
+def stop_services(procs: list):
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+async def run(args) -> dict:
+    recorder = Recorder()
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout,
+                                 limits=httpx.Limits(max_connections=args.max_in_flight)) as client:
+        workload = Workload(client, recorder, style_id="", seed=args.seed)
+        print(f"Seeding {args.seed_cities} cities...")
+        await seed(client, workload, args.seed_cities)
+        recorder.latencies.clear()
+        recorder.errors.clear()
+        print(f"Driving {args.rps} req/s for {args.duration} s: {args.mix}")
+        elapsed = await drive(workload, parse_mix(args.mix), args.rps, args.duration, args.max_in_flight)
+    return recorder.report(elapsed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test with a stub Gemini server")
+    parser.add_argument("--rps", type=float, default=20)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario=weight,... " + DEFAULT_MIX)
+    parser.add_argument("--seed-cities", type=int, default=3)
+    parser.add_argument("--max-in-flight", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--base-url", help="drive an already running API instead of starting one")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default=f"loadtest_{int(time.time())}")
+    parser.add_argument("--gemini-port", type=int, default=8900)
+    parser.add_argument("--gemini-latency-ms", type=float, default=500)
+    parser.add_argument("--gemini-latency-sigma", type=float, default=0.5)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-svg-elements", type=int, default=500)
+    parser.add_argument("--output", help="write the report JSON here")
+    args = parser.parse_args(argv)
+
+    procs = []
+    if not args.base_url:
+        procs = start_services(args)
+        args.base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        stop_services(procs)
+
+    report["config"] = {k: v for k, v in vars(args).items()}
+    report["created_at"] = datetime.now(timezone.utc).isoformat()
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\nWrote {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Cold-start benchmark for the API module.
+
+Imports `server` in a fresh interpreter under `python -X importtime`,
+with lazy imports on and off (LAZY_IMPORTS=1 / 0), and reports the wall
+time (median of --runs) plus the top-level modules that cost the most.
+
+Usage (from backend/):
+    python -m bench.startup
+    python -m bench.startup --runs 10 --top 15 --output startup.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# "import time:      self [us] |  cumulative | imported package"
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_importtime(stderr: str) -> list:
+    """Modules at depth 0 and 1 (server and what it imports) as (name, cumulative ms)"""
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, name = match.groups()
+        # One leading space is the separator; nested imports indent by two
+        if (len(indent) - 1) // 2 <= 1:
+            modules.append((name, int(cumulative) / 1000))
+    return modules
+
+
+def run_once(lazy: bool) -> tuple:
+    env = {
+        **os.environ,
+        "LAZY_IMPORTS": "1" if lazy else "0",
+        "MONGO_URL": os.environ.get("MONGO_URL", "mongodb://localhost:27017"),
+        "DB_NAME": os.environ.get("DB_NAME", "bench"),
+    }
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"import server failed:\n{result.stderr[-2000:]}")
+    return elapsed, parse_importtime(result.stderr)
+
+
+def measure(lazy: bool, runs: int, top: int) -> dict:
+    walls, modules = [], None
+    for _ in range(runs):
+        elapsed, modules = run_once(lazy)
+        walls.append(elapsed)
+    modules.sort(key=lambda m: m[1], reverse=True)
+    return {
+        "lazy": lazy,
+        "runs": runs,
+        "wall_median_ms": round(statistics.median(walls) * 1000, 1),
+        "wall_min_ms": round(min(walls) * 1000, 1),
+        "top_modules": [{"module": name, "cumulative_ms": round(ms, 1)} for name, ms in modules[:top]],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure API import time with and without lazy imports")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="number of top-level modules to list")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = [measure(lazy, args.runs, args.top) for lazy in (False, True)]
+    for result in results:
+        label = "lazy" if result["lazy"] else "eager"
+        print(f"\n{label}: median {result['wall_median_ms']} ms, min {result['wall_min_ms']} ms ({result['runs']} runs)")
+        for module in result["top_modules"]:
+            print(f"  {module['cumulative_ms']:>9.1f} ms  {module['module']}")
+    eager, lazy = results
+    print(f"\nlazy / eager: {lazy['wall_median_ms'] / eager['wall_median_ms']:.2f}x")
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Deterministic synthetic inputs for benchmarks and load tests.
+
+Skylines mimic what Gemini returns for Stage 1: a row of buildings drawn
+as black-stroke paths with window details, a few <rect> elements and a
+translated group, using a mix of absolute, relative, curve and arc
+commands. PDFs are minimal hand-written documents with text and vector
+drawing operators, so no PDF library is needed to produce them.
+"""
+import json
+import random
+import zlib
+
+SVG_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+
+def skyline_svg(elements: int, width: int = 1920, height: int = 1080, seed: int = 0) -> str:
+    """A skyline SVG with roughly `elements` drawable elements"""
+    rng = random.Random(seed)
+    buildings = max(1, elements // 6)
+    slot = width / buildings
+    ground = height - 40
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" width="{width}" height="{height}">'
+    ]
+    count = 0
+    for b in range(buildings):
+        x0 = b * slot + rng.uniform(0, slot * 0.15)
+        w = slot * rng.uniform(0.5, 0.8)
+        top = ground - rng.uniform(0.15, 0.85) * (ground - 40)
+        stroke = f'stroke="#000000" fill="none" stroke-width="{rng.choice((1, 1.5, 2))}"'
+        if b % 3 == 0:
+            # Absolute outline with an arched roof
+            parts.append(
+                f'<path d="M{x0:.2f} {ground:.2f} L{x0:.2f} {top:.2f} '
+                f'A{w / 2:.2f} {w / 4:.2f} 0 0 1 {x0 + w:.2f} {top:.2f} L{x0 + w:.2f} {ground:.2f}" {stroke}/>'
+            )
+        elif b % 3 == 1:
+            # Relative outline with a curved spire
+            parts.append(
+                f'<path d="m{x0:.2f},{ground:.2f} v{top - ground:.2f} '
+                f'c{w * 0.2:.2f},-{w * 0.6:.2f} {w * 0.8:.2f},-{w * 0.6:.2f} {w:.2f},0 v{ground - top:.2f} z" {stroke}/>'
+            )
+        else:
+            parts.append(
+                f'<rect x="{x0:.2f}" y="{top:.2f}" width="{w:.2f}" height="{ground - top:.2f}" {stroke}/>'
+            )
+        count += 1
+        # Windows: short horizontal/vertical strokes, some inside a translated group
+        windows = []
+        for i in range(5):
+            if count >= elements:
+                break
+            wy = top + (i + 1) * (ground - top) / 7
+            windows.append(f'<path d="M{x0 + w * 0.2:.2f} {wy:.2f} H{x0 + w * 0.8:.2f}" {stroke}/>')
+            count += 1
+        if b % 4 == 0 and windows:
+            parts.append(f'<g transform="translate({rng.uniform(-2, 2):.2f},0)">{"".join(windows)}</g>')
+        else:
+            parts.extend(windows)
+        if count >= elements:
+            break
+    parts.append(f'<path d="M0 {ground} L{width} {ground}" stroke="#000000" fill="none"/>')
+    parts.append("</svg>")
+    return SVG_HEADER + "\n".join(parts)
+
+
+def stage1_response(svg: str) -> str:
+    """Stage 1 response the way Gemini tends to format it"""
+    return f"Here is your SVG:\n```svg\n{svg}\n```\n"
+
+
+def stage2_response(svg: str) -> str:
+    """Stage 2 JSON response wrapped in a markdown fence"""
+    body = json.dumps({"layer_1": svg, "layer_2": svg, "layer_3": svg})
+    return f"```json\n{body}\n```"
+
+
+def style_pdf(elements: int, pages: int = 10, seed: int = 0) -> bytes:
+    """A PDF with `elements` text lines and line/curve drawing operators across `pages`"""
+    rng = random.Random(seed)
+    per_page = max(1, elements // pages)
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")  # filled in once the page tree exists
+    pages_obj = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for p in range(pages):
+        ops = [b"BT /F1 9 Tf 11 TL 36 806 Td"]
+        for i in range(per_page // 2):
+            ops.append(f"(Style rule {p}.{i}: line weight {rng.randint(1, 5)} pt, hatch {rng.randint(0, 90)} deg) '".encode())
+        ops.append(b"ET 0.5 w")
+        for _ in range(per_page - per_page // 2):
+            x, y = rng.uniform(36, 560), rng.uniform(36, 800)
+            ops.append(
+                f"{x:.1f} {y:.1f} m {x + 20:.1f} {y + 10:.1f} {x + 30:.1f} {y - 10:.1f} {x + 40:.1f} {y:.1f} c S".encode()
+            )
+        stream = zlib.compress(b"\n".join(ops))
+        content = add(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_obj, font, content)
+        ))
+    kids = b" ".join(b"%d 0 R" % pid for pid in page_ids)
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_obj
+    objects[pages_obj - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out)
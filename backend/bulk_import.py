@@ -0,0 +1,330 @@
+"""
+Bulk import of city photos, driven through the pipeline.
+
+Takes a directory of photos (or a manifest) and a style. Photos are copied
+into the upload directory by a bounded pool of worker threads (hashed for
+duplicate detection on the way, as on upload; photos of the same batch
+are also checked against each other). Their queue documents are
+inserted in batches, and every item is run through the auto pipeline
+(Stage 1 -> spacing -> Stage 2) in this process, at most --concurrency at
+a time.
+
+Progress is kept in a JSON checkpoint. Run the same command again after an
+interruption and it carries on: copied photos are not copied again, and
+items resume from their queue status. Queue ids are derived from the style
+and the source file, so even a lost checkpoint doesn't duplicate items. The
+items are marked auto_pipeline, so a running API server also picks them up
+if this process stops.
+
+Manifests are CSV (header: path,city_name[,expansion_percentage]) or JSON
+lines with the same keys; relative paths are resolved against the
+manifest's directory. Without a manifest the city name comes from the file
+name ("new_york-2.jpg" -> "New York 2").
+
+Usage (from backend/, with the API's .env):
+    python -m bulk_import photos/ --style "Art Deco"
+    python -m bulk_import region.csv --style 5f0c... --concurrency 4 --copy-workers 16
+    python -m bulk_import photos/ --style "Art Deco" --import-only
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import re
+import sys
+import time
+import uuid
+from pathlib import Path
+
+PHOTO_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+CHECKPOINT_NAME = ".bulk_import_checkpoint.json"
+ID_NAMESPACE = uuid.UUID("0d5c3c4e-58a4-4d0e-9a53-2f4b6c1e7a10")
+PROGRESS_INTERVAL_SECONDS = 10
+POLL_SECONDS = 5
+
+logger = logging.getLogger("bulk_import")
+
+
+def city_name_from_path(path: Path) -> str:
+    return re.sub(r"[_\-\s]+", " ", path.stem).strip().title()
+
+
+def read_sources(source: Path, recursive: bool) -> list:
+    """[{path, city_name, expansion_percentage}] from a directory or a manifest"""
+    if source.is_dir():
+        pattern = "**/*" if recursive else "*"
+        paths = sorted(p for p in source.glob(pattern) if p.is_file() and p.suffix.lower() in PHOTO_EXTENSIONS)
+        return [{"path": p.resolve(), "city_name": city_name_from_path(p), "expansion_percentage": None} for p in paths]
+
+    with open(source, newline="") as f:
+        if source.suffix.lower() == ".csv":
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    entries = []
+    for row in rows:
+        path = Path(row["path"])
+        if not path.is_absolute():
+            path = source.parent / path
+        percentage = row.get("expansion_percentage")
+        entries.append({
+            "path": path.resolve(),
+            "city_name": (row.get("city_name") or "").strip() or city_name_from_path(path),
+            "expansion_percentage": int(percentage) if percentage not in (None, "") else None,
+        })
+    return entries
+
+
+class Checkpoint:
+    """Per-source progress, rewritten atomically after every change"""
+
+    def __init__(self, path: Path, style_id: str):
+        self.path = path
+        self.style_id = style_id
+        self.items = {}  # source path -> {id, city_name, status, error?}
+        if path.exists():
+            data = json.loads(path.read_text())
+            if data.get("style_id") != style_id:
+                raise SystemExit(f"{path} belongs to an import with style {data.get('style_id')}; use --checkpoint")
+            self.items = data["items"]
+
+    def update(self, source: str, **fields):
+        self.items.setdefault(source, {}).update(fields)
+        self.save()
+
+    def save(self):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({"style_id": self.style_id, "items": self.items}, indent=1))
+        os.replace(tmp, self.path)
+
+    def count(self, *statuses) -> int:
+        return sum(1 for item in self.items.values() if item.get("status") in statuses)
+
+
+class Progress:
+    """Throughput and ETA for one phase"""
+
+    def __init__(self, label: str, total: int):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self._last_print = 0.0
+
+    def step(self, ok: bool = True):
+        self.done += 1
+        self.failed += not ok
+        now = time.monotonic()
+        if now - self._last_print >= PROGRESS_INTERVAL_SECONDS or self.done == self.total:
+            self._last_print = now
+            print(self.line(), file=sys.stderr, flush=True)
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def line(self) -> str:
+        rate = self.rate()
+        remaining = self.total - self.done
+        eta = format_duration(remaining / rate) if rate and remaining else "-"
+        failed = f", {self.failed} failed" if self.failed else ""
+        return f"[{self.label}] {self.done}/{self.total}{failed} - {rate * 60:.1f}/min, ETA {eta}"
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def copy_photo(server, source: Path, dest: Path) -> tuple:
+    """Copy one photo (atomically) and hash it; returns (bytes, photo hash or None)"""
+    data = source.read_bytes()
+    if len(data) > server.MAX_PHOTO_BYTES:
+        raise ValueError(f"{len(data)} bytes is over the {server.MAX_PHOTO_BYTES // (1024 * 1024)}MB upload limit")
+    tmp = dest.with_name(dest.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, dest)
+    try:
+        content_hash = server.photo_hash.dhash(data)
+    except Exception as e:
+        logger.warning(f"Could not hash {source}: {e}")
+        content_hash = None
+    return len(data), content_hash
+
+
+async def find_style(db, style: str) -> dict:
+    doc = await db.styles.find_one({"id": style}, {"_id": 0}) or await db.styles.find_one({"name": style}, {"_id": 0})
+    if not doc:
+        raise SystemExit(f"Style not found: {style}")
+    return doc
+
+
+def batch_duplicates(server, batch_index, batch_docs: dict, content_hash: str) -> list:
+    """
+    Photos earlier in the same batch within DUPLICATE_MAX_DISTANCE bits, in
+    server.find_duplicates' shape: they are not in Mongo (nor the server's
+    index) until the batch is written.
+    """
+    duplicates = []
+    for bits, city_id in batch_index.find(content_hash, server.DUPLICATE_MAX_DISTANCE):
+        doc = batch_docs[city_id]
+        duplicates.append({
+            "id": city_id, "city_name": doc["city_name"], "style_id": doc["style_id"],
+            "style_name": doc["style_name"], "status": doc["status"], "processed": False,
+            "same_style": True, "distance": bits,
+        })
+    return duplicates
+
+
+async def import_photos(server, entries: list, style: dict, expansion_percentage: int,
+                        checkpoint: Checkpoint, copy_workers: int, batch_size: int) -> dict:
+    """Copy new photos and insert their queue documents; returns {source: city id} of imported items"""
+    from pymongo import UpdateOne
+
+    pending = [e for e in entries if checkpoint.items.get(str(e["path"]), {}).get("status") in (None, "copy_failed")]
+    progress = Progress("copy", len(pending))
+    copied_bytes = 0
+    slots = asyncio.Semaphore(copy_workers)
+
+    async def copy_one(entry):
+        nonlocal copied_bytes
+        source = entry["path"]
+        stat = source.stat()
+        city_id = str(uuid.uuid5(ID_NAMESPACE, f"{style['id']}:{source}:{stat.st_size}:{stat.st_mtime_ns}"))
+        dest = server.UPLOAD_DIR / "cities" / f"{city_id}{source.suffix.lower()}"
+        async with slots:
+            try:
+                size, content_hash = await asyncio.to_thread(copy_photo, server, source, dest)
+            except Exception as e:
+                checkpoint.update(str(source), id=city_id, city_name=entry["city_name"], status="copy_failed", error=str(e))
+                progress.step(ok=False)
+                return None
+        copied_bytes += size
+        progress.step()
+        return entry, city_id, dest, content_hash
+
+    copied = [c for c in await asyncio.gather(*[copy_one(e) for e in pending]) if c]
+
+    # Queue documents in batches; upserts keyed by the derived id make a re-run harmless
+    for start in range(0, len(copied), batch_size):
+        batch = copied[start:start + batch_size]
+        operations = []
+        batch_index, batch_docs = server.photo_hash.PhotoIndex(server.DUPLICATE_MAX_DISTANCE), {}
+        for entry, city_id, dest, content_hash in batch:
+            duplicates = []
+            if content_hash and server.DUPLICATE_MAX_DISTANCE >= 0:
+                duplicates = await server.find_duplicates(content_hash, style["id"])
+                duplicates = sorted(duplicates + batch_duplicates(server, batch_index, batch_docs, content_hash),
+                                    key=lambda d: d["distance"])[:20]
+            auto_pipeline = {
+                "expansion_percentage": entry["expansion_percentage"] if entry["expansion_percentage"] is not None else expansion_percentage,
+                "review": False,
+            }
+            doc = server.new_queue_doc(city_id, entry["city_name"], style, dest, auto_pipeline, content_hash, duplicates)
+            if content_hash:
+                batch_index.add(content_hash, city_id)
+                batch_docs[city_id] = doc
+            operations.append(UpdateOne({"id": city_id}, {"$setOnInsert": doc}, upsert=True))
+        await server.db.queue.bulk_write(operations, ordered=False)
+        for entry, city_id, dest, content_hash in batch:
+            if content_hash and server.photo_index is not None:
+                server.photo_index.add(content_hash, city_id)
+            checkpoint.update(str(entry["path"]), id=city_id, city_name=entry["city_name"], status="queued", error=None)
+
+    elapsed = time.monotonic() - progress.started
+    if copied:
+        print(f"Copied {len(copied)} photos ({copied_bytes / 1e6:.1f} MB) in {elapsed:.1f}s "
+              f"- {len(copied) / elapsed:.1f} photos/s, {copied_bytes / 1e6 / elapsed:.1f} MB/s", file=sys.stderr)
+    return {source: item["id"] for source, item in checkpoint.items.items() if item.get("status") == "queued"}
+
+
+async def run_pipeline(server, items: dict, checkpoint: Checkpoint, concurrency: int):
+    """Drive each queued item to done/error through the auto pipeline"""
+    import job_leases
+
+    progress = Progress("pipeline", len(items))
+    slots = asyncio.Semaphore(concurrency)
+    # Items a killed earlier run left mid-stage become retryable once their lease runs out
+    await job_leases.reap_expired_leases(server.db, server.JOB_LEASE_SECONDS)
+
+    async def drive(source: str, city_id: str):
+        async with slots:
+            while True:
+                await server.run_auto_pipeline(city_id)
+                item = await server.db.queue.find_one({"id": city_id}, {"_id": 0, "status": 1, "error_message": 1})
+                status = item["status"] if item else "missing"
+                if status not in job_leases.IN_FLIGHT_STATUSES:
+                    break
+                # Held by another worker (or a dead one whose lease hasn't expired yet)
+                await asyncio.sleep(POLL_SECONDS)
+                await job_leases.reap_expired_leases(server.db, server.JOB_LEASE_SECONDS)
+        error = item.get("error_message") if item and status != "done" else None
+        checkpoint.update(source, status=status if status in ("done", "error", "missing") else "queued", error=error)
+        progress.step(ok=status == "done")
+
+    await asyncio.gather(*[drive(source, city_id) for source, city_id in items.items()])
+    return progress
+
+
+async def run(args) -> int:
+    # The in-process pipeline runs at most --concurrency items at once
+    os.environ["AUTO_PIPELINE_CONCURRENCY"] = str(args.concurrency)
+    import server
+
+    if not args.verbose:
+        logging.getLogger("server").setLevel(logging.WARNING)
+    source = Path(args.source)
+    entries = read_sources(source, args.recursive)
+    if not entries:
+        print(f"No photos found in {source}", file=sys.stderr)
+        return 1
+
+    style = await find_style(server.db, args.style)
+    expansion_percentage = args.expansion_percentage
+    if expansion_percentage is None:
+        expansion_percentage = style.get("auto_expansion_percentage") or 0
+    checkpoint_path = Path(args.checkpoint) if args.checkpoint else (
+        source if source.is_dir() else source.parent) / CHECKPOINT_NAME
+    checkpoint = Checkpoint(checkpoint_path, style["id"])
+    (server.UPLOAD_DIR / "cities").mkdir(parents=True, exist_ok=True)
+
+    started = time.monotonic()
+    print(f"{len(entries)} photos, style {style['name']}, checkpoint {checkpoint_path} "
+          f"({checkpoint.count('done')} done, {checkpoint.count('queued')} queued)", file=sys.stderr)
+    queued = await import_photos(server, entries, style, expansion_percentage, checkpoint, args.copy_workers, args.batch_size)
+    if not args.import_only and queued:
+        progress = await run_pipeline(server, queued, checkpoint, args.concurrency)
+        print(f"Pipeline: {progress.done - progress.failed} done, {progress.failed} failed in "
+              f"{format_duration(time.monotonic() - progress.started)} ({progress.rate() * 60:.1f} cities/min)", file=sys.stderr)
+
+    failed = {source: item for source, item in checkpoint.items.items() if item.get("status") in ("error", "copy_failed", "missing")}
+    for source, item in failed.items():
+        print(f"  {item['status']}: {source} ({item.get('id')}): {item.get('error')}", file=sys.stderr)
+    print(f"Total: {checkpoint.count('done')} done, {checkpoint.count('queued')} queued, {len(failed)} failed "
+          f"of {len(entries)} in {format_duration(time.monotonic() - started)}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a directory or manifest of city photos and run the pipeline")
+    parser.add_argument("source", help="directory of photos, or a .csv / .jsonl manifest")
+    parser.add_argument("--style", required=True, help="style id or name")
+    parser.add_argument("--expansion-percentage", type=int, help="spacing for all items (default: the style's auto %%, else 0)")
+    parser.add_argument("--recursive", action="store_true", help="include subdirectories")
+    parser.add_argument("--copy-workers", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=200, help="queue documents per bulk write")
+    parser.add_argument("--concurrency", type=int, default=2, help="items in the pipeline at once")
+    parser.add_argument("--checkpoint", help=f"checkpoint file (default: {CHECKPOINT_NAME} next to the photos)")
+    parser.add_argument("--import-only", action="store_true", help="queue the photos but leave processing to the API server")
+    parser.add_argument("--verbose", action="store_true", help="show the server's info logs")
+    args = parser.parse_args(argv)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
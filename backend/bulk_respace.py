@@ -0,0 +1,232 @@
+"""
+Bulk re-spacing of processed cities.
+
+Re-applies one expansion_percentage to every processed city matching a
+filter (styles, processed_at range, ids). The spacing itself
+(server.build_spaced: load the Stage 1 geometry, expand, serialise, write
+the spaced SVG and .npz atomically) runs in a pool of worker processes,
+one per core by default, so throughput grows with the core count; this
+process only selects the cities, claims each queue item (as the API's
+spacing endpoint does, so no pipeline stage touches the spaced files while
+they are rewritten) and records the result on it. Spacings built before
+for a city are restored from the build cache instead of recomputed.
+
+Re-spaced cities go back to `spacing_applied`, their published layers
+unchanged until Stage 2 runs. --stage2 runs it here (at most --concurrency
+at a time); layers already separated for this spacing are restored
+without a Gemini call. Without --stage2, cities from the auto pipeline are
+held for review, so the API server does not republish them on its own.
+
+Usage (from backend/, with the API's .env):
+    python -m bulk_respace --expansion-percentage 40 --style "Art Deco" --dry-run
+    python -m bulk_respace --expansion-percentage 40 --since 2026-01-01 --until 2026-03-31 --stage2
+    python -m bulk_respace --expansion-percentage 25 --ids 5f0c...,9a1b... --workers 4
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from bulk_import import Progress, find_style, format_duration
+
+QUEUE_FIELDS = {
+    "_id": 0, "id": 1, "city_name": 1, "status": 1, "expansion_percentage": 1,
+    "stage1_svg_path": 1, "stage1_geometry_path": 1, "auto_pipeline": 1,
+}
+
+
+def parse_when(value: str, end: bool = False) -> str:
+    """ISO date or datetime -> processed_at bound (UTC); a bare end date includes that whole day"""
+    when = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        when += timedelta(days=1)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.astimezone(timezone.utc).isoformat()
+
+
+def read_ids(args) -> list:
+    ids = [i.strip() for i in (args.ids or "").split(",") if i.strip()]
+    if args.ids_file:
+        ids += [line.strip() for line in Path(args.ids_file).read_text().splitlines() if line.strip()]
+    return ids
+
+
+async def city_filter(db, args) -> dict:
+    """Mongo filter on `processed` for the command-line selection"""
+    query = {}
+    if args.style:
+        query["style_id"] = {"$in": [(await find_style(db, style))["id"] for style in args.style]}
+    if args.since or args.until:
+        query["processed_at"] = {}
+        if args.since:
+            query["processed_at"]["$gte"] = parse_when(args.since)
+        if args.until:
+            query["processed_at"]["$lt"] = parse_when(args.until, end=True)
+    ids = read_ids(args)
+    if ids:
+        query["id"] = {"$in": ids}
+    return query
+
+
+async def select_items(server, query: dict, expansion_percentage: int, force: bool) -> tuple:
+    """(queue items to re-space, {city id: reason} left out)"""
+    import job_leases
+
+    ids = [doc["id"] async for doc in server.db.processed.find(query, {"_id": 0, "id": 1}).sort("processed_at", 1)]
+    items = {item["id"]: item async for item in server.db.queue.find({"id": {"$in": ids}}, QUEUE_FIELDS)}
+    selected, skipped = [], {}
+    for city_id in ids:
+        item = items.get(city_id)
+        if not item or not item.get("stage1_svg_path"):
+            skipped[city_id] = "no Stage 1 drawing on record"
+        elif item["status"] in job_leases.IN_FLIGHT_STATUSES:
+            skipped[city_id] = f"busy ({item['status']})"
+        elif item["status"] == "done" and item.get("expansion_percentage") == expansion_percentage and not force:
+            skipped[city_id] = f"already at {expansion_percentage}%"
+        else:
+            selected.append(item)
+    return selected, skipped
+
+
+async def respace_all(server, items: list, expansion_percentage: int, workers: int, force: bool,
+                      stage2: bool = False) -> tuple:
+    """
+    Spacing for every item across a process pool; returns ({id: "built"/"restored"}, {id: error}, progress).
+    Auto items are held for review unless `stage2` republishes them here.
+    """
+    import job_leases
+
+    loop = asyncio.get_running_loop()
+    progress = Progress("respace", len(items))
+    done, errors = {}, {}
+    # Keep every worker busy without pickling the whole selection up front
+    slots = asyncio.Semaphore(workers * 2)
+    # Spawned workers: forking a process that runs the Mongo client's threads is unsafe
+    context = multiprocessing.get_context("spawn")
+
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        async def respace(item):
+            city_id = item["id"]
+            async with slots:
+                # Claimed before the worker writes anything, so a stage started meanwhile keeps its files
+                if not await server.claim_spacing(city_id, item):
+                    errors[city_id] = "busy (a pipeline stage started on this city)"
+                    progress.step(ok=False)
+                    return
+                heartbeat = job_leases.start_heartbeat(server.db, city_id, server.JOB_LEASE_SECONDS)
+                try:
+                    build, fields, restored = await loop.run_in_executor(
+                        pool, server.build_spaced, city_id, item, expansion_percentage, force
+                    )
+                    suspend_auto = bool(item.get("auto_pipeline")) and not stage2
+                    result = await server.db.queue.update_one(
+                        job_leases.owned(city_id),
+                        {"$set": server.spacing_updates(city_id, expansion_percentage, build, fields, suspend_auto)}
+                    )
+                    if not result.matched_count:
+                        raise RuntimeError("lost the lease on this city while re-spacing")
+                except Exception as e:
+                    errors[city_id] = f"{type(e).__name__}: {e}"
+                    await server.release_spacing(city_id, item["status"], errors[city_id])
+                    progress.step(ok=False)
+                    return
+                finally:
+                    heartbeat.cancel()
+            done[city_id] = "restored" if restored else "built"
+            progress.step()
+
+        await asyncio.gather(*[respace(item) for item in items])
+    return done, errors, progress
+
+
+async def run_stage2(server, city_ids: list, concurrency: int) -> tuple:
+    """Stage 2 for re-spaced cities; returns ({id: "built"/"restored"}, {id: error})"""
+    from fastapi import HTTPException
+
+    progress = Progress("stage2", len(city_ids))
+    slots = asyncio.Semaphore(concurrency)
+    done, errors = {}, {}
+
+    async def separate(city_id):
+        async with slots:
+            try:
+                result = await server.process_stage2(city_id, idempotency_key=None)
+            except HTTPException as e:
+                errors[city_id] = e.detail
+                progress.step(ok=False)
+                return
+        done[city_id] = result["build"]
+        progress.step()
+
+    await asyncio.gather(*[separate(city_id) for city_id in city_ids])
+    return done, errors
+
+
+async def run(args) -> int:
+    import server
+
+    if not args.verbose:
+        logging.getLogger("server").setLevel(logging.WARNING)
+    query = await city_filter(server.db, args)
+    if not query and not args.all:
+        print("Select cities with --style, --since/--until or --ids (or pass --all)", file=sys.stderr)
+        return 2
+
+    items, skipped = await select_items(server, query, args.expansion_percentage, args.force)
+    print(f"{len(items)} cities to re-space to {args.expansion_percentage}%, {len(skipped)} skipped", file=sys.stderr)
+    for city_id, reason in skipped.items():
+        print(f"  skipped {city_id}: {reason}", file=sys.stderr)
+    if args.dry_run or not items:
+        for item in items:
+            print(f"  {item['id']} {item['city_name']} ({item.get('expansion_percentage')}% -> {args.expansion_percentage}%)")
+        return 0
+
+    done, errors, progress = await respace_all(
+        server, items, args.expansion_percentage, args.workers, args.force, args.stage2
+    )
+    elapsed = time.monotonic() - progress.started
+    restored = sum(1 for how in done.values() if how == "restored")
+    print(f"Re-spaced {len(done)} cities ({restored} from the build cache) in {format_duration(elapsed)} "
+          f"with {args.workers} workers - {progress.rate():.1f} cities/s", file=sys.stderr)
+
+    if args.stage2 and done:
+        separated, stage2_errors = await run_stage2(server, list(done), args.concurrency)
+        restored = sum(1 for how in separated.values() if how == "restored")
+        print(f"Stage 2: {len(separated)} done ({restored} from the build cache), {len(stage2_errors)} failed", file=sys.stderr)
+        errors.update({city_id: f"stage2: {error}" for city_id, error in stage2_errors.items()})
+
+    for city_id, error in errors.items():
+        print(f"  error {city_id}: {error}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-apply a spacing percentage to processed cities")
+    parser.add_argument("--expansion-percentage", type=int, required=True, help="target spacing (0-200)")
+    parser.add_argument("--style", action="append", help="style id or name (repeatable)")
+    parser.add_argument("--since", help="processed on or after this ISO date/datetime")
+    parser.add_argument("--until", help="processed before this ISO datetime (a bare date includes that day)")
+    parser.add_argument("--ids", help="comma-separated city ids")
+    parser.add_argument("--ids-file", help="file with one city id per line")
+    parser.add_argument("--all", action="store_true", help="every processed city (when no filter is given)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="spacing processes (default: one per core)")
+    parser.add_argument("--force", action="store_true", help="recompute even if cached or already at this spacing")
+    parser.add_argument("--stage2", action="store_true", help="also run Stage 2 so the published layers follow")
+    parser.add_argument("--concurrency", type=int, default=2, help="Stage 2 jobs at once (with --stage2)")
+    parser.add_argument("--dry-run", action="store_true", help="list the selected cities and exit")
+    parser.add_argument("--verbose", action="store_true", help="show the server's info logs")
+    args = parser.parse_args(argv)
+    if not 0 <= args.expansion_percentage <= 200:
+        parser.error("--expansion-percentage must be between 0 and 200")
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
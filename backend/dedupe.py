@@ -0,0 +1,295 @@
+"""
+Duplicate and overlapping segment removal for line art.
+
+Gemini often draws the same edge twice (a building outline plus a window
+frame on the same line); every copy is a second laser pass. This works on
+the straight segments of a GeometryStore:
+
+1. Each segment is indexed by its line: direction angle bin, then offset
+   of its midpoint from the origin along the normal, then its interval
+   along the line. Sorting on these keys is the spatial index: collinear
+   segments within `tolerance` end up adjacent, so grouping is a few
+   vectorised passes instead of pairwise comparisons. A line spans less
+   than `tolerance` in offset, so parallel hatching stays separate lines.
+2. Overlapping (or touching within tolerance) intervals on the same line
+   are merged into one segment, owned by the first element that drew it.
+   Exact duplicates are simply dropped.
+3. Elements are rebuilt from their surviving segments; curves are kept.
+
+Segments are only merged within one building (or among the canvas-wide
+elements), the groups that expand_horizontal moves or stretches as a
+whole. Across groups a shared line is not a duplicate: the ground line
+and each building's bottom edge separate once the buildings move, and a
+building that absorbed the ground line would become canvas-wide itself.
+
+Buildings are assigned again on the result, as parse_svg would on the
+exported SVG. That can regroup elements: overlapping pieces of a ground
+line cut by tile seams chain every building into one cluster until they
+are joined into a canvas-wide line. So the merge is redone with the new
+groups until the assignment no longer changes.
+"""
+import math
+
+import numpy as np
+
+import geometry
+
+
+def _decompose(store: geometry.GeometryStore):
+    """Straight segments (S, 4) plus per-element piece lists referencing them"""
+    coords = store.coords.tolist()
+    cmds = store.cmds.tolist()
+    cmd_offsets = store.cmd_offsets.tolist()
+    point_offsets = store.point_offsets.tolist()
+    segments, segment_element, pieces = [], [], []
+    for e in range(store.element_count):
+        p = point_offsets[e]
+        current = start = None
+        element = []
+        for code in cmds[cmd_offsets[e]:cmd_offsets[e + 1]]:
+            if code == geometry.MOVE:
+                current = start = coords[p]
+                element.append(("move", start))
+            elif code == geometry.LINE:
+                end = coords[p]
+                element.append(("seg", len(segments), False))
+                segments.append((*current, *end))
+                segment_element.append(e)
+                current = end
+            elif code == geometry.CLOSE:
+                if current is not None and current != start:
+                    element.append(("seg", len(segments), True))
+                    segments.append((*current, *start))
+                    segment_element.append(e)
+                else:
+                    element.append(("close",))
+                current = start
+            else:
+                n = geometry.POINTS_PER_CMD[code]
+                element.append(("curve", code, coords[p:p + n], current))
+                current = coords[p + n - 1]
+            p += geometry.POINTS_PER_CMD[code]
+        pieces.append(element)
+    return np.array(segments, dtype=np.float64).reshape(-1, 4), np.array(segment_element, dtype=np.int64), pieces
+
+
+def _group_breaks(values: np.ndarray, tolerance: float, groups: np.ndarray = None) -> np.ndarray:
+    """
+    Group ids for values sorted within each run of equal `groups`. A group
+    spans less than `tolerance` from its first value; chaining neighbours
+    instead would fold evenly spaced lines (hatching, mullions) into one.
+    """
+    count = len(values)
+    breaks = np.empty(count, dtype=bool)
+    breaks[0] = True
+    breaks[1:] = np.diff(values) >= tolerance
+    if groups is not None:
+        breaks[1:] |= groups[1:] != groups[:-1]
+    # Chains of close neighbours are groups already unless they span a tolerance or more
+    starts = np.flatnonzero(breaks)
+    ends = np.append(starts[1:], count)
+    wide = values[ends - 1] - values[starts] >= tolerance
+    for chain_start, chain_end in zip(starts[wide].tolist(), ends[wide].tolist()):
+        chain = values[chain_start:chain_end]
+        first = 0
+        while True:
+            first = int(np.searchsorted(chain, chain[first] + tolerance, side="left"))
+            if first >= len(chain):
+                break
+            breaks[chain_start + first] = True
+    return np.cumsum(breaks) - 1
+
+
+def find_merges(segments: np.ndarray, tolerance: float = 0.5, angle_tolerance: float = math.radians(0.5),
+                groups: np.ndarray = None):
+    """
+    Merge plan for (S, 4) segments; with `groups` (one id per segment)
+    only segments of the same group are merged.
+
+    Returns (keep, merged, owner, stats): keep[i] is False for segments
+    absorbed into another, owner[i] is the segment that absorbed them (i
+    itself if kept), merged[i] holds the new endpoints for kept segments.
+    """
+    count = len(segments)
+    keep = np.ones(count, dtype=bool)
+    owner = np.arange(count)
+    merged = segments.copy()
+    stats = {"segments": count, "duplicates_removed": 0, "overlaps_merged": 0, "length_removed": 0.0}
+    if count < 2:
+        return keep, merged, owner, stats
+
+    x0, y0, x1, y1 = segments.T
+    dx, dy = x1 - x0, y1 - y0
+    length = np.hypot(dx, dy)
+    valid = length > 1e-9
+    # Direction in [0, pi); angles just below pi wrap to just below 0
+    theta = np.mod(np.arctan2(dy, dx), np.pi)
+    theta[theta > np.pi - angle_tolerance / 2] -= np.pi
+
+    idx = np.flatnonzero(valid)
+    # Fixed angle bins centred on 0 (so axis-aligned lines never straddle a
+    # boundary); chaining would let a flattened arc fold into one group
+    angle_bin = np.floor(theta[idx] / angle_tolerance + 0.5).astype(np.int64)
+    angle_group = np.empty(count, dtype=np.int64)
+    angle_group[idx] = np.unique(angle_bin, return_inverse=True)[1]
+
+    # Shared direction per angle group so offsets of far-apart segments compare fairly
+    group_theta = np.bincount(angle_group[idx], weights=theta[idx]) / np.bincount(angle_group[idx])
+    g_theta = group_theta[angle_group[idx]]
+    cos_t, sin_t = np.cos(g_theta), np.sin(g_theta)
+    mid_x, mid_y = (x0[idx] + x1[idx]) / 2, (y0[idx] + y1[idx]) / 2
+    rho = -sin_t * mid_x + cos_t * mid_y
+    t0 = cos_t * x0[idx] + sin_t * y0[idx]
+    t1 = cos_t * x1[idx] + sin_t * y1[idx]
+    lo, hi = np.minimum(t0, t1), np.maximum(t0, t1)
+
+    # Lines: same group and angle group, offsets within tolerance
+    line_group = angle_group[idx]
+    if groups is not None:
+        line_group = np.unique(np.column_stack([groups[idx], line_group]), axis=0, return_inverse=True)[1].reshape(-1)
+    order = np.lexsort((rho, line_group))
+    line = np.empty(len(idx), dtype=np.int64)
+    line[order] = _group_breaks(rho[order], tolerance, line_group[order])
+
+    # Runs: overlapping intervals on a line. Offsetting each line by a
+    # large constant lets one running maximum serve all lines at once.
+    span = max(float(hi.max() - lo.min()), 1.0) + 4 * tolerance
+    lo_key, hi_key = lo + line * span * 2, hi + line * span * 2
+    order = np.lexsort((lo_key, line))
+    running_hi = np.maximum.accumulate(hi_key[order])
+    starts = np.empty(len(order), dtype=bool)
+    starts[0] = True
+    starts[1:] = lo_key[order][1:] > running_hi[:-1] + tolerance
+    run = np.cumsum(starts) - 1
+    run_count = np.bincount(run)
+    multi = run_count[run] > 1
+    if not multi.any():
+        return keep, merged, owner, stats
+
+    # Owner: the lowest segment index (first drawn) in each run
+    members = idx[order]
+    owner_of_run = np.full(len(run_count), np.iinfo(np.int64).max)
+    np.minimum.at(owner_of_run, run, members)
+    run_lo = np.full(len(run_count), np.inf)
+    run_hi = np.full(len(run_count), -np.inf)
+    np.minimum.at(run_lo, run, lo[order])
+    np.maximum.at(run_hi, run, hi[order])
+
+    absorbed = multi & (members != owner_of_run[run])
+    keep[members[absorbed]] = False
+    owner[members[absorbed]] = owner_of_run[run][absorbed]
+
+    # Owners of multi-member runs get the merged extent along their own line
+    merged_runs = np.flatnonzero(run_count > 1)
+    owners = owner_of_run[merged_runs]
+    owner_pos = np.searchsorted(idx, owners)
+    c, s = cos_t[owner_pos], sin_t[owner_pos]
+    r = rho[owner_pos]
+    base_x, base_y = -s * r, c * r
+    a, b = run_lo[merged_runs], run_hi[merged_runs]
+    # Keep the owner's drawing direction
+    forward = t0[owner_pos] <= t1[owner_pos]
+    start_t, end_t = np.where(forward, a, b), np.where(forward, b, a)
+    merged[owners] = np.column_stack([base_x + c * start_t, base_y + s * start_t, base_x + c * end_t, base_y + s * end_t])
+
+    # A run whose members all cover its full extent is pure duplication
+    member_full = (np.abs(lo[order] - run_lo[run]) <= tolerance) & (np.abs(hi[order] - run_hi[run]) <= tolerance)
+    all_full = np.ones(len(run_count), dtype=bool)
+    np.logical_and.at(all_full, run, member_full)
+    duplicate_runs = (run_count > 1) & all_full
+    stats["duplicates_removed"] = int((run_count[duplicate_runs] - 1).sum())
+    stats["overlaps_merged"] = int((run_count[(run_count > 1) & ~all_full] - 1).sum())
+    total = np.bincount(run, weights=length[members])
+    stats["length_removed"] = round(float((total - (run_hi - run_lo))[run_count > 1].sum()), 3)
+    return keep, merged, owner, stats
+
+
+def _same(a, b) -> bool:
+    return abs(a[0] - b[0]) <= 1e-9 and abs(a[1] - b[1]) <= 1e-9
+
+
+def _rebuild(store: geometry.GeometryStore, pieces: list, keep: np.ndarray, merged: np.ndarray, segments: np.ndarray):
+    """(new store from the piece lists, skipping absorbed segments; indices of the elements kept)"""
+    changed = np.any(np.abs(merged - segments) > 1e-9, axis=1).tolist()
+    keep, merged = keep.tolist(), merged.tolist()
+    cmds, points = [], []
+    cmd_offsets, point_offsets, kept_elements = [0], [0], []
+    for e, element in enumerate(pieces):
+        el_cmds, el_points = [], []
+        current = subpath_start = None
+        for piece in element:
+            kind = piece[0]
+            if kind == "move":
+                current = None  # only emitted once something is drawn from here
+            elif kind == "seg":
+                i, closing = piece[1], piece[2]
+                if not keep[i]:
+                    current = None
+                    continue
+                x0, y0, x1, y1 = merged[i]
+                if current is None or not _same(current, (x0, y0)):
+                    el_cmds.append(geometry.MOVE)
+                    el_points.append((x0, y0))
+                    subpath_start = (x0, y0)
+                if closing and not changed[i] and _same((x1, y1), subpath_start):
+                    el_cmds.append(geometry.CLOSE)
+                else:
+                    el_cmds.append(geometry.LINE)
+                    el_points.append((x1, y1))
+                current = (x1, y1)
+            elif kind == "close":
+                if current is not None:
+                    el_cmds.append(geometry.CLOSE)
+                    current = subpath_start
+            else:
+                code, pts, curve_start = piece[1], piece[2], piece[3]
+                if current is None or not _same(current, curve_start):
+                    el_cmds.append(geometry.MOVE)
+                    el_points.append(tuple(curve_start))
+                    subpath_start = tuple(curve_start)
+                el_cmds.append(code)
+                el_points.extend(tuple(pt) for pt in pts)
+                current = tuple(pts[-1])
+        if len(el_points) < 2:
+            continue
+        cmds.extend(el_cmds)
+        points.extend(el_points)
+        cmd_offsets.append(len(cmds))
+        point_offsets.append(len(points))
+        kept_elements.append(e)
+
+    rebuilt = geometry.GeometryStore(
+        np.array(points, dtype=np.float64).reshape(-1, 2),
+        np.array(cmds, dtype=np.uint8),
+        np.array(cmd_offsets, dtype=np.int64),
+        np.array(point_offsets, dtype=np.int64),
+        np.zeros(len(kept_elements), dtype=np.int32),
+        store.attr_index[kept_elements],
+        store.meta,
+    )
+    rebuilt.building = geometry.assign_buildings(rebuilt)
+    return rebuilt, np.array(kept_elements, dtype=np.int64)
+
+
+def dedupe_store(store: geometry.GeometryStore, tolerance: float = 0.5, max_rounds: int = 3) -> tuple:
+    """(store without duplicate/overlapping segments, report)"""
+    segments, segment_element, pieces = _decompose(store)
+    groups = store.building
+    for _ in range(max_rounds):
+        keep, merged, owner, stats = find_merges(segments, tolerance, groups=groups[segment_element])
+        stats["segments_removed"] = int((~keep).sum())
+        stats["elements_before"] = store.element_count
+        if not stats["segments_removed"]:
+            stats["elements_after"] = store.element_count
+            return store, stats
+        rebuilt, kept_elements = _rebuild(store, pieces, keep, merged, segments)
+        stats["elements_after"] = rebuilt.element_count
+        # Each input element's building in the result; one absorbed whole follows its owner
+        regrouped = groups.copy()
+        regrouped[kept_elements] = rebuilt.building
+        absorbed = ~keep & ~np.isin(segment_element, kept_elements)
+        regrouped[segment_element[absorbed]] = regrouped[segment_element[owner[absorbed]]]
+        if np.array_equal(regrouped, groups):
+            break
+        groups = regrouped
+    return rebuilt, stats
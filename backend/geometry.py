@@ -0,0 +1,733 @@
+"""
+Columnar geometry store for city SVGs.
+
+Stage 1 output is parsed once into flat NumPy arrays and saved as an
+`.npz` next to the SVG, so later steps work on arrays instead of
+re-parsing text:
+
+    coords         float (P, 2)  absolute points, transforms already applied
+    cmds           uint8 (C,)    command codes (MOVE, LINE, CUBIC, QUAD, CLOSE)
+    cmd_offsets    int   (E+1,)  element i owns cmds[cmd_offsets[i]:cmd_offsets[i+1]]
+    point_offsets  int   (E+1,)  element i owns coords[point_offsets[i]:point_offsets[i+1]]
+    building       int   (E,)    building id per element, -1 for canvas-wide elements
+    attr_index     int   (E,)    index into the shared presentation attribute sets
+
+Every shape is normalised to an absolute path of M/L/C/Q/Z (H/V become L,
+S/T are expanded, arcs become cubics). Elements that are not geometry
+(`<text>`, `<use>`, `<defs>`...) are kept verbatim as passthrough XML.
+SVG text is only produced again by `to_svg`.
+"""
+import json
+import math
+import os
+import re
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+ET.register_namespace("", SVG_NS)
+ET.register_namespace("xlink", XLINK_NS)
+
+MOVE, LINE, CUBIC, QUAD, CLOSE = range(5)
+CMD_LETTERS = "MLCQZ"
+POINTS_PER_CMD = (1, 1, 3, 2, 0)
+
+# Elements wider than this share of the canvas (ground lines, frames) are
+# stretched with the canvas instead of being moved as part of a building
+SPAN_FRACTION = 0.5
+
+SHAPE_TAGS = {"path", "rect", "line", "polyline", "polygon", "circle", "ellipse"}
+CONTAINER_TAGS = {"g", "a"}
+# Passthrough elements positioned on the canvas; these move with spacing
+POSITIONED_TAGS = {"text", "use", "image", "svg", "foreignObject"}
+GEOMETRY_ATTRS = {
+    "d", "x", "y", "width", "height", "rx", "ry", "cx", "cy", "r",
+    "x1", "y1", "x2", "y2", "points", "transform", "id",
+}
+
+_TOKEN_RE = re.compile(r"[MmLlHhVvCcSsQqTtAaZz]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_TRANSFORM_RE = re.compile(r"(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)")
+_IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _float(value, default: float = 0.0) -> float:
+    match = _NUMBER_RE.match(str(value or "").strip())
+    return float(match.group(0)) if match else default
+
+
+def _multiply(m, n):
+    """Affine (a, b, c, d, e, f) product m * n"""
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (
+        a * a2 + c * b2, b * a2 + d * b2,
+        a * c2 + c * d2, b * c2 + d * d2,
+        a * e2 + c * f2 + e, b * e2 + d * f2 + f,
+    )
+
+
+def parse_transform(value: str):
+    matrix = _IDENTITY
+    for name, args in _TRANSFORM_RE.findall(value or ""):
+        v = [float(n) for n in _NUMBER_RE.findall(args)]
+        if name == "matrix" and len(v) == 6:
+            step = tuple(v)
+        elif name == "translate" and v:
+            step = (1, 0, 0, 1, v[0], v[1] if len(v) > 1 else 0)
+        elif name == "scale" and v:
+            step = (v[0], 0, 0, v[1] if len(v) > 1 else v[0], 0, 0)
+        elif name == "rotate" and v:
+            a = math.radians(v[0])
+            step = (math.cos(a), math.sin(a), -math.sin(a), math.cos(a), 0, 0)
+            if len(v) == 3:
+                step = _multiply(_multiply((1, 0, 0, 1, v[1], v[2]), step), (1, 0, 0, 1, -v[1], -v[2]))
+        elif name == "skewX" and v:
+            step = (1, 0, math.tan(math.radians(v[0])), 1, 0, 0)
+        elif name == "skewY" and v:
+            step = (1, math.tan(math.radians(v[0])), 0, 1, 0, 0)
+        else:
+            continue
+        matrix = _multiply(matrix, step)
+    return matrix
+
+
+def _arc_to_cubics(x1, y1, rx, ry, phi, large_arc, sweep, x2, y2):
+    """Endpoint arc (SVG spec F.6.5) as a list of cubic control point triples"""
+    if (x1, y1) == (x2, y2):
+        return []
+    rx, ry = abs(rx), abs(ry)
+    if rx == 0 or ry == 0:
+        return [((x1, y1), (x2, y2), (x2, y2))]
+    cos_phi, sin_phi = math.cos(math.radians(phi)), math.sin(math.radians(phi))
+    dx, dy = (x1 - x2) / 2, (y1 - y2) / 2
+    x1p = cos_phi * dx + sin_phi * dy
+    y1p = -sin_phi * dx + cos_phi * dy
+    scale = (x1p / rx) ** 2 + (y1p / ry) ** 2
+    if scale > 1:
+        rx, ry = rx * math.sqrt(scale), ry * math.sqrt(scale)
+    num = rx * rx * ry * ry - rx * rx * y1p * y1p - ry * ry * x1p * x1p
+    den = rx * rx * y1p * y1p + ry * ry * x1p * x1p
+    coef = math.sqrt(max(0.0, num / den)) if den else 0.0
+    if large_arc == sweep:
+        coef = -coef
+    cxp, cyp = coef * rx * y1p / ry, -coef * ry * x1p / rx
+    cx = cos_phi * cxp - sin_phi * cyp + (x1 + x2) / 2
+    cy = sin_phi * cxp + cos_phi * cyp + (y1 + y2) / 2
+
+    def angle(ux, uy, vx, vy):
+        return math.atan2(ux * vy - uy * vx, ux * vx + uy * vy)
+
+    theta = angle(1, 0, (x1p - cxp) / rx, (y1p - cyp) / ry)
+    delta = angle((x1p - cxp) / rx, (y1p - cyp) / ry, (-x1p - cxp) / rx, (-y1p - cyp) / ry)
+    if not sweep and delta > 0:
+        delta -= 2 * math.pi
+    elif sweep and delta < 0:
+        delta += 2 * math.pi
+
+    segments = max(1, math.ceil(abs(delta) / (math.pi / 2)))
+    step = delta / segments
+    alpha = 4 / 3 * math.tan(step / 4)
+
+    def point(t):
+        x, y = rx * math.cos(t), ry * math.sin(t)
+        return cos_phi * x - sin_phi * y + cx, sin_phi * x + cos_phi * y + cy
+
+    def deriv(t):
+        x, y = -rx * math.sin(t), ry * math.cos(t)
+        return cos_phi * x - sin_phi * y, sin_phi * x + cos_phi * y
+
+    cubics = []
+    t = theta
+    start = (x1, y1)
+    for i in range(segments):
+        t2 = t + step
+        end = (x2, y2) if i == segments - 1 else point(t2)
+        d1, d2 = deriv(t), deriv(t2)
+        cubics.append((
+            (start[0] + alpha * d1[0], start[1] + alpha * d1[1]),
+            (end[0] - alpha * d2[0], end[1] - alpha * d2[1]),
+            end,
+        ))
+        start, t = end, t2
+    return cubics
+
+
+def parse_path(d: str):
+    """Path data as (cmds, points) in absolute M/L/C/Q/Z form"""
+    tokens = _TOKEN_RE.findall(d or "")
+    cmds, points = [], []
+    i, cmd = 0, None
+    x = y = start_x = start_y = 0.0
+    last_ctrl, last_cmd = None, None
+
+    def num():
+        nonlocal i
+        value = float(tokens[i])
+        i += 1
+        return value
+
+    def flag():
+        # Arc flags may be packed without separators ("a1 1 0 01 5 5")
+        nonlocal i
+        token = tokens[i]
+        if len(token) > 1 and token[0] in "01":
+            tokens[i] = token[1:]
+            return token[0] == "1"
+        i += 1
+        return float(token) != 0
+
+    while i < len(tokens):
+        if tokens[i].isalpha():
+            cmd = tokens[i]
+            i += 1
+            if cmd in "Zz":
+                cmds.append(CLOSE)
+                x, y = start_x, start_y
+                last_ctrl, last_cmd = None, CLOSE
+                continue
+        elif cmd is None:
+            break
+        relative = cmd.islower()
+        op = cmd.upper()
+        ox, oy = (x, y) if relative else (0.0, 0.0)
+        try:
+            if op == "M":
+                x, y = ox + num(), oy + num()
+                start_x, start_y = x, y
+                cmds.append(MOVE)
+                points.append((x, y))
+                # Further pairs after a moveto are implicit linetos
+                cmd = "l" if relative else "L"
+                last_ctrl = None
+            elif op in "LHV":
+                if op == "L":
+                    x, y = ox + num(), oy + num()
+                elif op == "H":
+                    x = ox + num()
+                else:
+                    y = oy + num()
+                cmds.append(LINE)
+                points.append((x, y))
+                last_ctrl = None
+            elif op in "CS":
+                if op == "C":
+                    c1 = (ox + num(), oy + num())
+                else:
+                    c1 = (2 * x - last_ctrl[0], 2 * y - last_ctrl[1]) if last_cmd == CUBIC and last_ctrl else (x, y)
+                c2 = (ox + num(), oy + num())
+                x, y = ox + num(), oy + num()
+                cmds.append(CUBIC)
+                points.extend((c1, c2, (x, y)))
+                last_ctrl = c2
+            elif op in "QT":
+                if op == "Q":
+                    c1 = (ox + num(), oy + num())
+                else:
+                    c1 = (2 * x - last_ctrl[0], 2 * y - last_ctrl[1]) if last_cmd == QUAD and last_ctrl else (x, y)
+                x, y = ox + num(), oy + num()
+                cmds.append(QUAD)
+                points.extend((c1, (x, y)))
+                last_ctrl = c1
+            elif op == "A":
+                rx, ry, phi = num(), num(), num()
+                large_arc, sweep = flag(), flag()
+                nx, ny = ox + num(), oy + num()
+                for c1, c2, end in _arc_to_cubics(x, y, rx, ry, phi, large_arc, sweep, nx, ny):
+                    cmds.append(CUBIC)
+                    points.extend((c1, c2, end))
+                x, y = nx, ny
+                last_ctrl = None
+            else:
+                i += 1
+                continue
+        except (IndexError, ValueError):
+            # Truncated data: keep what parsed cleanly, like browsers do
+            break
+        last_cmd = cmds[-1] if cmds else None
+    return cmds, points
+
+
+def _ellipse(cx, cy, rx, ry):
+    k = 0.5522847498
+    return [MOVE, CUBIC, CUBIC, CUBIC, CUBIC, CLOSE], [
+        (cx + rx, cy),
+        (cx + rx, cy + k * ry), (cx + k * rx, cy + ry), (cx, cy + ry),
+        (cx - k * rx, cy + ry), (cx - rx, cy + k * ry), (cx - rx, cy),
+        (cx - rx, cy - k * ry), (cx - k * rx, cy - ry), (cx, cy - ry),
+        (cx + k * rx, cy - ry), (cx + rx, cy - k * ry), (cx + rx, cy),
+    ]
+
+
+def shape_to_path(tag: str, attrs: dict):
+    """(cmds, points) for any basic shape element"""
+    get = lambda name: _float(attrs.get(name))  # noqa: E731
+    if tag == "path":
+        return parse_path(attrs.get("d", ""))
+    if tag == "line":
+        return [MOVE, LINE], [(get("x1"), get("y1")), (get("x2"), get("y2"))]
+    if tag in ("polyline", "polygon"):
+        values = [float(n) for n in _NUMBER_RE.findall(attrs.get("points", ""))]
+        pts = list(zip(values[0::2], values[1::2]))
+        if not pts:
+            return [], []
+        cmds = [MOVE] + [LINE] * (len(pts) - 1)
+        if tag == "polygon":
+            cmds.append(CLOSE)
+        return cmds, pts
+    if tag == "circle":
+        r = get("r")
+        return _ellipse(get("cx"), get("cy"), r, r) if r > 0 else ([], [])
+    if tag == "ellipse":
+        rx, ry = get("rx"), get("ry")
+        return _ellipse(get("cx"), get("cy"), rx, ry) if rx > 0 and ry > 0 else ([], [])
+    if tag == "rect":
+        x, y, w, h = get("x"), get("y"), get("width"), get("height")
+        if w <= 0 or h <= 0:
+            return [], []
+        rx = _float(attrs.get("rx", attrs.get("ry")))
+        ry = _float(attrs.get("ry", attrs.get("rx")))
+        rx, ry = min(rx, w / 2), min(ry, h / 2)
+        if rx <= 0 or ry <= 0:
+            return [MOVE, LINE, LINE, LINE, CLOSE], [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]
+        k = 0.5522847498
+        return [MOVE, LINE, CUBIC, LINE, CUBIC, LINE, CUBIC, LINE, CUBIC, CLOSE], [
+            (x + rx, y), (x + w - rx, y),
+            (x + w - rx + k * rx, y), (x + w, y + ry - k * ry), (x + w, y + ry),
+            (x + w, y + h - ry),
+            (x + w, y + h - ry + k * ry), (x + w - rx + k * rx, y + h), (x + w - rx, y + h),
+            (x + rx, y + h),
+            (x + rx - k * rx, y + h), (x, y + h - ry + k * ry), (x, y + h - ry),
+            (x, y + ry),
+            (x, y + ry - k * ry), (x + rx - k * rx, y), (x + rx, y),
+        ]
+    return [], []
+
+
+def _merge_attrs(inherited: dict, attrs: dict) -> dict:
+    merged = dict(inherited)
+    for key, value in attrs.items():
+        if key.startswith("{") or key in GEOMETRY_ATTRS:
+            continue
+        if key == "style" and merged.get("style"):
+            value = f"{merged['style'].rstrip(';')};{value}"
+        merged[key] = value
+    return merged
+
+
+def _canvas(root) -> list:
+    viewbox = [float(n) for n in _NUMBER_RE.findall(root.get("viewBox", ""))]
+    if len(viewbox) == 4:
+        return viewbox
+    return [0.0, 0.0, _float(root.get("width"), 1000.0), _float(root.get("height"), 1000.0)]
+
+
+def _viewbox_attr(viewbox) -> str:
+    return " ".join(f"{v:g}" for v in viewbox)
+
+
+class GeometryStore:
+    def __init__(self, coords, cmds, cmd_offsets, point_offsets, building, attr_index, meta):
+        self.coords = coords
+        self.cmds = cmds
+        self.cmd_offsets = cmd_offsets
+        self.point_offsets = point_offsets
+        self.building = building
+        self.attr_index = attr_index
+        # viewbox, root_attrs, attr_sets, passthrough [{xml, x, matrix}]
+        self.meta = meta
+
+    @property
+    def element_count(self) -> int:
+        return len(self.point_offsets) - 1
+
+    @property
+    def building_count(self) -> int:
+        return int(self.building.max()) + 1 if len(self.building) else 0
+
+    @property
+    def viewbox(self) -> list:
+        return self.meta["viewbox"]
+
+    @property
+    def viewbox_attr(self) -> str:
+        return _viewbox_attr(self.viewbox)
+
+    def element_bboxes(self) -> np.ndarray:
+        """(E, 4) min_x, min_y, max_x, max_y over each element's points (control points included)"""
+        if self.element_count == 0:
+            return np.zeros((0, 4))
+        starts = self.point_offsets[:-1]
+        return np.column_stack([
+            np.minimum.reduceat(self.coords[:, 0], starts),
+            np.minimum.reduceat(self.coords[:, 1], starts),
+            np.maximum.reduceat(self.coords[:, 0], starts),
+            np.maximum.reduceat(self.coords[:, 1], starts),
+        ])
+
+    def building_bboxes(self) -> np.ndarray:
+        """(B, 4) bounding box per building id"""
+        boxes = np.empty((self.building_count, 4))
+        boxes[:, :2], boxes[:, 2:] = np.inf, -np.inf
+        element_boxes = self.element_bboxes()
+        member = self.building >= 0
+        for col, reduce in ((0, np.minimum), (1, np.minimum), (2, np.maximum), (3, np.maximum)):
+            reduce.at(boxes[:, col], self.building[member], element_boxes[member, col])
+        return boxes
+
+    def bbox(self) -> tuple:
+        """Overall drawing bounds"""
+        if not len(self.coords):
+            return tuple(self.viewbox)
+        lo, hi = self.coords.min(axis=0), self.coords.max(axis=0)
+        return float(lo[0]), float(lo[1]), float(hi[0]), float(hi[1])
+
+    def expand_horizontal(self, expansion_percentage: float) -> "GeometryStore":
+        """
+        Widen the gaps between buildings without distorting any of them.
+
+        Each building moves rigidly by (center - min_x) * (f - 1), so the
+        leftmost stays put and the rightmost ends up near the new right
+        edge. Canvas-wide elements are stretched with the canvas.
+        """
+        factor = 1 + expansion_percentage / 100
+        min_x, min_y, width, height = self.viewbox
+        boxes = self.building_bboxes()
+        centers = (boxes[:, 0] + boxes[:, 2]) / 2
+        member = self.building >= 0
+        shift = np.zeros(self.element_count)
+        shift[member] = (centers[self.building[member]] - min_x) * (factor - 1)
+
+        point_element = np.repeat(np.arange(self.element_count), np.diff(self.point_offsets))
+        coords = self.coords.copy()
+        coords[:, 0] += shift[point_element]
+        stretched = ~member[point_element]
+        coords[stretched, 0] = min_x + (self.coords[stretched, 0] - min_x) * factor
+
+        meta = json.loads(json.dumps(self.meta))
+        meta["viewbox"] = [min_x, min_y, width * factor, height]
+        root_width = meta["root_attrs"].get("width", "").strip()
+        if root_width and not root_width.endswith("%"):
+            unit = _NUMBER_RE.sub("", root_width, count=1)
+            meta["root_attrs"]["width"] = f"{_float(root_width) * factor:g}{unit}"
+        for item in meta["passthrough"]:
+            if item["x"] is not None:
+                dx = (item["x"] - min_x) * (factor - 1)
+                item["dx"] = item.get("dx", 0) + dx
+                item["x"] += dx
+        return GeometryStore(coords, self.cmds, self.cmd_offsets, self.point_offsets,
+                             self.building, self.attr_index, meta)
+
+    def place(self, box) -> "GeometryStore":
+        """
+        Map this store's viewBox onto `box` (x0, y0, x1, y1) of a larger
+        canvas, which becomes the new viewBox; used to put a tile's drawing
+        back where the tile was cut from.
+        """
+        min_x, min_y, width, height = self.viewbox
+        x0, y0, x1, y1 = box
+        sx, sy = (x1 - x0) / (width or 1), (y1 - y0) / (height or 1)
+        coords = (self.coords - (min_x, min_y)) * (sx, sy) + (x0, y0)
+        matrix = (sx, 0.0, 0.0, sy, x0 - min_x * sx, y0 - min_y * sy)
+        meta = json.loads(json.dumps(self.meta))
+        meta["viewbox"] = [float(x0), float(y0), float(x1 - x0), float(y1 - y0)]
+        for item in meta["passthrough"]:
+            if item.get("dx"):
+                item["matrix"] = list(_multiply((1, 0, 0, 1, item.pop("dx"), 0), tuple(item["matrix"])))
+            item["matrix"] = list(_multiply(matrix, tuple(item["matrix"])))
+            if item["x"] is not None:
+                item["x"] = x0 + (item["x"] - min_x) * sx
+        return GeometryStore(coords, self.cmds, self.cmd_offsets, self.point_offsets,
+                             self.building, self.attr_index, meta)
+
+    def subset(self, elements, viewbox=None, passthrough=None) -> "GeometryStore":
+        """
+        Store with only `elements` (indices or a boolean mask), optionally on
+        a new viewBox. Passthrough XML is kept unless a list is given.
+        """
+        elements = np.asarray(elements)
+        if elements.dtype == bool:
+            elements = np.flatnonzero(elements)
+        cmd_lengths = np.diff(self.cmd_offsets)[elements]
+        point_lengths = np.diff(self.point_offsets)[elements]
+        meta = json.loads(json.dumps(self.meta))
+        if viewbox is not None:
+            meta["viewbox"] = [float(v) for v in viewbox]
+        if passthrough is not None:
+            meta["passthrough"] = passthrough
+        return GeometryStore(
+            self.coords[_ranges(self.point_offsets[elements], point_lengths)],
+            self.cmds[_ranges(self.cmd_offsets[elements], cmd_lengths)],
+            np.concatenate([[0], np.cumsum(cmd_lengths)]).astype(np.int64),
+            np.concatenate([[0], np.cumsum(point_lengths)]).astype(np.int64),
+            self.building[elements],
+            self.attr_index[elements],
+            meta,
+        )
+
+    def path_data(self, precision: int = 2) -> list:
+        """Path `d` string per element"""
+        pairs = np.char.add(
+            np.char.add(np.char.mod(f"%.{precision}f", self.coords[:, 0]), " "),
+            np.char.mod(f"%.{precision}f", self.coords[:, 1]),
+        ).tolist() if len(self.coords) else []
+        cmds = self.cmds.tolist()
+        cmd_offsets = self.cmd_offsets.tolist()
+        point_offsets = self.point_offsets.tolist()
+        paths = []
+        for e in range(self.element_count):
+            parts = []
+            p = point_offsets[e]
+            for code in cmds[cmd_offsets[e]:cmd_offsets[e + 1]]:
+                n = POINTS_PER_CMD[code]
+                parts.append(CMD_LETTERS[code] + " ".join(pairs[p:p + n]))
+                p += n
+            paths.append(" ".join(parts))
+        return paths
+
+    def polylines(self, curve_segments: int = 8) -> list:
+        """Each subpath flattened to (points array, closed) with curves sampled"""
+        t = np.linspace(0, 1, curve_segments + 1)[1:, None]
+        coords = self.coords
+        cmds = self.cmds.tolist()
+        cmd_offsets = self.cmd_offsets.tolist()
+        point_offsets = self.point_offsets.tolist()
+        result = []
+        for e in range(self.element_count):
+            p = point_offsets[e]
+            current = []
+            for code in cmds[cmd_offsets[e]:cmd_offsets[e + 1]]:
+                if code == MOVE:
+                    if len(current) > 1:
+                        result.append((np.vstack(current), False))
+                    current = [coords[p:p + 1]]
+                elif code == LINE:
+                    current.append(coords[p:p + 1])
+                elif code == CUBIC:
+                    p0, c1, c2, p3 = current[-1][-1], coords[p], coords[p + 1], coords[p + 2]
+                    current.append((1 - t) ** 3 * p0 + 3 * (1 - t) ** 2 * t * c1 + 3 * (1 - t) * t ** 2 * c2 + t ** 3 * p3)
+                elif code == QUAD:
+                    p0, c1, p2 = current[-1][-1], coords[p], coords[p + 1]
+                    current.append((1 - t) ** 2 * p0 + 2 * (1 - t) * t * c1 + t ** 2 * p2)
+                elif code == CLOSE and current:
+                    start = current[0][:1]
+                    if len(current) > 1:
+                        result.append((np.vstack(current + [start]), True))
+                    # Drawing may continue from the subpath start after Z
+                    current = [start]
+                p += POINTS_PER_CMD[code]
+            if len(current) > 1:
+                result.append((np.vstack(current), False))
+        return result
+
+    def to_svg(self, precision: int = 2) -> str:
+        """Serialise back to an SVG document"""
+        root_attrs = {k: v for k, v in self.meta["root_attrs"].items() if k not in ("viewBox", "xmlns")}
+        head = "".join(f" {k}={quoteattr(v)}" for k, v in root_attrs.items())
+        out = [
+            '<?xml version="1.0" encoding="UTF-8"?>\n',
+            f'<svg xmlns="{SVG_NS}" viewBox="{self.viewbox_attr}"{head}>\n',
+        ]
+        attr_strings = [
+            "".join(f" {k}={quoteattr(v)}" for k, v in attrs.items()) for attrs in self.meta["attr_sets"]
+        ]
+        attr_index = self.attr_index.tolist()
+        for e, d in enumerate(self.path_data(precision)):
+            out.append(f'<path d="{d}"{attr_strings[attr_index[e]]}/>\n')
+        out.extend(xml + "\n" for xml in self.passthrough_xml())
+        out.append("</svg>\n")
+        return "".join(out)
+
+    def passthrough_xml(self) -> list:
+        """Passthrough elements as XML, wrapped in a transform group where they were moved"""
+        out = []
+        for item in self.meta["passthrough"]:
+            matrix = tuple(item["matrix"])
+            if item.get("dx"):
+                matrix = _multiply((1, 0, 0, 1, item["dx"], 0), matrix)
+            if matrix == _IDENTITY:
+                out.append(item["xml"])
+            else:
+                values = " ".join(f"{v:g}" for v in matrix)
+                out.append(f'<g transform="matrix({values})">{item["xml"]}</g>')
+        return out
+
+    def save(self, path):
+        """
+        Write the store as .npz (atomically, via a temp file). Coordinates
+        stay float64: float32 keeps only ~7 digits, too few for
+        SVG_PRECISION on wide drawings, and the reloaded store feeds
+        spacing and the toolpath exports.
+        """
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                coords=self.coords,
+                cmds=self.cmds,
+                cmd_offsets=self.cmd_offsets,
+                point_offsets=self.point_offsets,
+                building=self.building,
+                attr_index=self.attr_index,
+                meta=np.array(json.dumps(self.meta)),
+            )
+        os.replace(tmp, path)
+
+
+def _ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenation of arange(start, start + length) for each pair"""
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    shift = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.arange(total) + shift
+
+
+def concat(stores: list, meta: dict) -> GeometryStore:
+    """
+    One store with the elements of all `stores`, on `meta`'s viewBox and
+    root attributes. Attribute sets are merged, passthrough XML is
+    concatenated and buildings are reassigned.
+    """
+    attr_sets, attr_keys = [], {}
+    coords, cmds, cmd_lengths, point_lengths, attr_index, passthrough = [], [], [], [], [], []
+    for store in stores:
+        remap = []
+        for attrs in store.meta["attr_sets"]:
+            key = json.dumps(attrs, sort_keys=True)
+            if key not in attr_keys:
+                attr_keys[key] = len(attr_sets)
+                attr_sets.append(attrs)
+            remap.append(attr_keys[key])
+        coords.append(store.coords)
+        cmds.append(store.cmds)
+        cmd_lengths.append(np.diff(store.cmd_offsets))
+        point_lengths.append(np.diff(store.point_offsets))
+        attr_index.append(np.asarray(remap, dtype=np.int32)[store.attr_index] if remap else store.attr_index)
+        passthrough.extend(store.meta["passthrough"])
+    cmd_lengths = np.concatenate(cmd_lengths) if stores else np.zeros(0, dtype=np.int64)
+    point_lengths = np.concatenate(point_lengths) if stores else np.zeros(0, dtype=np.int64)
+    merged = GeometryStore(
+        np.concatenate(coords).reshape(-1, 2) if stores else np.zeros((0, 2)),
+        np.concatenate(cmds).astype(np.uint8) if stores else np.zeros(0, dtype=np.uint8),
+        np.concatenate([[0], np.cumsum(cmd_lengths)]).astype(np.int64),
+        np.concatenate([[0], np.cumsum(point_lengths)]).astype(np.int64),
+        np.zeros(len(point_lengths), dtype=np.int32),
+        np.concatenate(attr_index).astype(np.int32) if stores else np.zeros(0, dtype=np.int32),
+        {**json.loads(json.dumps(meta)), "attr_sets": attr_sets, "passthrough": passthrough},
+    )
+    merged.building = assign_buildings(merged)
+    return merged
+
+
+def assign_buildings(store: GeometryStore) -> np.ndarray:
+    """Cluster elements whose x-extents overlap into buildings"""
+    count = store.element_count
+    building = np.full(count, -1, dtype=np.int32)
+    if count == 0:
+        return building
+    boxes = store.element_bboxes()
+    spanning = boxes[:, 2] - boxes[:, 0] > SPAN_FRACTION * store.viewbox[2]
+    candidates = np.flatnonzero(~spanning)
+    if not len(candidates):
+        return building
+    order = candidates[np.argsort(boxes[candidates, 0], kind="stable")]
+    running_right = np.maximum.accumulate(boxes[order, 2])
+    starts_new = np.empty(len(order), dtype=bool)
+    starts_new[0] = True
+    starts_new[1:] = boxes[order[1:], 0] > running_right[:-1]
+    building[order] = np.cumsum(starts_new) - 1
+    return building
+
+
+def parse_svg(svg_content: str) -> GeometryStore:
+    """Parse SVG text into a GeometryStore"""
+    root = ET.fromstring(svg_content.encode("utf-8") if isinstance(svg_content, str) else svg_content)
+    cmds, points = [], []
+    cmd_offsets, point_offsets = [0], [0]
+    attr_sets, attr_keys, attr_index = [], {}, []
+    passthrough = []
+
+    def visit(node, inherited: dict, ctm):
+        for child in node:
+            if not isinstance(child.tag, str):
+                continue  # comments / processing instructions
+            tag = _local(child.tag)
+            matrix = _multiply(ctm, parse_transform(child.get("transform"))) if child.get("transform") else ctm
+            if tag in CONTAINER_TAGS:
+                visit(child, _merge_attrs(inherited, child.attrib), matrix)
+            elif tag in SHAPE_TAGS:
+                el_cmds, el_points = shape_to_path(tag, child.attrib)
+                if not el_points:
+                    continue
+                if matrix != _IDENTITY:
+                    a, b, c, d, e, f = matrix
+                    el_points = [(a * x + c * y + e, b * x + d * y + f) for x, y in el_points]
+                cmds.extend(el_cmds)
+                points.extend(el_points)
+                cmd_offsets.append(len(cmds))
+                point_offsets.append(len(points))
+                attrs = _merge_attrs(inherited, child.attrib)
+                key = json.dumps(attrs, sort_keys=True)
+                if key not in attr_keys:
+                    attr_keys[key] = len(attr_sets)
+                    attr_sets.append(attrs)
+                attr_index.append(attr_keys[key])
+            else:
+                child.tail = None
+                anchor = None
+                if tag in POSITIONED_TAGS:
+                    a, b, c, d, e, f = matrix
+                    x, y = _float(child.get("x")), _float(child.get("y"))
+                    anchor = a * x + c * y + e
+                passthrough.append({
+                    "xml": ET.tostring(child, encoding="unicode"),
+                    "x": anchor,
+                    "matrix": list(matrix),
+                })
+
+    visit(root, {}, _IDENTITY)
+    root_attrs = {
+        k: v for k, v in root.attrib.items()
+        if not k.startswith("{") and k not in ("viewBox", "version")
+    }
+    meta = {
+        "viewbox": _canvas(root),
+        "root_attrs": root_attrs,
+        "attr_sets": attr_sets,
+        "passthrough": passthrough,
+    }
+    store = GeometryStore(
+        np.array(points, dtype=np.float64).reshape(-1, 2),
+        np.array(cmds, dtype=np.uint8),
+        np.array(cmd_offsets, dtype=np.int64),
+        np.array(point_offsets, dtype=np.int64),
+        np.zeros(len(point_offsets) - 1, dtype=np.int32),
+        np.array(attr_index, dtype=np.int32),
+        meta,
+    )
+    store.building = assign_buildings(store)
+    return store
+
+
+def load(path) -> GeometryStore:
+    """Read a store written by GeometryStore.save"""
+    with np.load(path, allow_pickle=False) as data:
+        return GeometryStore(
+            data["coords"].astype(np.float64),
+            data["cmds"],
+            data["cmd_offsets"],
+            data["point_offsets"],
+            data["building"],
+            data["attr_index"],
+            json.loads(str(data["meta"])),
+        )
@@ -0,0 +1,157 @@
+"""
+Lease-based claiming of queue items for the Gemini pipeline stages.
+
+A stage starts by atomically flipping the queue item into its
+`*_processing` status with `find_one_and_update`, stamping the worker id
+and a lease expiry. While the job runs a heartbeat keeps extending the
+lease. If the process dies, the lease runs out and `reap_expired_leases`
+puts the item back into the state the stage started from, so it can be
+retried. Because the claim is a single conditional update, two clicks or
+two uvicorn workers can never run the same stage for the same city at
+once.
+
+Idempotency keys: a client may send the same `Idempotency-Key` header on
+retries. A duplicate of a running job gets the in-flight status back, a
+duplicate of a finished job gets the stored result.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+IN_FLIGHT_STATUSES = ["stage1_processing", "spacing_processing", "stage2_processing"]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def lease_expiry(lease_seconds: int) -> str:
+    return (_now() + timedelta(seconds=lease_seconds)).isoformat()
+
+
+def replay(item: dict, stage: str, idempotency_key: str):
+    """Response for a duplicate submission, or None if this is not a duplicate"""
+    if not idempotency_key or not item:
+        return None
+    record = (item.get("idempotency") or {}).get(stage) or {}
+    if record.get("key") != idempotency_key:
+        return None
+    if record.get("result"):
+        return record["result"]
+    if item.get("status") == f"{stage}_processing":
+        return {
+            "status": "in_flight",
+            "city_id": item["id"],
+            "stage": stage,
+            "message": "Already running - returning the in-flight job",
+            "lease_owner": item.get("lease_owner"),
+            "lease_expires_at": item.get("lease_expires_at"),
+        }
+    return None
+
+
+async def claim(db, city_id: str, stage: str, status_filter, lease_seconds: int, idempotency_key: str = None,
+                resume_status: str = None):
+    """
+    Atomically move a queue item into `{stage}_processing`.
+
+    `status_filter` is the condition on `status` for a fresh claim; an item
+    already processing this stage may also be taken over once its lease
+    has expired. `resume_status` is where the reaper puts the item back
+    if the job dies (default: derived from the stage). Returns the claimed
+    document, or None if it was not claimable.
+    """
+    now = _now().isoformat()
+    fields = {
+        "status": f"{stage}_processing",
+        "progress": 10,
+        "lease_owner": WORKER_ID,
+        "lease_expires_at": lease_expiry(lease_seconds),
+        "updated_at": now,
+    }
+    if idempotency_key:
+        fields[f"idempotency.{stage}"] = {"key": idempotency_key}
+    if resume_status:
+        fields["resume_status"] = resume_status
+    item = await db.queue.find_one_and_update(
+        {"id": city_id, "$or": [
+            {"status": status_filter},
+            {"status": f"{stage}_processing", "lease_expires_at": {"$lt": now}},
+        ]},
+        {"$set": fields, "$inc": {f"attempts.{stage}": 1}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if item:
+        item.pop("_id", None)
+    return item
+
+
+def owned(city_id: str) -> dict:
+    """Filter matching a queue item only while this worker holds its lease"""
+    return {"id": city_id, "lease_owner": WORKER_ID}
+
+
+RELEASED = {"lease_owner": None, "lease_expires_at": None, "resume_status": None}
+
+
+def start_heartbeat(db, city_id: str, lease_seconds: int) -> asyncio.Task:
+    """Keep extending the lease until the returned task is cancelled"""
+    async def beat():
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            try:
+                result = await db.queue.update_one(
+                    owned(city_id), {"$set": {"lease_expires_at": lease_expiry(lease_seconds)}}
+                )
+                if result.matched_count == 0:
+                    logger.warning(f"Lost lease on {city_id}")
+                    return
+            except Exception as e:
+                logger.error(f"Heartbeat error for {city_id}: {e}")
+    return asyncio.create_task(beat())
+
+
+async def reap_expired_leases(db, lease_seconds: int) -> int:
+    """Return items whose worker stopped heart-beating to a retryable state"""
+    now = _now()
+    legacy_cutoff = (now - timedelta(seconds=lease_seconds)).isoformat()
+    expired = db.queue.find(
+        {"status": {"$in": IN_FLIGHT_STATUSES}, "$or": [
+            {"lease_expires_at": {"$lt": now.isoformat()}},
+            # Items claimed before leases existed: fall back to updated_at
+            {"lease_expires_at": None, "updated_at": {"$lt": legacy_cutoff}},
+        ]},
+        {"_id": 0, "id": 1, "status": 1, "lease_owner": 1, "lease_expires_at": 1, "spaced_svg_path": 1,
+         "resume_status": 1},
+    )
+    reaped = 0
+    async for item in expired:
+        if item.get("resume_status"):
+            retry_status = item["resume_status"]
+        elif item["status"] == "stage1_processing":
+            retry_status = "waiting"
+        else:
+            retry_status = "spacing_applied" if item.get("spaced_svg_path") else "stage1_complete"
+        # Conditional on the lease we saw, so a fresh heartbeat wins the race
+        result = await db.queue.update_one(
+            {"id": item["id"], "status": item["status"], "lease_expires_at": item.get("lease_expires_at")},
+            {"$set": {
+                "status": retry_status,
+                "error_message": f"Worker {item.get('lease_owner') or 'unknown'} stopped responding; ready to retry",
+                "updated_at": now.isoformat(),
+                **RELEASED,
+            }},
+        )
+        if result.modified_count:
+            reaped += 1
+            logger.warning(f"Reaped expired lease on {item['id']} ({item['status']} -> {retry_status})")
+    return reaped
@@ -0,0 +1,67 @@
+"""
+Deferred imports for heavy pipeline dependencies.
+
+`google.genai`, `pdfplumber`, `PIL` and the NumPy-based geometry modules
+cost most of the API's cold start, yet `/health` and the public read
+routes never touch them. `LazyModule` stands in for such a module and
+imports it on first attribute access; `warm_up` loads everything that is
+still pending, e.g. from a background thread after startup.
+
+Set LAZY_IMPORTS=0 to import eagerly (used by bench/startup.py to compare).
+"""
+import importlib
+import os
+import threading
+import time
+
+LAZY = os.environ.get('LAZY_IMPORTS', '1') != '0'
+
+_registry = []
+
+
+class LazyModule:
+    # Attribute names are prefixed so they never shadow the wrapped module's
+    def __init__(self, name: str):
+        self._lazy_name = name
+        self._lazy_module = None
+        self._lazy_lock = threading.Lock()
+        self._lazy_ms = None
+        _registry.append(self)
+        if not LAZY:
+            self._lazy_load()
+
+    def _lazy_load(self):
+        if self._lazy_module is None:
+            with self._lazy_lock:
+                if self._lazy_module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self._lazy_name)
+                    self._lazy_ms = round((time.perf_counter() - started) * 1000, 1)
+                    self._lazy_module = module
+        return self._lazy_module
+
+    def __getattr__(self, attr):
+        return getattr(self._lazy_load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._lazy_module is not None else "pending"
+        return f"<LazyModule {self._lazy_name} ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+def status() -> dict:
+    """{module name: load time in ms, or None if not loaded yet}"""
+    return {m._lazy_name: m._lazy_ms for m in _registry}
+
+
+def all_loaded() -> bool:
+    return all(m._lazy_module is not None for m in _registry)
+
+
+def warm_up():
+    """Import every pending module (blocking; run it in a thread)"""
+    for module in _registry:
+        module._lazy_load()
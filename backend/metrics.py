@@ -0,0 +1,173 @@
+"""
+Prometheus instrumentation for the API, the processing pipeline, Gemini and MongoDB.
+
+Everything here is designed to stay on in production: histograms are
+observed with a single perf_counter() pair, Mongo timings come straight
+from pymongo's command events and HTTP latency is labelled by route
+template (not raw path) to keep label cardinality bounded.
+"""
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+
+# Pipeline stages run for seconds to minutes (Gemini), sub-steps for milliseconds
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+BYTES_BUCKETS = (1_000, 5_000, 20_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000, 20_000_000)
+
+PIPELINE_STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds",
+    "Time spent in each pipeline stage and sub-step",
+    ["stage", "step"],
+    buckets=STAGE_BUCKETS,
+)
+
+GEMINI_REQUESTS = Counter("gemini_requests_total", "Gemini generate_content calls", ["stage"])
+GEMINI_ERRORS = Counter("gemini_errors_total", "Failed Gemini calls", ["stage", "error"])
+GEMINI_PROMPT_BYTES = Histogram(
+    "gemini_prompt_bytes", "Size of text and inline data sent to Gemini", ["stage"], buckets=BYTES_BUCKETS
+)
+GEMINI_RESPONSE_BYTES = Histogram(
+    "gemini_response_bytes", "Size of the text returned by Gemini", ["stage"], buckets=BYTES_BUCKETS
+)
+
+GEMINI_PROMPT_CACHE = Counter(
+    "gemini_prompt_cache_total", "Prompt prefix cache lookups (hit, created, refreshed, fallback, ineligible)", ["stage", "outcome"]
+)
+
+QUEUE_DEPTH = Gauge("queue_items", "Queue items by status", ["status"])
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+
+ADMISSION_ADMITTED = Counter(
+    "admission_admitted_total", "Requests admitted by the rate limiter and bulkheads", ["route_class"]
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total", "Requests answered 429 by admission control", ["route_class", "reason"]
+)
+BULKHEAD_IN_FLIGHT = Gauge("bulkhead_in_flight", "Requests in flight per bulkhead", ["route_class"])
+
+SINGLEFLIGHT_CALLS = Counter(
+    "singleflight_calls_total", "Coalescable calls: leaders ran the work, coalesced ones shared it", ["group", "role"]
+)
+
+MONGO_COMMAND_SECONDS = Histogram(
+    "mongodb_command_duration_seconds",
+    "MongoDB command latency as reported by the driver",
+    ["command", "outcome"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+class JobTimer:
+    """
+    Records named, timed spans for one pipeline job.
+
+    Every span is also observed into pipeline_stage_seconds, so the same
+    instrumentation feeds both the per-job breakdown stored on the queue
+    document and the aggregate Prometheus histograms.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.spans = []
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            ended = time.perf_counter()
+            PIPELINE_STAGE_SECONDS.labels(self.stage, name).observe(ended - started)
+            self.spans.append({
+                "name": name,
+                "start_ms": round((started - self._t0) * 1000, 1),
+                "duration_ms": round((ended - started) * 1000, 1),
+            })
+
+    def finish(self) -> dict:
+        """Observe the stage total and return the document to store on the job"""
+        total = time.perf_counter() - self._t0
+        PIPELINE_STAGE_SECONDS.labels(self.stage, "total").observe(total)
+        return {
+            "started_at": self.started_at,
+            "total_ms": round(total * 1000, 1),
+            "spans": self.spans,
+        }
+
+
+def payload_size(contents) -> int:
+    """Approximate request size for a generate_content `contents` argument"""
+    if isinstance(contents, (str, bytes)):
+        return len(contents)
+    if isinstance(contents, (list, tuple)):
+        return sum(payload_size(c) for c in contents)
+    inline = getattr(contents, "inline_data", None)
+    if inline is not None and inline.data:
+        return len(inline.data)
+    text = getattr(contents, "text", None)
+    return len(text) if isinstance(text, str) else 0
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener feeding mongodb_command_duration_seconds"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_SECONDS.labels(event.command_name, "success").observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_COMMAND_SECONDS.labels(event.command_name, "failure").observe(event.duration_micros / 1e6)
+
+
+class PrometheusMiddleware:
+    """Pure ASGI middleware recording per-route HTTP latency"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status["code"]),
+            ).observe(time.perf_counter() - started)
+
+
+def set_queue_depth(counts: dict):
+    """Replace the queue_items gauge with fresh per-status counts"""
+    QUEUE_DEPTH.clear()
+    for status, count in counts.items():
+        QUEUE_DEPTH.labels(status or "unknown").set(count)
+
+
+def render() -> tuple:
+    """Return (body, content type) in Prometheus text exposition format"""
+    return generate_latest(), CONTENT_TYPE_LATEST
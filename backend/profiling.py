@@ -0,0 +1,84 @@
+"""
+Low-overhead sampling profiler for pipeline jobs.
+
+A daemon thread periodically grabs the stacks (via sys._current_frames)
+of the thread running the event loop and of the worker threads behind
+asyncio.to_thread, and counts identical stacks. Each stack is rooted at
+`event-loop` or `to_thread`, so parsing, dedupe and serialisation done
+off the loop show up next to the loop's own work. Idle workers are not
+counted. The result is written in the "folded" format
+(`frame;frame;frame count`) that flamegraph.pl, speedscope and inferno
+render directly as flamegraphs.
+
+Because every request shares the event loop, samples taken while a job is
+awaiting I/O show the loop idling in the selector - or other requests
+running - which is exactly the information needed to tell "waiting on
+Gemini" apart from "burning CPU in pdfplumber". Work in other processes
+(bulk_respace's process pool) is not sampled.
+"""
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+def _is_worker(thread: threading.Thread) -> bool:
+    # asyncio's default executor names its threads asyncio_0, asyncio_1, ...
+    return thread.name.startswith("asyncio_")
+
+
+def _running_task(stack: list) -> bool:
+    # An idle executor thread is parked in _worker -> queue.get; a busy one runs a work item
+    return any(code.co_name == "run" and code.co_filename.endswith("thread.py") for code in stack)
+
+
+class SamplingProfiler:
+    """Samples the loop thread and to_thread workers every `interval` seconds until stopped"""
+
+    def __init__(self, thread_id: int = None, interval: float = 0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            workers = [t.ident for t in threading.enumerate() if _is_worker(t)]
+            sampled = False
+            for ident, root in ((self.thread_id, "event-loop"), *((w, "to_thread") for w in workers)):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                if not stack or (root == "to_thread" and not _running_task(stack)):
+                    continue
+                self.stacks[";".join([root, *(_frame_label(code) for code in reversed(stack))])] += 1
+                sampled = True
+            self.samples += sampled
+
+    def folded(self) -> str:
+        """Collapsed stacks, one `stack count` line each"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def write(self, path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(self.folded())
+        return path
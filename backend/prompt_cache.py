@@ -0,0 +1,124 @@
+"""
+Provider-side context caching of stable prompt prefixes.
+
+Every Stage 1 call for a style starts with the same preamble and style
+PDF text; only the image and a short per-city suffix change. The prefix
+is registered once as a Gemini cached content (`caches.create`) and later
+requests reference it by name, so only the suffix and the image travel.
+
+Gemini only caches contexts of at least a minimum size (4096 tokens for
+the 2.0 models), and a Stage 1 prefix is usually far smaller: a preamble
+plus at most 5000 characters of style text, about 1.5k tokens. Prefixes
+estimated below `min_tokens` are therefore not offered to `caches.create`
+at all. They are sent inline and counted as "ineligible", not as
+failures, so they don't block caching for the model. Long style guides
+that do qualify get the cache.
+
+Entries are keyed by API key, model and prefix hash, so editing a style
+or changing the key simply starts a new cache. An entry close to expiry
+has its TTL extended (`caches.update`); if that fails it is re-created.
+When caching is unavailable (model or prompt not eligible, stub without
+support, quota) `get` returns None, the caller sends the full prompt, and
+creation is not retried for that model for `retry_after` seconds. A
+request is retried inline only if its error says the cache itself is gone
+(`cache_missing`).
+
+Configs are passed as dicts so this module doesn't import google.genai.
+"""
+import hashlib
+import logging
+import time
+
+import metrics
+import singleflight
+
+logger = logging.getLogger(__name__)
+
+# Rough size of a token in prompt text, for the eligibility check without a count_tokens call
+CHARS_PER_TOKEN = 4
+
+
+class PromptCache:
+    def __init__(self, ttl_seconds: int = 3600, refresh_margin_seconds: int = 300, retry_after_seconds: int = 600,
+                 min_tokens: int = 4096):
+        self.ttl = ttl_seconds
+        self.min_tokens = min_tokens
+        self.refresh_margin = refresh_margin_seconds
+        self.retry_after = retry_after_seconds
+        self._entries = {}  # key -> {"name", "expires"} (monotonic)
+        self._unavailable_until = {}  # model -> monotonic
+        self._flights = singleflight.Group("prompt_cache")
+
+    def eligible(self, prefix: str) -> bool:
+        """Whether `prefix` is (estimated) large enough for the provider to cache"""
+        return len(prefix) / CHARS_PER_TOKEN >= self.min_tokens
+
+    @staticmethod
+    def key(api_key: str, model: str, prefix: str) -> str:
+        return hashlib.sha256(f"{api_key}\0{model}\0{prefix}".encode()).hexdigest()
+
+    async def get(self, client, api_key: str, model: str, prefix: str, stage: str, display_name: str = ""):
+        """Cached content name for `prefix`, creating or refreshing it; None to send the prefix inline"""
+        if self.ttl <= 0:
+            return None
+        if not self.eligible(prefix):
+            metrics.GEMINI_PROMPT_CACHE.labels(stage, "ineligible").inc()
+            return None
+        now = time.monotonic()
+        if self._unavailable_until.get(model, 0) > now:
+            metrics.GEMINI_PROMPT_CACHE.labels(stage, "fallback").inc()
+            return None
+        key = self.key(api_key, model, prefix)
+        entry = self._entries.get(key)
+        if entry and entry["expires"] - now > self.refresh_margin:
+            metrics.GEMINI_PROMPT_CACHE.labels(stage, "hit").inc()
+            return entry["name"]
+        # One create/refresh per prefix, however many jobs need it at once
+        name = await self._flights.do(key, self._ensure, client, model, prefix, key, stage, display_name)
+        if name is None:
+            metrics.GEMINI_PROMPT_CACHE.labels(stage, "fallback").inc()
+        return name
+
+    async def _ensure(self, client, model: str, prefix: str, key: str, stage: str, display_name: str):
+        entry = self._entries.get(key)
+        if entry and entry["expires"] - time.monotonic() > self.refresh_margin:
+            return entry["name"]
+        if entry and entry["expires"] > time.monotonic():
+            try:
+                await client.aio.caches.update(name=entry["name"], config={"ttl": f"{self.ttl}s"})
+                entry["expires"] = time.monotonic() + self.ttl
+                metrics.GEMINI_PROMPT_CACHE.labels(stage, "refreshed").inc()
+                return entry["name"]
+            except Exception as e:
+                logger.warning(f"Could not refresh prompt cache {entry['name']}, re-creating: {e}")
+        self._entries.pop(key, None)
+        try:
+            cached = await client.aio.caches.create(model=model, config={
+                "contents": [prefix],
+                "ttl": f"{self.ttl}s",
+                "display_name": display_name[:128],
+            })
+        except Exception as e:
+            logger.warning(f"Prompt caching unavailable for {model}, sending prompts inline: {e}")
+            self._unavailable_until[model] = time.monotonic() + self.retry_after
+            return None
+        self._entries[key] = {"name": cached.name, "expires": time.monotonic() + self.ttl}
+        metrics.GEMINI_PROMPT_CACHE.labels(stage, "created").inc()
+        logger.info(f"Created prompt cache {cached.name} ({display_name or model})")
+        return cached.name
+
+    def invalidate(self, name: str):
+        """Forget a cache the provider no longer knows (expired or deleted early)"""
+        for key in [k for k, entry in self._entries.items() if entry["name"] == name]:
+            del self._entries[key]
+
+
+def cache_missing(error) -> bool:
+    """
+    Whether a provider error says the referenced cached content is gone
+    (expired or deleted early): NOT_FOUND, or the 403 "CachedContent not
+    found" Gemini answers for an expired cache. Other errors (bad prompt,
+    quota, auth) have nothing to do with the cache.
+    """
+    text = str(error).lower().replace("_", "").replace(" ", "")
+    return "cachedcontent" in text and (getattr(error, "code", None) == 404 or "notfound" in text)
@@ -1,5 +1,5 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, Form, Response
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, Form, Header, Query, Response
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse, ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -11,26 +11,49 @@ from typing import List, Optional
 import uuid
 from datetime import datetime, timezone
 import base64
+import contextlib
 import io
 import re
 import json
-import pdfplumber
-from PIL import Image
-import xml.etree.ElementTree as ET
+import math
+import orjson
+import asyncio
+import time
+
+import admission
+import artifact_gc
+import artifacts
+import job_leases
+import lazy_imports
+import metrics
+import profiling
+import prompt_cache
+import singleflight
+from lazy_imports import lazy_import
+
+# Heavy pipeline dependencies load on first use (or via the startup warm-up)
+pdfplumber = lazy_import("pdfplumber")
+Image = lazy_import("PIL.Image")
+geometry = lazy_import("geometry")
+dedupe = lazy_import("dedupe")
+toolpath = lazy_import("toolpath")
+tiling = lazy_import("tiling")
+photo_hash = lazy_import("photo_hash")
+svg_compact = lazy_import("svg_compact")
 
 # Gemini integration
-from google import genai
+genai = lazy_import("google.genai")
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[metrics.MongoCommandMetrics()])
 db = client[os.environ['DB_NAME']]
 
 # Create the main app
-app = FastAPI(title="Layered Relief Art API")
+app = FastAPI(title="Layered Relief Art API", default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -41,11 +64,95 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 (UPLOAD_DIR / "cities").mkdir(exist_ok=True)
 (UPLOAD_DIR / "styles").mkdir(exist_ok=True)
 (UPLOAD_DIR / "processed").mkdir(exist_ok=True)
+(UPLOAD_DIR / "cache").mkdir(exist_ok=True)  # regenerable derivatives, evicted first under quota
+
+# Artifact garbage collection (0 disables the periodic run / the quota)
+GC_INTERVAL_SECONDS = int(os.environ.get('GC_INTERVAL_SECONDS', '3600'))
+GC_GRACE_SECONDS = int(os.environ.get('GC_GRACE_SECONDS', '3600'))
+UPLOAD_QUOTA_BYTES = int(float(os.environ.get('UPLOAD_QUOTA_MB', '0')) * 1024 * 1024)
+
+# Job leases: a stage holds its queue item for this long between heartbeats
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '120'))
+REAPER_INTERVAL_SECONDS = int(os.environ.get('REAPER_INTERVAL_SECONDS', '30'))
+
+# Auto pipeline: how many Stage 1 -> spacing -> Stage 2 chains run at once
+AUTO_PIPELINE_CONCURRENCY = int(os.environ.get('AUTO_PIPELINE_CONCURRENCY', '2'))
+
+# Import pipeline dependencies in the background right after startup (0 = on first use)
+PIPELINE_WARMUP = os.environ.get('PIPELINE_WARMUP', '1') != '0'
+
+# Duplicate/overlapping segment removal tolerance in SVG units (0 disables)
+DEDUPE_TOLERANCE = float(os.environ.get('DEDUPE_TOLERANCE', '0.5'))
+
+# Admission control: per-IP token buckets ("rate/burst", per second) and bulkheads per route class
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') != '0'
+RATE_LIMIT_TRUST_FORWARDED = os.environ.get('RATE_LIMIT_TRUST_FORWARDED', '0') == '1'
+ROUTE_LIMITS = {
+    route_class: admission.RouteLimit(
+        *admission.parse_rate(os.environ.get(f'RATE_LIMIT_{route_class.upper()}', rate)),
+        int(os.environ.get(f'BULKHEAD_{route_class.upper()}', concurrency))
+    )
+    for route_class, rate, concurrency in [
+        ("public", "10/40", "64"),
+        ("downloads", "5/20", "16"),
+        ("pipeline", "0.5/5", "4"),
+    ]
+}
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Single-flight groups: concurrent identical reads / artifact builds share one computation
+read_flights = singleflight.Group("reads")
+artifact_flights = singleflight.Group("artifacts")
+
+def json_response(body: bytes) -> Response:
+    """Response for a body already encoded (and possibly shared) by a single-flight call"""
+    return Response(content=body, media_type="application/json")
+
+# Gemini endpoint override (e.g. the stub server used by bench/loadtest.py)
+GEMINI_BASE_URL = os.environ.get('GEMINI_BASE_URL')
+GEMINI_MODEL = "gemini-2.0-flash-exp"
+
+# Decimals kept in stored SVG coordinates (every point within 0.5 * 10^-precision)
+SVG_PRECISION = int(os.environ.get('SVG_PRECISION', '2'))
+SVG_SIZE_COMPARE = os.environ.get('SVG_SIZE_COMPARE', '').lower() in ('1', 'true', 'yes')
+
+# Laser speed profiles for cut-time estimates: {name: {cut_mm_s, travel_mm_s, pierce_s}};
+# MACHINE_PROFILES may name a JSON file of profiles to use instead
+DEFAULT_MACHINE_PROFILES = {
+    "co2_40w_3mm_plywood": {"cut_mm_s": 8, "travel_mm_s": 200, "pierce_s": 0.3},
+    "co2_80w_3mm_plywood": {"cut_mm_s": 20, "travel_mm_s": 400, "pierce_s": 0.15},
+    "diode_10w_3mm_plywood": {"cut_mm_s": 3, "travel_mm_s": 100, "pierce_s": 0.5},
+}
+MACHINE_PROFILES = (
+    json.loads(Path(os.environ['MACHINE_PROFILES']).read_text())
+    if os.environ.get('MACHINE_PROFILES') else DEFAULT_MACHINE_PROFILES
+)
+
+# Max concurrent Gemini calls from this process (tiled stages fan out)
+GEMINI_CONCURRENCY = int(os.environ.get('GEMINI_CONCURRENCY', '4'))
+
+# Stage 1 tiling: photos wider or taller than this many pixels are cut into
+# overlapping tiles vectorised concurrently (0 disables)
+STAGE1_TILE_PIXELS = int(os.environ.get('STAGE1_TILE_PIXELS', '0'))
+STAGE1_TILE_OVERLAP = float(os.environ.get('STAGE1_TILE_OVERLAP', '0.05'))
+
+# Stage 2 tiling: spaced SVGs larger than this many bytes are split into
+# overlapping strips separated concurrently (0 disables)
+STAGE2_TILE_BYTES = int(os.environ.get('STAGE2_TILE_BYTES', '0'))
+STAGE2_TILE_OVERLAP = float(os.environ.get('STAGE2_TILE_OVERLAP', '0.1'))
+
+# Provider-side caching of the per-style Stage 1 prompt prefix (TTL 0 disables)
+PROMPT_CACHE_TTL_SECONDS = int(os.environ.get('PROMPT_CACHE_TTL_SECONDS', '3600'))
+PROMPT_CACHE_REFRESH_SECONDS = int(os.environ.get('PROMPT_CACHE_REFRESH_SECONDS', '300'))
+PROMPT_CACHE_MIN_TOKENS = int(os.environ.get('PROMPT_CACHE_MIN_TOKENS', '4096'))
+
+# Uploads whose photo hash is within this many bits (of 64) of an existing
+# city are flagged as near-duplicates (negative disables the lookup)
+DUPLICATE_MAX_DISTANCE = int(os.environ.get('DUPLICATE_MAX_DISTANCE', '6'))
+
 # Admin credentials from environment (safe for public repo)
 ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL', 'admin@example.com')
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'changeme123')
@@ -72,6 +179,7 @@ class StyleResponse(BaseModel):
     description: str
     filename: str
     thumbnail: Optional[str] = None
+    auto_expansion_percentage: Optional[int] = None  # set = cities run the auto pipeline by default
     created_at: str
 
 class SpacingInput(BaseModel):
@@ -83,13 +191,30 @@ class QueueItem(BaseModel):
     city_name: str
     style_id: str
     style_name: str
-    status: str  # waiting, stage1_processing, stage1_complete, spacing_applied, stage2_processing, done, error
+    status: str  # waiting, stage1_processing, stage1_complete, spacing_processing, spacing_applied, stage2_processing, done, error
     progress: int = 0
     expansion_percentage: Optional[int] = None
     error_message: Optional[str] = None
+    timings: Optional[dict] = None  # per-stage {started_at, total_ms, spans, profile?}
+    svg_sizes: Optional[dict] = None  # per-artifact compact serialisation report
+    builds: Optional[dict] = None  # per-node build records {key, inputs, params, outputs, digest}
+    lease_owner: Optional[str] = None  # worker running the current stage
+    lease_expires_at: Optional[str] = None
+    auto_pipeline: Optional[dict] = None  # {expansion_percentage, review} when chained automatically
+    duplicate_of: Optional[List[str]] = None  # near-duplicate cities found at upload
     created_at: str
     updated_at: str
 
+class BuildInput(BaseModel):
+    target: str = "layers"  # stage1, spaced or layers
+    expansion_percentage: Optional[int] = None  # default: the item's current (or auto pipeline) spacing
+
+class ReviewInput(BaseModel):
+    review: bool = True
+
+class ProfilerInput(BaseModel):
+    jobs: int = 1  # profile the next N pipeline jobs (0 cancels)
+
 class ProcessedCity(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str
@@ -107,6 +232,43 @@ async def get_api_keys():
     settings = await db.settings.find_one({}, {"_id": 0})
     return settings or {}
 
+style_texts = {}  # (pdf path, mtime) -> extracted text
+
+async def style_text(style: dict) -> str:
+    """Style PDF text, extracted once per file version"""
+    if not style or not style.get("filepath"):
+        return ""
+    path = style["filepath"]
+    try:
+        key = (path, os.stat(path).st_mtime_ns)
+    except OSError:
+        return ""
+    if key not in style_texts:
+        style_texts[key] = await extract_text_from_pdf(path)
+    return style_texts[key]
+
+def stage1_prompt(style_text: str) -> str:
+    """Stable Stage 1 prompt prefix for a style (cached provider-side)"""
+    style_instructions = f"Apply this artistic style: {style_text}" if style_text else "Use clean architectural line art style"
+    
+    return f"""You are a vector line art specialist creating clean SVG artwork for laser cutting.
+
+Transform the city skyline photograph that follows into a clean vector line art SVG.
+
+{style_instructions}
+
+OUTPUT REQUIREMENTS:
+1. Create a valid SVG file with the viewBox given with the photograph
+2. Use ONLY black strokes (stroke="#000000") on transparent/white background
+3. NO fills, NO gradients, NO raster images - LINES ONLY
+4. Draw clean, precise outlines of each building
+5. Include architectural details (windows, edges) as simple lines
+6. Make it suitable for laser cutting
+7. Preserve exact positions and proportions of buildings
+
+Return ONLY the complete SVG code starting with <?xml and ending with </svg>
+Do not include any explanation or markdown - just the raw SVG."""
+
 async def extract_text_from_pdf(pdf_path: str) -> str:
     """Extract text from PDF file"""
     text_content = []
@@ -121,124 +283,234 @@ async def extract_text_from_pdf(pdf_path: str) -> str:
         logger.error(f"PDF extraction error: {e}")
         return ""
 
-def expand_horizontal_spacing(svg_content: str, expansion_percentage: int) -> dict:
+def gemini_client(api_key: str):
+    """Gemini client, pointed at GEMINI_BASE_URL when set"""
+    if GEMINI_BASE_URL:
+        return genai.Client(api_key=api_key, http_options=genai.types.HttpOptions(base_url=GEMINI_BASE_URL))
+    return genai.Client(api_key=api_key)
+
+gemini_prompt_cache = prompt_cache.PromptCache(
+    PROMPT_CACHE_TTL_SECONDS, PROMPT_CACHE_REFRESH_SECONDS, min_tokens=PROMPT_CACHE_MIN_TOKENS
+)
+gemini_slots = asyncio.Semaphore(GEMINI_CONCURRENCY)
+
+async def generate_with_gemini(api_key: str, stage: str, contents, temperature: float,
+                               prefix: str = None, prefix_name: str = "") -> str:
     """
-    Expands horizontal distance between elements in SVG uniformly
-    WITHOUT distorting shapes - only X-axis translation
-    
-    Returns dict with new SVG and aspect ratio info
+    Call Gemini and record request/error counts and payload sizes.
+
+    `prefix` is a stable leading prompt; it is sent as a cached content
+    reference when the provider cache is available, inline otherwise.
     """
-    if expansion_percentage == 0:
-        # Parse to get dimensions
-        viewbox_match = re.search(r'viewBox="([^"]+)"', svg_content)
-        if viewbox_match:
-            parts = viewbox_match.group(1).split()
-            if len(parts) >= 4:
-                width, height = float(parts[2]), float(parts[3])
-                return {
-                    "svg": svg_content,
-                    "original_width": width,
-                    "new_width": width,
-                    "height": height,
-                    "original_aspect_ratio": f"{width:.0f}:{height:.0f}",
-                    "new_aspect_ratio": f"{width:.0f}:{height:.0f}"
-                }
-        return {"svg": svg_content, "original_width": 1000, "new_width": 1000, "height": 1000}
+    client = gemini_client(api_key)
+    cache_name = None
+    if prefix:
+        cache_name = await gemini_prompt_cache.get(client, api_key, GEMINI_MODEL, prefix, stage, prefix_name)
+        if not cache_name:
+            contents = [prefix, *contents]
+    metrics.GEMINI_REQUESTS.labels(stage).inc()
+    metrics.GEMINI_PROMPT_BYTES.labels(stage).observe(metrics.payload_size(contents))
+    try:
+        async with gemini_slots:
+            result = await client.aio.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=contents,
+                config=genai.types.GenerateContentConfig(temperature=temperature, cached_content=cache_name)
+            )
+    except Exception as e:
+        metrics.GEMINI_ERRORS.labels(stage, type(e).__name__).inc()
+        if cache_name and isinstance(e, genai.errors.ClientError) and prompt_cache.cache_missing(e):
+            # The cache expired or was deleted under us: retry once with the prefix inline
+            logger.warning(f"Cached prompt {cache_name} rejected ({e}), retrying inline")
+            gemini_prompt_cache.invalidate(cache_name)
+            return await generate_with_gemini(api_key, stage, [prefix, *contents], temperature)
+        raise
+    response = result.text or ""
+    metrics.GEMINI_RESPONSE_BYTES.labels(stage).observe(len(response.encode()))
+    return response
+
+# Job timing & profiling
+PROFILE_DIR = UPLOAD_DIR / "cache" / "profiles"
+profile_jobs_remaining = 0
+
+def start_job(stage: str):
+    """Start timing a pipeline job; also profile it if the admin asked for that"""
+    global profile_jobs_remaining
+    profiler = None
+    if profile_jobs_remaining > 0:
+        profile_jobs_remaining -= 1
+        profiler = profiling.SamplingProfiler().start()
+    return metrics.JobTimer(stage), profiler
+
+async def finish_job(city_id: str, timer: metrics.JobTimer, profiler):
+    """Store the job's timing spans (and flamegraph, if profiled) on its queue document"""
+    timings = timer.finish()
+    if profiler:
+        profiler.stop()
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        profile_path = profiler.write(PROFILE_DIR / f"{city_id}_{timer.stage}_{stamp}.folded")
+        timings["profile"] = profile_path.name
+        timings["profile_samples"] = profiler.samples
+    try:
+        await db.queue.update_one({"id": city_id}, {"$set": {f"timings.{timer.stage}": timings}})
+    except Exception as e:
+        logger.error(f"Could not store timings for {city_id}: {e}")
+
+async def reject_claim(city_id: str, stage: str, idempotency_key: Optional[str], detail: str):
+    """A claim failed: answer a duplicate submission, otherwise report the conflict"""
+    item = await db.queue.find_one({"id": city_id}, {"_id": 0})
+    duplicate = job_leases.replay(item, stage, idempotency_key)
+    if duplicate:
+        return duplicate
+    raise HTTPException(status_code=409, detail=detail)
+
+def tile_suffix(tile, width: int, height: int) -> str:
+    """Per-tile Stage 1 instructions: the tile is drawn on its own viewBox and placed back afterwards"""
+    tile_width, tile_height = tile.size
+    x0, y0, x1, y1 = tile.window
+    return (
+        f'Photograph size: {tile_width}x{tile_height} pixels. Use viewBox="0 0 {tile_width} {tile_height}".\n'
+        f"This photograph is one tile (x {x0}-{x1}, y {y0}-{y1}) of a {width}x{height} panorama; "
+        f"draw everything visible in it, including buildings cut off at its edges, right up to the edges."
+    )
+
+def extract_svg_from_response(response: str) -> str:
+    """Pull the SVG document out of a Stage 1 Gemini response"""
+    svg_content = response.strip()
+    
+    # Clean up response if needed
+    if "```" in svg_content:
+        # Extract SVG from markdown code block
+        svg_match = re.search(r'```(?:svg|xml)?\s*([\s\S]*?)```', svg_content)
+        if svg_match:
+            svg_content = svg_match.group(1).strip()
+    
+    # Ensure it starts with XML declaration or SVG tag
+    if not svg_content.startswith('<?xml') and not svg_content.startswith('<svg'):
+        # Try to find SVG content
+        svg_start = svg_content.find('<svg')
+        if svg_start != -1:
+            svg_content = svg_content[svg_start:]
     
+    # Add XML declaration if missing
+    if not svg_content.startswith('<?xml'):
+        svg_content = '<?xml version="1.0" encoding="UTF-8"?>\n' + svg_content
+    return svg_content
+
+def parse_layers_response(response: str, input_svg: str) -> dict:
+    """Parse the Stage 2 JSON object of layer SVGs, falling back to the input SVG"""
+    response_text = response.strip()
+    
+    # Clean up markdown if present
+    if "```" in response_text:
+        json_match = re.search(r'```(?:json)?\s*([\s\S]*?)```', response_text)
+        if json_match:
+            response_text = json_match.group(1).strip()
+    
+    # Try to extract JSON
     try:
-        # Parse viewBox to get dimensions
-        viewbox_match = re.search(r'viewBox="([^"]+)"', svg_content)
-        if not viewbox_match:
-            # Try width/height attributes
-            width_match = re.search(r'width="(\d+)"', svg_content)
-            height_match = re.search(r'height="(\d+)"', svg_content)
-            orig_width = float(width_match.group(1)) if width_match else 1000
-            orig_height = float(height_match.group(1)) if height_match else 1000
-            min_x, min_y = 0, 0
-        else:
-            vb_parts = viewbox_match.group(1).split()
-            min_x, min_y = float(vb_parts[0]), float(vb_parts[1])
-            orig_width, orig_height = float(vb_parts[2]), float(vb_parts[3])
-        
-        # Calculate expansion factor
-        expansion_factor = 1 + (expansion_percentage / 100)
-        new_width = orig_width * expansion_factor
-        center_x = orig_width / 2
-        
-        # Function to shift X coordinates in path data
-        def shift_path_x(match):
-            cmd = match.group(1)
-            coords = match.group(2)
-            
-            # Parse coordinates
-            numbers = re.findall(r'-?\d+\.?\d*', coords)
-            if not numbers:
-                return match.group(0)
-            
-            new_numbers = []
-            for i, num in enumerate(numbers):
-                val = float(num)
-                # For commands that use X coordinates (even indices for most commands)
-                if cmd.upper() in ['M', 'L', 'T'] and i % 2 == 0:
-                    # Shift X based on distance from center
-                    distance_from_center = val - center_x
-                    new_distance = distance_from_center * expansion_factor
-                    val = center_x + new_distance - distance_from_center + val
-                    val = val + (distance_from_center * (expansion_factor - 1))
-                new_numbers.append(f"{val:.2f}")
-            
-            return f"{cmd}{' '.join(new_numbers)}"
-        
-        # Apply transformation to all transform attributes
-        def add_transform(match):
-            element = match.group(0)
-            # Find x position in element
-            x_match = re.search(r'\bx="(-?\d+\.?\d*)"', element)
-            if x_match:
-                x_val = float(x_match.group(1))
-                distance_from_center = x_val - center_x
-                shift = distance_from_center * (expansion_factor - 1)
-                new_x = x_val + shift
-                element = re.sub(r'\bx="(-?\d+\.?\d*)"', f'x="{new_x:.2f}"', element)
-            
-            # Handle transform translate
-            transform_match = re.search(r'transform="translate\((-?\d+\.?\d*)', element)
-            if transform_match:
-                tx = float(transform_match.group(1))
-                distance_from_center = tx - center_x
-                shift = distance_from_center * (expansion_factor - 1)
-                new_tx = tx + shift
-                element = re.sub(r'transform="translate\((-?\d+\.?\d*)', f'transform="translate({new_tx:.2f}', element)
-            
-            return element
-        
-        # Modify SVG
-        modified_svg = svg_content
-        
-        # Update viewBox
-        new_viewbox = f"{min_x} {min_y} {new_width:.2f} {orig_height}"
-        if viewbox_match:
-            modified_svg = re.sub(r'viewBox="[^"]+"', f'viewBox="{new_viewbox}"', modified_svg)
-        
-        # Update width attribute if present
-        modified_svg = re.sub(r'width="(\d+)"', f'width="{int(new_width)}"', modified_svg)
-        
-        # Apply transforms to groups and elements with x attributes
-        modified_svg = re.sub(r'<(g|rect|text|use|image)[^>]*>', add_transform, modified_svg)
+        # Find JSON object
+        json_start = response_text.find('{')
+        json_end = response_text.rfind('}') + 1
+        if json_start != -1 and json_end > json_start:
+            response_text = response_text[json_start:json_end]
         
+        return json.loads(response_text)
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON parse error: {e}, response: {response_text[:500]}")
+        # Fallback: create simple layers from input
         return {
-            "svg": modified_svg,
-            "original_width": orig_width,
-            "new_width": new_width,
-            "height": orig_height,
-            "original_aspect_ratio": f"{orig_width:.0f}:{orig_height:.0f}",
-            "new_aspect_ratio": f"{new_width:.0f}:{orig_height:.0f}",
-            "viewbox": new_viewbox
+            "layer_1": input_svg,
+            "layer_2": input_svg,
+            "layer_3": input_svg
         }
-        
+
+def spacing_result(original: "geometry.GeometryStore", spaced: "geometry.GeometryStore", svg: str) -> dict:
+    """Dimensions and aspect ratios before/after spacing"""
+    _, _, orig_width, orig_height = original.viewbox
+    new_width = spaced.viewbox[2]
+    return {
+        "svg": svg,
+        "original_width": orig_width,
+        "new_width": new_width,
+        "height": orig_height,
+        "original_aspect_ratio": f"{orig_width:.0f}:{orig_height:.0f}",
+        "new_aspect_ratio": f"{new_width:.0f}:{orig_height:.0f}",
+        "viewbox": spaced.viewbox_attr
+    }
+
+def expand_horizontal_spacing(svg_content: str, expansion_percentage: int) -> dict:
+    """
+    Expands horizontal distance between buildings in SVG uniformly
+    WITHOUT distorting shapes - each building is only translated along X
+    
+    Returns dict with new SVG and aspect ratio info
+    """
+    try:
+        store = geometry.parse_svg(svg_content)
     except Exception as e:
         logger.error(f"Spacing expansion error: {e}")
         return {"svg": svg_content, "error": str(e)}
+    
+    if expansion_percentage == 0:
+        return spacing_result(store, store, svg_content)
+    spaced = store.expand_horizontal(expansion_percentage)
+    return spacing_result(store, spaced, svg_compact.serialize(spaced, SVG_PRECISION))
+
+def export_svg(store: "geometry.GeometryStore") -> tuple:
+    """Compact SVG text for a stored artifact, with its size report"""
+    svg = svg_compact.serialize(store, SVG_PRECISION)
+    return svg, svg_compact.size_report(store, svg, SVG_PRECISION, SVG_SIZE_COMPARE)
+
+def clean_svg(svg_content: str, store=None):
+    """
+    Parse into the geometry store (unless given), drop duplicate/overlapping
+    segments and re-serialise compactly; returns (svg, store, dedupe report, size report)
+    """
+    if store is None:
+        store = geometry.parse_svg(svg_content)
+    report = None
+    if DEDUPE_TOLERANCE > 0:
+        store, report = dedupe.dedupe_store(store, DEDUPE_TOLERANCE)
+    svg_content, size = export_svg(store)
+    return svg_content, store, report, size
+
+def load_geometry(item: dict, key: str, svg_path: str) -> "geometry.GeometryStore":
+    """Parsed geometry for an SVG artifact, parsing the SVG only if no store was saved"""
+    if item.get(key) and Path(item[key]).exists():
+        return geometry.load(item[key])
+    with open(svg_path, "r") as f:
+        return geometry.parse_svg(f.read())
+
+# Incremental builds: each stage records the digests of its input and
+# parameters (artifacts.py) and keeps a copy of its files by build key,
+# so a node seen before is restored instead of recomputed
+build_cache = artifacts.BuildCache(UPLOAD_DIR / "cache" / "builds")
+
+def build_paths(city_id: str, node: str) -> dict:
+    """Output files of a pipeline node, by output name"""
+    processed = UPLOAD_DIR / "processed"
+    if node == "layers":
+        return {f"layer_{n}": processed / f"{city_id}_layer_{n}.svg" for n in (1, 2, 3)}
+    return {"svg": processed / f"{city_id}_{node}.svg", "geometry": processed / f"{city_id}_{node}.npz"}
+
+def stage1_params(prompt: str) -> dict:
+    return {
+        "model": GEMINI_MODEL, "temperature": 0.7, "prompt": artifacts.text_digest(prompt),
+        "tile_pixels": STAGE1_TILE_PIXELS, "tile_overlap": STAGE1_TILE_OVERLAP,
+        "dedupe_tolerance": DEDUPE_TOLERANCE, "dedupe_scope": "building", "precision": SVG_PRECISION,
+    }
+
+def spacing_params(expansion_percentage: int) -> dict:
+    return {"expansion_percentage": expansion_percentage, "precision": SVG_PRECISION}
+
+def stage2_params() -> dict:
+    # The template with empty inputs stands in for the prompt: the SVG itself is the node's input
+    return {
+        "model": GEMINI_MODEL, "temperature": 0.3, "prompt": artifacts.text_digest(stage2_prompt("", "")),
+        "tile_bytes": STAGE2_TILE_BYTES, "tile_overlap": STAGE2_TILE_OVERLAP,
+        "dedupe_tolerance": DEDUPE_TOLERANCE, "dedupe_scope": "building", "precision": SVG_PRECISION,
+    }
 
 # API Routes
 
@@ -246,6 +518,15 @@ def expand_horizontal_spacing(svg_content: str, expansion_percentage: int) -> di
 async def root():
     return {"message": "Layered Relief Art API - 2-Stage Gemini Process"}
 
+@api_router.get("/ready")
+async def ready(require: Optional[str] = None):
+    """Readiness: serving as soon as the app is up, pipeline-ready once heavy modules are imported"""
+    pipeline_ready = lazy_imports.all_loaded()
+    body = {"serving": True, "pipeline_ready": pipeline_ready, "modules": lazy_imports.status()}
+    if require == "pipeline" and not pipeline_ready:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
 @api_router.get("/health")
 async def health():
     return {"status": "healthy"}
@@ -302,7 +583,8 @@ async def get_settings():
 async def upload_style(
     file: UploadFile = File(...),
     name: str = Form(...),
-    description: str = Form("")
+    description: str = Form(""),
+    auto_expansion_percentage: Optional[int] = Form(None)
 ):
     """Upload a style PDF"""
     if not file.content_type or "pdf" not in file.content_type.lower():
@@ -327,6 +609,7 @@ async def upload_style(
         "filename": filename,
         "filepath": str(filepath),
         "text_preview": text_preview[:500],
+        "auto_expansion_percentage": auto_expansion_percentage,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.styles.insert_one(doc)
@@ -353,12 +636,112 @@ async def delete_style(style_id: str):
     await db.styles.delete_one({"id": style_id})
     return {"message": "Style deleted"}
 
+# Near-duplicate photos: multi-index of dHash chunks (photo_hash.PhotoIndex), loaded from Mongo
+# incrementally (by created_at) so uploads handled by other workers are seen
+photo_index = None
+DUPLICATE_FIELDS = {"_id": 0, "id": 1, "city_name": 1, "style_id": 1, "style_name": 1, "status": 1}
+
+async def sync_photo_index():
+    """Add photo hashes stored since the last sync (all of them the first time)"""
+    global photo_index
+    index = photo_index or photo_hash.PhotoIndex(DUPLICATE_MAX_DISTANCE)
+    query = {"photo_hash": {"$type": "string"}}
+    if index.synced_until:
+        query["created_at"] = {"$gte": index.synced_until}
+    latest = index.synced_until
+    for collection in (db.queue, db.processed):
+        async for doc in collection.find(query, {"_id": 0, "id": 1, "photo_hash": 1, "created_at": 1}):
+            index.add(doc["photo_hash"], doc["id"])
+            latest = max(latest or doc["created_at"], doc["created_at"])
+    index.synced_until = latest
+    photo_index = index
+    return index
+
+async def find_duplicates(content_hash: str, style_id: str) -> list:
+    """Existing cities whose photo is within DUPLICATE_MAX_DISTANCE bits, nearest first"""
+    index = await read_flights.do("photo_index", sync_photo_index)
+    matches = index.find(content_hash, DUPLICATE_MAX_DISTANCE)[:20]
+    if not matches:
+        return []
+    ids = [city_id for _, city_id in matches]
+    processed = {doc["id"]: doc async for doc in db.processed.find({"id": {"$in": ids}}, DUPLICATE_FIELDS)}
+    queued = {doc["id"]: doc async for doc in db.queue.find({"id": {"$in": ids}}, DUPLICATE_FIELDS)}
+    duplicates = []
+    for bits, city_id in matches:
+        doc = processed.get(city_id) or queued.get(city_id)
+        if doc is None:
+            index.discard(city_id)  # deleted since it was indexed
+            continue
+        duplicates.append({
+            "id": city_id,
+            "city_name": doc["city_name"],
+            "style_id": doc["style_id"],
+            "style_name": doc["style_name"],
+            "status": "done" if city_id in processed else doc.get("status"),
+            "processed": city_id in processed,
+            "same_style": doc["style_id"] == style_id,
+            "distance": bits,
+        })
+    if duplicates:
+        logger.info(f"Upload matches {len(duplicates)} existing cities: {[d['id'] for d in duplicates]}")
+    return duplicates
+
+async def backfill_photo_hashes():
+    """Hash photos uploaded before duplicate detection existed"""
+    await db.queue.create_index("created_at")
+    hashed = 0
+    for collection in (db.queue, db.processed):
+        async for doc in collection.find({"photo_hash": {"$exists": False}}, {"_id": 0, "id": 1, "original_filepath": 1}):
+            path = Path(doc.get("original_filepath") or "")
+            if not path.is_file():
+                continue
+            try:
+                content_hash = await asyncio.to_thread(lambda: photo_hash.dhash(path.read_bytes()))
+            except Exception as e:
+                logger.warning(f"Could not hash {path}: {e}")
+                continue
+            await db.queue.update_one({"id": doc["id"]}, {"$set": {"photo_hash": content_hash}})
+            await db.processed.update_one({"id": doc["id"]}, {"$set": {"photo_hash": content_hash}})
+            # Older than the sync watermark, so add directly
+            if photo_index is not None:
+                photo_index.add(content_hash, doc["id"])
+            hashed += 1
+    if hashed:
+        logger.info(f"Backfilled {hashed} photo hashes")
+    await read_flights.do("photo_index", sync_photo_index)
+
 # City Upload & Queue
+MAX_PHOTO_BYTES = 50 * 1024 * 1024
+
+def new_queue_doc(city_id: str, city_name: str, style: dict, filepath: Path, auto_pipeline: Optional[dict],
+                  content_hash: Optional[str], duplicates: list) -> dict:
+    """Queue document for a freshly uploaded photo (also used by bulk_import)"""
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "id": city_id,
+        "city_name": city_name,
+        "style_id": style["id"],
+        "style_name": style["name"],
+        "original_filepath": str(filepath),
+        "status": "waiting",
+        "progress": 0,
+        "expansion_percentage": None,
+        "error_message": None,
+        "auto_pipeline": auto_pipeline,
+        "photo_hash": content_hash,
+        "duplicate_of": [d["id"] for d in duplicates] or None,
+        "created_at": now,
+        "updated_at": now
+    }
+
 @api_router.post("/cities/upload")
 async def upload_city(
     file: UploadFile = File(...),
     city_name: str = Form(...),
-    style_id: str = Form(...)
+    style_id: str = Form(...),
+    auto: Optional[bool] = Form(None),
+    expansion_percentage: Optional[int] = Form(None),
+    review: bool = Form(False)
 ):
     """Upload a city photo and add to processing queue"""
     if not file.content_type or not file.content_type.startswith("image/"):
@@ -369,9 +752,18 @@ async def upload_city(
         raise HTTPException(status_code=404, detail="Style not found")
     
     content = await file.read()
-    if len(content) > 50 * 1024 * 1024:
+    if len(content) > MAX_PHOTO_BYTES:
         raise HTTPException(status_code=413, detail="Max 50MB please")
     
+    # Perceptual hash off the event loop; near-duplicates are flagged, not rejected
+    content_hash, duplicates = None, []
+    try:
+        content_hash = await asyncio.to_thread(photo_hash.dhash, content)
+    except Exception as e:
+        logger.warning(f"Could not hash upload {file.filename}: {e}")
+    if content_hash and DUPLICATE_MAX_DISTANCE >= 0:
+        duplicates = await find_duplicates(content_hash, style_id)
+    
     city_id = str(uuid.uuid4())
     ext = file.filename.split(".")[-1] if "." in file.filename else "jpg"
     filename = f"{city_id}.{ext}"
@@ -379,23 +771,24 @@ async def upload_city(
     with open(filepath, "wb") as f:
         f.write(content)
     
-    now = datetime.now(timezone.utc).isoformat()
-    queue_doc = {
-        "id": city_id,
-        "city_name": city_name,
-        "style_id": style_id,
-        "style_name": style["name"],
-        "original_filepath": str(filepath),
-        "status": "waiting",
-        "progress": 0,
-        "expansion_percentage": None,
-        "error_message": None,
-        "created_at": now,
-        "updated_at": now
-    }
-    await db.queue.insert_one(queue_doc)
+    # Auto mode: explicit form flag, otherwise the style's default
+    style_percentage = style.get("auto_expansion_percentage")
+    auto_pipeline = None
+    run_auto = auto if auto is not None else style_percentage is not None
+    if run_auto:
+        auto_pipeline = {
+            "expansion_percentage": expansion_percentage if expansion_percentage is not None else (style_percentage or 0),
+            "review": review,
+        }
     
-    return {"id": city_id, "city_name": city_name, "message": "Added to queue!"}
+    await db.queue.insert_one(new_queue_doc(city_id, city_name, style, filepath, auto_pipeline, content_hash, duplicates))
+    if content_hash and photo_index is not None:
+        photo_index.add(content_hash, city_id)
+    
+    if auto_pipeline:
+        schedule_auto_pipeline(city_id)
+        return {"id": city_id, "city_name": city_name, "auto_pipeline": auto_pipeline, "duplicates": duplicates, "message": "Added to queue - processing automatically!"}
+    return {"id": city_id, "city_name": city_name, "duplicates": duplicates, "message": "Added to queue!"}
 
 @api_router.get("/queue", response_model=List[QueueItem])
 async def get_queue():
@@ -405,279 +798,534 @@ async def get_queue():
 
 @api_router.delete("/queue/{item_id}")
 async def cancel_queue_item(item_id: str):
-    """Cancel a queue item"""
+    """Cancel a queue item (its files are reclaimed by the next GC run)"""
     result = await db.queue.delete_one({"id": item_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Item not found")
     return {"message": "Cancelled"}
 
+@api_router.post("/queue/{item_id}/review")
+async def set_review_flag(item_id: str, body: ReviewInput):
+    """Flag an auto item to pause after Stage 1, or approve it to continue"""
+    result = await db.queue.update_one(
+        {"id": item_id, "auto_pipeline": {"$ne": None}},
+        {"$set": {"auto_pipeline.review": body.review, "updated_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Auto pipeline item not found")
+    if not body.review:
+        schedule_auto_pipeline(item_id)
+    return {"id": item_id, "review": body.review}
+
+# Artifact Garbage Collection
+last_gc_report = {}
+
+async def run_gc():
+    """Run one GC pass and remember its report"""
+    global last_gc_report
+    last_gc_report = await artifact_gc.collect_garbage(
+        db, UPLOAD_DIR, quota_bytes=UPLOAD_QUOTA_BYTES, grace_seconds=GC_GRACE_SECONDS
+    )
+    return last_gc_report
+
+@api_router.post("/admin/gc")
+async def trigger_gc():
+    """Delete orphaned files now and enforce the disk quota"""
+    return await run_gc()
+
+@api_router.get("/admin/gc")
+async def get_gc_report():
+    """Report from the most recent GC run"""
+    return last_gc_report or {"message": "GC has not run yet"}
+
+# Profiler (admin)
+@api_router.post("/admin/profiler")
+async def arm_profiler(body: ProfilerInput):
+    """Run the next N pipeline jobs under the sampling profiler"""
+    global profile_jobs_remaining
+    profile_jobs_remaining = max(0, body.jobs)
+    return {"jobs_remaining": profile_jobs_remaining}
+
+@api_router.get("/admin/profiler")
+async def get_profiler():
+    """Profiler state and the saved flamegraph files (newest first)"""
+    profiles = sorted(PROFILE_DIR.glob("*.folded"), key=lambda p: p.stat().st_mtime, reverse=True) if PROFILE_DIR.exists() else []
+    return {
+        "jobs_remaining": profile_jobs_remaining,
+        "profiles": [{"name": p.name, "size": p.stat().st_size} for p in profiles[:50]]
+    }
+
+@api_router.get("/admin/profiler/{name}")
+async def download_profile(name: str):
+    """Download a folded-stack profile (render with flamegraph.pl or speedscope)"""
+    path = PROFILE_DIR / name
+    if "/" in name or not name.endswith(".folded") or not path.exists():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=name)
+
 # STAGE 1: Gemini Style Transfer
+async def generate_stage1(city_id: str, settings: dict, style: dict, prompt: str, image_bytes: bytes,
+                          img, file_ext: str, timer, paths: dict) -> tuple:
+    """Gemini style transfer of a claimed item's photo; writes the Stage 1 files, returns (outputs, queue fields)"""
+    img_width, img_height = img.size
+    
+    # Large photos: one call per overlapping tile, cropped in worker threads
+    tiles = None
+    if STAGE1_TILE_PIXELS and max(img_width, img_height) > STAGE1_TILE_PIXELS:
+        tiles = tiling.plan_tiles(img_width, img_height, STAGE1_TILE_PIXELS, STAGE1_TILE_OVERLAP)
+        with timer.span("tiling"):
+            await asyncio.to_thread(img.load)
+            tile_images = await asyncio.gather(*[asyncio.to_thread(tiling.crop_tile, img, tile) for tile in tiles])
+        logger.info(f"Stage 1 for {city_id}: {img_width}x{img_height} photo split into {len(tiles)} tiles")
+    
+    with timer.span("mongo_update"):
+        await db.queue.update_one({"id": city_id}, {"$set": {"progress": 30}})
+    
+    # Gemini Style Transfer: the per-style prompt is the (cached) prefix,
+    # only the dimensions and the photo are sent per city
+    suffix = f'Photograph size: {img_width}x{img_height} pixels. Use viewBox="0 0 {img_width} {img_height}".'
+    
+    # Determine MIME type from file extension
+    mime_types = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.webp': 'image/webp'}
+    mime_type = mime_types.get(file_ext, 'image/jpeg')
+    
+    # Create image content
+    image_part = genai.types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+    
+    prefix_name = f"stage1 {style['name'] if style else 'default'}"
+    if tiles:
+        tile_parts = [
+            [tile_suffix(tile, img_width, img_height), genai.types.Part.from_bytes(data=data, mime_type="image/jpeg")]
+            for tile, data in zip(tiles, tile_images)
+        ]
+        with timer.span("gemini_call"):
+            responses = await asyncio.gather(*[
+                generate_with_gemini(settings["gemini_api_key"], "stage1", contents, 0.7,
+                                     prefix=prompt, prefix_name=prefix_name)
+                for contents in tile_parts
+            ])
+    else:
+        with timer.span("gemini_call"):
+            response = await generate_with_gemini(
+                settings["gemini_api_key"], "stage1", [suffix, image_part], 0.7,
+                prefix=prompt, prefix_name=prefix_name
+            )
+    
+    with timer.span("mongo_update"):
+        await db.queue.update_one({"id": city_id}, {"$set": {"progress": 70}})
+    
+    merged = None
+    with timer.span("parse"):
+        if tiles:
+            merged = await asyncio.to_thread(
+                tiling.merge_tiles, tiles, [extract_svg_from_response(r) for r in responses], img_width, img_height
+            )
+            svg_content = merged.to_svg()
+        else:
+            svg_content = extract_svg_from_response(response)
+    
+    # Parse once into the columnar store used by spacing and Stage 2,
+    # dropping segments Gemini drew twice (and outlines split at tile seams)
+    store = dedupe_report = size_report = None
+    with timer.span("geometry"):
+        try:
+            svg_content, store, dedupe_report, size_report = await asyncio.to_thread(clean_svg, svg_content, merged)
+        except Exception as e:
+            logger.warning(f"Could not parse Stage 1 geometry for {city_id}: {e}")
+    
+    # Save Stage 1 SVG
+    outputs = {"svg": paths["svg"]}
+    with timer.span("file_write"):
+        with open(paths["svg"], "w") as f:
+            f.write(svg_content)
+        if store:
+            store.save(paths["geometry"])
+            outputs["geometry"] = paths["geometry"]
+    
+    return outputs, {
+        "dedupe.stage1": dedupe_report,
+        "svg_sizes.stage1": size_report,
+        "stage1_tiles": len(tiles) if tiles else None,
+    }
+
 @api_router.post("/process/stage1/{city_id}")
-async def process_stage1(city_id: str):
-    """Stage 1: Convert photo to vector line art SVG using Gemini"""
+async def process_stage1(city_id: str, idempotency_key: Optional[str] = Header(None), force: bool = False):
+    """
+    Stage 1: Convert photo to vector line art SVG using Gemini. A re-run
+    restores the cached drawing unless `force` is set (the dashboard's
+    "Regenerate" button), which asks Gemini for a new one.
+    """
     item = await db.queue.find_one({"id": city_id}, {"_id": 0})
     if not item:
         raise HTTPException(status_code=404, detail="City not found in queue")
     
+    duplicate = job_leases.replay(item, "stage1", idempotency_key)
+    if duplicate:
+        return duplicate
+    
     settings = await get_api_keys()
     if not settings.get("gemini_api_key"):
         raise HTTPException(status_code=400, detail="Gemini API key not configured")
     
+    # Atomically take the item so concurrent clicks/workers can't run it twice
+    item = await job_leases.claim(
+        db, city_id, "stage1", {"$nin": job_leases.IN_FLIGHT_STATUSES}, JOB_LEASE_SECONDS, idempotency_key
+    )
+    if not item:
+        return await reject_claim(city_id, "stage1", idempotency_key, "This city is already being processed")
+    
+    heartbeat = job_leases.start_heartbeat(db, city_id, JOB_LEASE_SECONDS)
+    timer, profiler = start_job("stage1")
     try:
-        await db.queue.update_one(
-            {"id": city_id},
-            {"$set": {"status": "stage1_processing", "progress": 10, "updated_at": datetime.now(timezone.utc).isoformat()}}
-        )
-        
         # Get style PDF text
-        style = await db.styles.find_one({"id": item["style_id"]}, {"_id": 0})
-        style_text = ""
-        if style and style.get("filepath"):
-            style_text = await extract_text_from_pdf(style["filepath"])
-        
-        # Read original image
-        with open(item["original_filepath"], "rb") as f:
-            image_bytes = f.read()
-        image_b64 = base64.b64encode(image_bytes).decode()
+        with timer.span("mongo_read"):
+            style = await db.styles.find_one({"id": item["style_id"]}, {"_id": 0})
+        with timer.span("pdf_extraction"):
+            prompt = stage1_prompt(await style_text(style))
         
-        # Get image dimensions
-        img = Image.open(io.BytesIO(image_bytes))
-        img_width, img_height = img.size
+        # Read original image and get its dimensions
+        with timer.span("image_read"):
+            with open(item["original_filepath"], "rb") as f:
+                image_bytes = f.read()
+            img = Image.open(io.BytesIO(image_bytes))
+            img_width, img_height = img.size
         
-        await db.queue.update_one({"id": city_id}, {"$set": {"progress": 30}})
-        
-        # Gemini Style Transfer
-        client = genai.Client(api_key=settings["gemini_api_key"])
-        
-        style_instructions = f"Apply this artistic style: {style_text}" if style_text else "Use clean architectural line art style"
-        
-        prompt = f"""You are a vector line art specialist creating clean SVG artwork for laser cutting.
-
-Transform this city skyline photograph into a clean vector line art SVG.
-
-{style_instructions}
-
-OUTPUT REQUIREMENTS:
-1. Create a valid SVG file with viewBox="0 0 {img_width} {img_height}"
-2. Use ONLY black strokes (stroke="#000000") on transparent/white background
-3. NO fills, NO gradients, NO raster images - LINES ONLY
-4. Draw clean, precise outlines of each building
-5. Include architectural details (windows, edges) as simple lines
-6. Make it suitable for laser cutting
-7. Preserve exact positions and proportions of buildings
-
-Return ONLY the complete SVG code starting with <?xml and ending with </svg>
-Do not include any explanation or markdown - just the raw SVG."""
-
-        # Determine MIME type from file extension
-        file_ext = Path(item["original_filepath"]).suffix.lower()
-        mime_types = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.webp': 'image/webp'}
-        mime_type = mime_types.get(file_ext, 'image/jpeg')
-        
-        # Create image content
-        image_part = genai.types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
-        
-        result = await client.aio.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=[prompt, image_part],
-            config=genai.types.GenerateContentConfig(temperature=0.7)
-        )
-        response = result.text
-        
-        await db.queue.update_one({"id": city_id}, {"$set": {"progress": 70}})
-        
-        # Extract SVG from response
-        svg_content = response.strip()
-        
-        # Clean up response if needed
-        if "```" in svg_content:
-            # Extract SVG from markdown code block
-            svg_match = re.search(r'```(?:svg|xml)?\s*([\s\S]*?)```', svg_content)
-            if svg_match:
-                svg_content = svg_match.group(1).strip()
-        
-        # Ensure it starts with XML declaration or SVG tag
-        if not svg_content.startswith('<?xml') and not svg_content.startswith('<svg'):
-            # Try to find SVG content
-            svg_start = svg_content.find('<svg')
-            if svg_start != -1:
-                svg_content = svg_content[svg_start:]
-        
-        # Add XML declaration if missing
-        if not svg_content.startswith('<?xml'):
-            svg_content = '<?xml version="1.0" encoding="UTF-8"?>\n' + svg_content
-        
-        # Save Stage 1 SVG
-        stage1_filename = f"{city_id}_stage1.svg"
-        stage1_filepath = UPLOAD_DIR / "processed" / stage1_filename
-        with open(stage1_filepath, "w") as f:
-            f.write(svg_content)
-        
-        # Update queue
-        await db.queue.update_one(
-            {"id": city_id},
-            {"$set": {
-                "status": "stage1_complete",
-                "progress": 100,
-                "stage1_svg_path": str(stage1_filepath),
-                "original_width": img_width,
-                "original_height": img_height,
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
-        )
+        # Same photo, prompt and settings as an earlier build: restore its files instead of calling Gemini
+        paths = build_paths(city_id, "stage1")
+        inputs, params = {"photo": artifacts.bytes_digest(image_bytes)}, stage1_params(prompt)
+        key = artifacts.node_key("stage1", inputs, params)
+        cached = None
+        if not force:
+            with timer.span("build_cache"):
+                cached = await asyncio.to_thread(build_cache.restore, city_id, "stage1", key, paths)
+        if cached:
+            logger.info(f"Stage 1 for {city_id}: restored build {key[:12]}")
+            build, fields = cached["build"], cached["meta"]
+            outputs = {name: paths[name] for name in cached["files"]}
+        else:
+            outputs, fields = await generate_stage1(
+                city_id, settings, style, prompt, image_bytes, img,
+                Path(item["original_filepath"]).suffix.lower(), timer, paths
+            )
+            with timer.span("build_cache"):
+                build = await asyncio.to_thread(artifacts.record, key, inputs, params, outputs)
+                await asyncio.to_thread(build_cache.save, city_id, "stage1", build, outputs, fields)
         
-        return {
+        result = {
             "status": "stage1_complete",
             "city_id": city_id,
             "message": "Stage 1 complete - Vector line art generated!",
             "next_step": "adjust_spacing",
-            "original_dimensions": {"width": img_width, "height": img_height}
+            "original_dimensions": {"width": img_width, "height": img_height},
+            "build": "restored" if cached else "built"
+        }
+        
+        # Update queue and release the lease
+        updates = {
+            "status": "stage1_complete",
+            "progress": 100,
+            "stage1_svg_path": str(outputs["svg"]),
+            "stage1_geometry_path": str(outputs["geometry"]) if "geometry" in outputs else None,
+            **fields,
+            "builds.stage1": build,
+            "original_width": img_width,
+            "original_height": img_height,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+            **job_leases.RELEASED
         }
+        if idempotency_key:
+            updates["idempotency.stage1.result"] = result
+        update = {"$set": updates}
+        # A different drawing invalidates the spaced SVG made from the previous one
+        previous = (item.get("builds") or {}).get("stage1")
+        if not previous or previous["digest"] != build["digest"]:
+            update["$unset"] = {"spaced_svg_path": "", "spaced_geometry_path": ""}
+        with timer.span("mongo_update"):
+            await db.queue.update_one(job_leases.owned(city_id), update)
+        
+        return result
         
     except Exception as e:
         logger.error(f"Stage 1 error: {e}")
         await db.queue.update_one(
-            {"id": city_id},
-            {"$set": {"status": "error", "error_message": str(e), "updated_at": datetime.now(timezone.utc).isoformat()}}
+            job_leases.owned(city_id),
+            {"$set": {"status": "error", "error_message": str(e), "updated_at": datetime.now(timezone.utc).isoformat(), **job_leases.RELEASED}}
         )
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        heartbeat.cancel()
+        await finish_job(city_id, timer, profiler)
+
+# SVG previews: raw image/svg+xml streamed from disk, metadata in headers or /meta
+PREVIEW_META_FIELDS = {
+    "stage1": ("original_width", "original_height", "original_aspect_ratio"),
+    "spacing": ("expansion_percentage", "original_width", "new_width", "original_height", "new_aspect_ratio"),
+}
+RANGE_HEADER = re.compile(r"bytes=(\d*)-(\d*)$")
+FILE_CHUNK_SIZE = 64 * 1024
+
+def iter_file_range(path: Path, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(FILE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+def ranged_file_response(path: Path, range_header: Optional[str], media_type: str, headers: dict) -> Response:
+    """FileResponse (sendfile where the server supports it), or 206/416 for a single byte range"""
+    size = path.stat().st_size
+    headers = {"Accept-Ranges": "bytes", **headers}
+    match = RANGE_HEADER.match(range_header.strip()) if range_header else None
+    # Multi-range and malformed headers are ignored: the full file is a valid answer
+    if not match or match.groups() == ("", ""):
+        return FileResponse(path, media_type=media_type, headers=headers)
+    first, last = match.groups()
+    if first == "":
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)})
+    return StreamingResponse(
+        iter_file_range(path, start, end - start + 1), status_code=206, media_type=media_type, headers=headers
+    )
 
-# Get Stage 1 SVG preview
-@api_router.get("/process/stage1/{city_id}/preview")
-async def get_stage1_preview(city_id: str):
-    """Get Stage 1 SVG content for preview"""
-    item = await db.queue.find_one({"id": city_id}, {"_id": 0})
+async def find_preview(city_id: str, stage: str):
+    """(SVG path, metadata) for a queue item's Stage 1 or spaced preview"""
+    item = await db.queue.find_one(
+        {"id": city_id},
+        {"_id": 0, "stage1_svg_path": 1, "spaced_svg_path": 1, **{f: 1 for f in PREVIEW_META_FIELDS[stage]}}
+    )
     if not item:
         raise HTTPException(status_code=404, detail="City not found")
-    
-    if not item.get("stage1_svg_path"):
-        raise HTTPException(status_code=400, detail="Stage 1 not complete yet")
-    
-    svg_path = Path(item["stage1_svg_path"])
+    if stage == "stage1":
+        if not item.get("stage1_svg_path"):
+            raise HTTPException(status_code=400, detail="Stage 1 not complete yet")
+        svg_path = item["stage1_svg_path"]
+    else:
+        svg_path = item.get("spaced_svg_path") or item.get("stage1_svg_path")
+        if not svg_path:
+            raise HTTPException(status_code=400, detail="No SVG available")
+    svg_path = Path(svg_path)
     if not svg_path.exists():
         raise HTTPException(status_code=404, detail="SVG file not found")
-    
-    with open(svg_path, "r") as f:
-        svg_content = f.read()
-    
+    meta = {field: item.get(field) for field in PREVIEW_META_FIELDS[stage]}
+    if stage == "spacing":
+        meta["expansion_percentage"] = meta["expansion_percentage"] or 0
+    return svg_path, meta
+
+def preview_headers(meta: dict) -> dict:
+    """Metadata as X-* headers, e.g. original_width -> X-Original-Width"""
     return {
-        "svg": svg_content,
-        "original_width": item.get("original_width", 1000),
-        "original_height": item.get("original_height", 1000)
+        "X-" + "-".join(part.capitalize() for part in field.split("_")): str(value)
+        for field, value in meta.items() if value is not None
     }
 
+async def preview_response(city_id: str, stage: str, range_header: Optional[str]) -> Response:
+    svg_path, meta = await read_flights.do((f"{stage}_preview", city_id), find_preview, city_id, stage)
+    return ranged_file_response(svg_path, range_header, "image/svg+xml", {
+        "Cache-Control": "no-cache",
+        **preview_headers(meta),
+    })
+
+@api_router.get("/process/stage1/{city_id}/preview")
+async def get_stage1_preview(city_id: str, range_header: Optional[str] = Header(None, alias="Range")):
+    """Stage 1 SVG for preview (image/svg+xml, Range supported); dimensions in X-Original-* headers"""
+    return await preview_response(city_id, "stage1", range_header)
+
+@api_router.get("/process/stage1/{city_id}/preview/meta")
+async def get_stage1_preview_meta(city_id: str):
+    """Dimensions of the Stage 1 preview"""
+    svg_path, meta = await read_flights.do(("stage1_preview", city_id), find_preview, city_id, "stage1")
+    return {**meta, "size_bytes": svg_path.stat().st_size}
+
 # Apply Spacing
+def write_text_atomic(path: Path, text: str):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+def build_spaced(city_id: str, item: dict, expansion_percentage: int, force: bool = False, timer=None) -> tuple:
+    """
+    Spaced SVG and geometry for an item's Stage 1 drawing, restored from the
+    build cache or computed and written atomically. Blocking: runs in a worker
+    thread (API) or process (bulk_respace). Returns (build record, queue fields, restored)
+    """
+    span = timer.span if timer else (lambda name: contextlib.nullcontext())
+    paths = build_paths(city_id, "spaced")
+    with span("build_cache"):
+        inputs = {"stage1": artifacts.outputs_digest({"svg": item["stage1_svg_path"]})}
+        params = spacing_params(expansion_percentage)
+        key = artifacts.node_key("spaced", inputs, params)
+        cached = None if force else build_cache.restore(city_id, "spaced", key, paths)
+    if cached:
+        return cached["build"], cached["meta"], True
+    
+    # Load the parsed Stage 1 geometry
+    with span("file_read"):
+        store = load_geometry(item, "stage1_geometry_path", item["stage1_svg_path"])
+    
+    # Apply spacing expansion on the arrays, then export SVG text
+    with span("transform"):
+        spaced = store.expand_horizontal(expansion_percentage)
+    with span("export"):
+        svg, size_report = export_svg(spaced)
+        result = spacing_result(store, spaced, svg)
+    
+    # Save spaced SVG and its geometry
+    with span("file_write"):
+        write_text_atomic(paths["svg"], svg)
+        spaced.save(paths["geometry"])
+    
+    fields = {
+        "svg_sizes.spaced": size_report,
+        "new_width": result.get("new_width"),
+        "original_aspect_ratio": result.get("original_aspect_ratio"),
+        "new_aspect_ratio": result.get("new_aspect_ratio"),
+    }
+    with span("build_cache"):
+        build = artifacts.record(key, inputs, params, paths)
+        build_cache.save(city_id, "spaced", build, paths, fields)
+    return build, fields, False
+
+# Statuses spacing can be (re-)applied from; published cities are republished by the next Stage 2
+SPACING_STATUSES = ["stage1_complete", "spacing_applied", "done"]
+
+def spacing_updates(city_id: str, expansion_percentage: int, build: dict, fields: dict, suspend_auto: bool = False) -> dict:
+    """
+    Queue fields for a freshly applied spacing; releases the spacing lease.
+    `suspend_auto` pauses an auto item for review, so re-spacing a published
+    city doesn't make the maintenance loop republish it with Stage 2.
+    """
+    paths = build_paths(city_id, "spaced")
+    updates = {
+        "status": "spacing_applied",
+        "progress": 100,
+        "error_message": None,
+        "expansion_percentage": expansion_percentage,
+        "spaced_svg_path": str(paths["svg"]),
+        "spaced_geometry_path": str(paths["geometry"]),
+        **fields,
+        "builds.spaced": build,
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+        **job_leases.RELEASED
+    }
+    if suspend_auto:
+        updates["auto_pipeline.review"] = True
+    return updates
+
+async def is_published(city_id: str) -> bool:
+    return await db.processed.find_one({"id": city_id}, {"_id": 1}) is not None
+
+async def claim_spacing(city_id: str, item: dict):
+    """Take the item for spacing from the status it is in now; None if that changed or a stage holds it"""
+    return await job_leases.claim(
+        db, city_id, "spacing", item["status"], JOB_LEASE_SECONDS, resume_status=item["status"]
+    )
+
+async def release_spacing(city_id: str, resume_status: str, error: str):
+    """Give up a spacing claim, leaving the item as it was"""
+    await db.queue.update_one(
+        job_leases.owned(city_id),
+        {"$set": {"status": resume_status, "error_message": f"Spacing failed: {error}",
+                  "updated_at": datetime.now(timezone.utc).isoformat(), **job_leases.RELEASED}}
+    )
+
 @api_router.post("/process/spacing/{city_id}")
-async def apply_spacing(city_id: str, spacing: SpacingInput):
-    """Apply horizontal spacing expansion to Stage 1 SVG"""
+async def apply_spacing(city_id: str, spacing: SpacingInput, force: bool = False):
+    """
+    Apply horizontal spacing expansion to Stage 1 SVG (`force` skips the build cache).
+    Finished cities can be re-spaced: the published layers stay until Stage 2
+    runs again, which republishes the city (reusing layers built for that
+    spacing before). Auto items re-spaced after publishing wait for review.
+    """
     item = await db.queue.find_one({"id": city_id}, {"_id": 0})
     if not item:
         raise HTTPException(status_code=404, detail="City not found")
     
-    if item.get("status") not in ["stage1_complete", "spacing_applied"]:
+    if item.get("status") in job_leases.IN_FLIGHT_STATUSES:
+        raise HTTPException(status_code=409, detail="This city is already being processed")
+    if item.get("status") not in SPACING_STATUSES:
         raise HTTPException(status_code=400, detail="Complete Stage 1 first")
     
     if not item.get("stage1_svg_path"):
         raise HTTPException(status_code=400, detail="Stage 1 SVG not found")
     
+    # Claim it so Stage 2 (or another spacing) can't read or write the spaced files meanwhile
+    claimed = await claim_spacing(city_id, item)
+    if not claimed:
+        raise HTTPException(status_code=409, detail="This city is already being processed")
+    
+    heartbeat = job_leases.start_heartbeat(db, city_id, JOB_LEASE_SECONDS)
+    timer, profiler = start_job("spacing")
     try:
-        # Read Stage 1 SVG
-        with open(item["stage1_svg_path"], "r") as f:
-            stage1_svg = f.read()
-        
-        # Apply spacing expansion
-        result = expand_horizontal_spacing(stage1_svg, spacing.expansion_percentage)
-        
-        # Save spaced SVG
-        spaced_filename = f"{city_id}_spaced.svg"
-        spaced_filepath = UPLOAD_DIR / "processed" / spaced_filename
-        with open(spaced_filepath, "w") as f:
-            f.write(result["svg"])
-        
-        # Update queue
-        await db.queue.update_one(
-            {"id": city_id},
-            {"$set": {
-                "status": "spacing_applied",
-                "expansion_percentage": spacing.expansion_percentage,
-                "spaced_svg_path": str(spaced_filepath),
-                "new_width": result.get("new_width"),
-                "original_aspect_ratio": result.get("original_aspect_ratio"),
-                "new_aspect_ratio": result.get("new_aspect_ratio"),
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
+        build, fields, restored = await asyncio.to_thread(
+            build_spaced, city_id, claimed, spacing.expansion_percentage, force, timer
         )
+        suspend_auto = bool(item.get("auto_pipeline")) and await is_published(city_id)
+        with timer.span("mongo_update"):
+            result = await db.queue.update_one(
+                job_leases.owned(city_id),
+                {"$set": spacing_updates(city_id, spacing.expansion_percentage, build, fields, suspend_auto)}
+            )
+        if not result.matched_count:
+            raise RuntimeError("Lost the lease on this city while spacing")
         
         return {
             "status": "spacing_applied",
             "expansion_percentage": spacing.expansion_percentage,
-            "original_aspect_ratio": result.get("original_aspect_ratio"),
-            "new_aspect_ratio": result.get("new_aspect_ratio"),
-            "new_width": result.get("new_width"),
-            "ready_for_stage2": True
+            "original_aspect_ratio": fields["original_aspect_ratio"],
+            "new_aspect_ratio": fields["new_aspect_ratio"],
+            "new_width": fields["new_width"],
+            "ready_for_stage2": True,
+            "build": "restored" if restored else "built",
+            "review": suspend_auto
         }
         
     except Exception as e:
         logger.error(f"Spacing error: {e}")
+        await release_spacing(city_id, item["status"], str(e))
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        heartbeat.cancel()
+        await finish_job(city_id, timer, profiler)
 
 # Get Spaced SVG preview
 @api_router.get("/process/spacing/{city_id}/preview")
-async def get_spaced_preview(city_id: str):
-    """Get spaced SVG content for preview"""
-    item = await db.queue.find_one({"id": city_id}, {"_id": 0})
-    if not item:
-        raise HTTPException(status_code=404, detail="City not found")
-    
-    svg_path = item.get("spaced_svg_path") or item.get("stage1_svg_path")
-    if not svg_path:
-        raise HTTPException(status_code=400, detail="No SVG available")
-    
-    with open(svg_path, "r") as f:
-        svg_content = f.read()
-    
-    return {
-        "svg": svg_content,
-        "expansion_percentage": item.get("expansion_percentage", 0),
-        "new_aspect_ratio": item.get("new_aspect_ratio")
-    }
+async def get_spaced_preview(city_id: str, range_header: Optional[str] = Header(None, alias="Range")):
+    """Spaced SVG (or Stage 1 if not spaced yet) for preview; spacing results in X-* headers"""
+    return await preview_response(city_id, "spacing", range_header)
+
+@api_router.get("/process/spacing/{city_id}/preview/meta")
+async def get_spaced_preview_meta(city_id: str):
+    """Expansion and dimensions of the spaced preview"""
+    svg_path, meta = await read_flights.do(("spacing_preview", city_id), find_preview, city_id, "spacing")
+    return {**meta, "size_bytes": svg_path.stat().st_size}
 
 # STAGE 2: Gemini Layer Separation
-@api_router.post("/process/stage2/{city_id}")
-async def process_stage2(city_id: str):
-    """Stage 2: Use Gemini to separate SVG into 3 layers based on building height"""
-    item = await db.queue.find_one({"id": city_id}, {"_id": 0})
-    if not item:
-        raise HTTPException(status_code=404, detail="City not found")
-    
-    if item.get("status") not in ["spacing_applied", "stage1_complete"]:
-        raise HTTPException(status_code=400, detail="Complete spacing adjustment first")
-    
-    settings = await get_api_keys()
-    if not settings.get("gemini_api_key"):
-        raise HTTPException(status_code=400, detail="Gemini API key not configured")
+def stage2_prompt(input_svg: str, viewbox: str, reference: tuple = None) -> str:
+    """Layer separation prompt; `reference` (street y, tallest top y) is given for strips of a wider skyline"""
+    if reference:
+        street, top = reference
+        measurement = f"""MEASUREMENT SYSTEM:
+This SVG is one vertical strip of a wider skyline. Measure against the WHOLE skyline,
+not just the buildings in this strip:
+- Street level (bottom) = 0, at y={street:g}
+- Tallest building in the whole skyline = 10, its top is at y={top:g}
+- Measure each building's height on this 0-10 scale
+"""
+    else:
+        measurement = """MEASUREMENT SYSTEM:
+- Street level (bottom) = 0
+- Tallest building in this skyline = 10
+- Measure each building's height on this 0-10 scale
+"""
     
-    try:
-        await db.queue.update_one(
-            {"id": city_id},
-            {"$set": {"status": "stage2_processing", "progress": 10, "updated_at": datetime.now(timezone.utc).isoformat()}}
-        )
-        
-        # Get the spaced SVG (or stage1 if no spacing applied)
-        svg_path = item.get("spaced_svg_path") or item.get("stage1_svg_path")
-        with open(svg_path, "r") as f:
-            input_svg = f.read()
-        
-        # Get viewBox for prompt
-        viewbox_match = re.search(r'viewBox="([^"]+)"', input_svg)
-        viewbox = viewbox_match.group(1) if viewbox_match else "0 0 1000 1000"
-        
-        await db.queue.update_one({"id": city_id}, {"$set": {"progress": 30}})
-        
-        # Gemini Layer Separation
-        client = genai.Client(api_key=settings["gemini_api_key"])
-        
-        prompt = f"""You are an expert at analyzing city skyline SVG artwork and separating buildings into depth layers for laser cutting.
+    return f"""You are an expert at analyzing city skyline SVG artwork and separating buildings into depth layers for laser cutting.
 
 You are analyzing a city skyline vector line art SVG for laser cutting.
 
@@ -686,11 +1334,7 @@ INPUT SVG:
 
 TASK: Create THREE separate SVG layers based on building HEIGHT.
 
-MEASUREMENT SYSTEM:
-- Street level (bottom) = 0
-- Tallest building in this skyline = 10
-- Measure each building's height on this 0-10 scale
-
+{measurement}
 LAYER SEPARATION RULES:
 
 LAYER 1 (Nearest/Foreground):
@@ -726,44 +1370,76 @@ Return ONLY a JSON object with three SVG strings:
 
 No explanation, no markdown - just the JSON object."""
 
-        result = await client.aio.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=prompt,
-            config=genai.types.GenerateContentConfig(temperature=0.3)
-        )
-        response = result.text
-        
+def stitch_layers(strips: list, responses: list, meta: dict) -> dict:
+    """Per-strip Stage 2 responses stitched into one SVG per layer"""
+    parsed = [parse_layers_response(response, strip.svg) for strip, response in zip(strips, responses)]
+    layers = {}
+    for layer_num in [1, 2, 3]:
+        fragments = [
+            data.get(f"layer_{layer_num}") or data.get(f"layer{layer_num}") or strip.svg
+            for strip, data in zip(strips, parsed)
+        ]
+        layers[f"layer_{layer_num}"] = tiling.stitch(strips, fragments, meta).to_svg()
+    return layers
+
+async def separate_layers(city_id: str, item: dict, settings: dict, svg_path: str, geometry_key: str,
+                          timer, paths: dict) -> dict:
+    """Gemini layer separation of a claimed item; writes the layer files, returns their queue fields"""
+    geometry_path = item.get(geometry_key)
+    source = None
+    with timer.span("file_read"):
+        if geometry_path and Path(geometry_path).exists():
+            # The prompt gets absolute coordinates: easier for the model to
+            # place buildings than the relative paths stored on disk
+            source = await asyncio.to_thread(geometry.load, geometry_path)
+            input_svg = await asyncio.to_thread(svg_compact.serialize, source, SVG_PRECISION, False)
+            viewbox = source.viewbox_attr
+        else:
+            with open(svg_path, "r") as f:
+                input_svg = f.read()
+            viewbox_match = re.search(r'viewBox="([^"]+)"', input_svg)
+            viewbox = viewbox_match.group(1) if viewbox_match else "0 0 1000 1000"
+    
+    with timer.span("mongo_update"):
+        await db.queue.update_one({"id": city_id}, {"$set": {"progress": 30}})
+    
+    # Gemini Layer Separation (wide skylines: one call per strip, stitched back)
+    strips = None
+    if STAGE2_TILE_BYTES and len(input_svg) > STAGE2_TILE_BYTES:
+        with timer.span("tiling"):
+            if source is None:
+                source = await asyncio.to_thread(load_geometry, item, geometry_key, svg_path)
+            strips = await asyncio.to_thread(
+                tiling.plan_strips, source, math.ceil(len(input_svg) / STAGE2_TILE_BYTES), STAGE2_TILE_OVERLAP
+            )
+        if len(strips) < 2:
+            strips = None
+        else:
+            logger.info(f"Stage 2 for {city_id}: {len(input_svg)} bytes split into {len(strips)} strips")
+    
+    if strips:
+        reference = tiling.height_reference(source)
+        prompts = [stage2_prompt(strip.svg, strip.store.viewbox_attr, reference) for strip in strips]
+        with timer.span("gemini_call"):
+            responses = await asyncio.gather(*[
+                generate_with_gemini(settings["gemini_api_key"], "stage2", prompt, 0.3) for prompt in prompts
+            ])
+    else:
+        with timer.span("gemini_call"):
+            response = await generate_with_gemini(settings["gemini_api_key"], "stage2", stage2_prompt(input_svg, viewbox), 0.3)
+    
+    with timer.span("mongo_update"):
         await db.queue.update_one({"id": city_id}, {"$set": {"progress": 70}})
-        
-        # Parse response
-        response_text = response.strip()
-        
-        # Clean up markdown if present
-        if "```" in response_text:
-            json_match = re.search(r'```(?:json)?\s*([\s\S]*?)```', response_text)
-            if json_match:
-                response_text = json_match.group(1).strip()
-        
-        # Try to extract JSON
-        try:
-            # Find JSON object
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                response_text = response_text[json_start:json_end]
-            
-            layers_data = json.loads(response_text)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parse error: {e}, response: {response_text[:500]}")
-            # Fallback: create simple layers from input
-            layers_data = {
-                "layer_1": input_svg,
-                "layer_2": input_svg,
-                "layer_3": input_svg
-            }
-        
-        # Save layer SVGs
-        layer_paths = {}
+    
+    with timer.span("parse"):
+        if strips:
+            layers_data = await asyncio.to_thread(stitch_layers, strips, responses, source.meta)
+        else:
+            layers_data = parse_layers_response(response, input_svg)
+    
+    # Save layer SVGs
+    dedupe_reports, svg_sizes = {}, {}
+    with timer.span("file_write"):
         for layer_num in [1, 2, 3]:
             layer_key = f"layer_{layer_num}"
             svg_content = layers_data.get(layer_key, layers_data.get(f"layer{layer_num}", ""))
@@ -775,13 +1451,72 @@ No explanation, no markdown - just the JSON object."""
             if not svg_content.startswith('<?xml'):
                 svg_content = '<?xml version="1.0" encoding="UTF-8"?>\n' + svg_content
             
-            filename = f"{city_id}_layer_{layer_num}.svg"
-            filepath = UPLOAD_DIR / "processed" / filename
-            with open(filepath, "w") as f:
+            # Drop duplicate/overlapping segments before they reach the laser
+            with timer.span("dedupe"):
+                try:
+                    svg_content, _, dedupe_reports[layer_key], svg_sizes[layer_key] = await asyncio.to_thread(clean_svg, svg_content)
+                except Exception as e:
+                    logger.warning(f"Could not dedupe {layer_key} for {city_id}: {e}")
+            
+            with open(paths[layer_key], "w") as f:
                 f.write(svg_content)
-            layer_paths[layer_key] = str(filepath)
+    
+    return {"dedupe": dedupe_reports, "svg_sizes": svg_sizes, "stage2_strips": len(strips) if strips else 1}
+
+@api_router.post("/process/stage2/{city_id}")
+async def process_stage2(city_id: str, idempotency_key: Optional[str] = Header(None), force: bool = False):
+    """Stage 2: Use Gemini to separate SVG into 3 layers based on building height (`force` skips the build cache)"""
+    item = await db.queue.find_one({"id": city_id}, {"_id": 0})
+    if not item:
+        raise HTTPException(status_code=404, detail="City not found")
+    
+    duplicate = job_leases.replay(item, "stage2", idempotency_key)
+    if duplicate:
+        return duplicate
+    
+    if item.get("status") not in ["spacing_applied", "stage1_complete", "stage2_processing"]:
+        raise HTTPException(status_code=400, detail="Complete spacing adjustment first")
+    
+    settings = await get_api_keys()
+    if not settings.get("gemini_api_key"):
+        raise HTTPException(status_code=400, detail="Gemini API key not configured")
+    
+    # Atomically take the item so concurrent clicks/workers can't run it twice
+    item = await job_leases.claim(
+        db, city_id, "stage2", {"$in": ["spacing_applied", "stage1_complete"]}, JOB_LEASE_SECONDS, idempotency_key
+    )
+    if not item:
+        return await reject_claim(city_id, "stage2", idempotency_key, "Stage 2 is already running for this city")
+    
+    heartbeat = job_leases.start_heartbeat(db, city_id, JOB_LEASE_SECONDS)
+    timer, profiler = start_job("stage2")
+    try:
+        # Get the spaced SVG (or stage1 if no spacing applied)
+        input_node = "spaced" if item.get("spaced_svg_path") else "stage1"
+        svg_path = item.get(f"{input_node}_svg_path")
+        geometry_key = f"{input_node}_geometry_path"
+        
+        # Layers already separated from this exact SVG (e.g. a spacing used before) are restored
+        paths = build_paths(city_id, "layers")
+        with timer.span("build_cache"):
+            inputs = {input_node: await asyncio.to_thread(artifacts.outputs_digest, {"svg": svg_path})}
+            params = stage2_params()
+            key = artifacts.node_key("layers", inputs, params)
+            cached = None if force else await asyncio.to_thread(build_cache.restore, city_id, "layers", key, paths)
+        if cached:
+            logger.info(f"Stage 2 for {city_id}: restored build {key[:12]}")
+            build, fields = cached["build"], cached["meta"]
+        else:
+            fields = await separate_layers(city_id, item, settings, svg_path, geometry_key, timer, paths)
+            with timer.span("build_cache"):
+                build = await asyncio.to_thread(artifacts.record, key, inputs, params, paths)
+                await asyncio.to_thread(build_cache.save, city_id, "layers", build, paths, fields)
         
-        await db.queue.update_one({"id": city_id}, {"$set": {"progress": 90}})
+        dedupe_reports = {**(item.get("dedupe") or {}), **fields["dedupe"]}
+        svg_sizes = {**(item.get("svg_sizes") or {}), **fields["svg_sizes"]}
+        
+        with timer.span("mongo_update"):
+            await db.queue.update_one({"id": city_id}, {"$set": {"progress": 90}})
         
         # Move to processed collection
         now = datetime.now(timezone.utc).isoformat()
@@ -791,12 +1526,18 @@ No explanation, no markdown - just the JSON object."""
             "style_id": item["style_id"],
             "style_name": item["style_name"],
             "original_filepath": item["original_filepath"],
+            "photo_hash": item.get("photo_hash"),
             "stage1_svg_path": item.get("stage1_svg_path"),
             "spaced_svg_path": item.get("spaced_svg_path"),
-            "layer_1_path": layer_paths["layer_1"],
-            "layer_2_path": layer_paths["layer_2"],
-            "layer_3_path": layer_paths["layer_3"],
+            "stage1_geometry_path": item.get("stage1_geometry_path"),
+            "spaced_geometry_path": item.get("spaced_geometry_path"),
+            "layer_1_path": str(paths["layer_1"]),
+            "layer_2_path": str(paths["layer_2"]),
+            "layer_3_path": str(paths["layer_3"]),
             "layer_count": 3,
+            "stage2_strips": fields["stage2_strips"],
+            "dedupe": dedupe_reports,
+            "svg_sizes": svg_sizes,
             "expansion_percentage": item.get("expansion_percentage", 0),
             "original_width": item.get("original_width"),
             "original_height": item.get("original_height"),
@@ -806,64 +1547,271 @@ No explanation, no markdown - just the JSON object."""
             "created_at": item["created_at"],
             "processed_at": now
         }
-        await db.processed.insert_one(processed_doc)
-        
-        # Update queue status
-        await db.queue.update_one(
-            {"id": city_id},
-            {"$set": {"status": "done", "progress": 100, "updated_at": now}}
-        )
-        
-        return {
+        result = {
             "status": "complete",
             "city_id": city_id,
             "message": "All 3 layers generated!",
-            "layer_count": 3
+            "layer_count": 3,
+            "build": "restored" if cached else "built"
+        }
+        
+        updates = {
+            "status": "done", "progress": 100, "dedupe": dedupe_reports, "svg_sizes": svg_sizes,
+            "builds.layers": build, "updated_at": now, **job_leases.RELEASED
         }
+        if idempotency_key:
+            updates["idempotency.stage2.result"] = result
+        with timer.span("mongo_update"):
+            # Upsert so a retried job can't leave two processed documents behind
+            await db.processed.replace_one({"id": city_id}, processed_doc, upsert=True)
+            await db.city_summaries.replace_one({"id": city_id}, city_summary(processed_doc), upsert=True)
+            
+            # Update queue status and release the lease
+            await db.queue.update_one(job_leases.owned(city_id), {"$set": updates})
+        
+        return result
         
     except Exception as e:
         logger.error(f"Stage 2 error: {e}")
         await db.queue.update_one(
-            {"id": city_id},
-            {"$set": {"status": "error", "error_message": str(e), "updated_at": datetime.now(timezone.utc).isoformat()}}
+            job_leases.owned(city_id),
+            {"$set": {"status": "error", "error_message": str(e), "updated_at": datetime.now(timezone.utc).isoformat(), **job_leases.RELEASED}}
         )
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        heartbeat.cancel()
+        await finish_job(city_id, timer, profiler)
+
+# Auto pipeline: Stage 1 -> spacing -> Stage 2 as one job
+auto_pipeline_slots = asyncio.Semaphore(AUTO_PIPELINE_CONCURRENCY)
+auto_pipeline_tasks = {}
+
+def schedule_auto_pipeline(city_id: str):
+    """Start the auto pipeline for a queue item unless it is already running here"""
+    if city_id in auto_pipeline_tasks:
+        return
+    task = asyncio.create_task(run_auto_pipeline(city_id))
+    auto_pipeline_tasks[city_id] = task
+    task.add_done_callback(lambda _: auto_pipeline_tasks.pop(city_id, None))
+
+async def run_auto_pipeline(city_id: str):
+    """Chain the stage endpoints, resuming from the item's current status"""
+    async with auto_pipeline_slots:
+        step = "stage1"
+        try:
+            item = await db.queue.find_one({"id": city_id}, {"_id": 0})
+            if not item or not item.get("auto_pipeline"):
+                return
+            status = item["status"]
+            
+            if status == "waiting":
+                await process_stage1(city_id, idempotency_key=None)
+                status = "stage1_complete"
+                # The item may have been flagged for review while Stage 1 ran
+                item = await db.queue.find_one({"id": city_id}, {"_id": 0})
+                if not item or not item.get("auto_pipeline"):
+                    return
+            
+            if status == "stage1_complete":
+                if item["auto_pipeline"].get("review"):
+                    logger.info(f"Auto pipeline paused for review: {city_id}")
+                    return
+                step = "spacing"
+                await apply_spacing(city_id, SpacingInput(expansion_percentage=item["auto_pipeline"]["expansion_percentage"]))
+                status = "spacing_applied"
+            
+            if status == "spacing_applied":
+                step = "stage2"
+                await process_stage2(city_id, idempotency_key=None)
+                logger.info(f"Auto pipeline complete: {city_id}")
+        except HTTPException as e:
+            if e.status_code == 409:
+                # Another worker holds the stage; it carries the job from here
+                return
+            logger.error(f"Auto pipeline stopped at {step} for {city_id}: {e.detail}")
+            # Stage 1/2 record their own errors; this covers spacing and pre-claim checks
+            await db.queue.update_one(
+                {"id": city_id, "status": {"$nin": job_leases.IN_FLIGHT_STATUSES + ["error"]}},
+                {"$set": {"status": "error", "error_message": f"Auto pipeline ({step}): {e.detail}", "updated_at": datetime.now(timezone.utc).isoformat()}}
+            )
+        except Exception as e:
+            logger.error(f"Auto pipeline error for {city_id}: {e}")
+
+async def resume_auto_pipelines():
+    """Pick up auto items left waiting, e.g. after a restart or a reaped lease"""
+    items = db.queue.find(
+        {"auto_pipeline": {"$ne": None}, "auto_pipeline.review": {"$ne": True},
+         "status": {"$in": ["waiting", "stage1_complete", "spacing_applied"]}},
+        {"_id": 0, "id": 1}
+    )
+    async for item in items:
+        schedule_auto_pipeline(item["id"])
+
+# Incremental builds: bring an artifact up to date, recomputing only stale nodes
+# Queue statuses in which a node's output is the one in effect
+NODE_STATUSES = {
+    "stage1": ("stage1_complete", "spacing_applied", "done"),
+    "spaced": ("spacing_applied", "done"),
+    "layers": ("done",),
+}
+
+def target_percentage(item: dict, requested: Optional[int]) -> int:
+    for value in (requested, item.get("expansion_percentage"), (item.get("auto_pipeline") or {}).get("expansion_percentage")):
+        if value is not None:
+            return value
+    return 0
+
+async def build_plan(item: dict, expansion_percentage: int) -> dict:
+    """
+    State of each node for this spacing: current (up to date), cached
+    (restorable without recomputing) or stale. A node whose input is
+    stale is stale too: its key depends on what the input produces.
+    """
+    city_id = item["id"]
+    style = await db.styles.find_one({"id": item["style_id"]}, {"_id": 0})
+    prompt = stage1_prompt(await style_text(style))
+    builds = item.get("builds") or {}
+    inputs = {"photo": await asyncio.to_thread(artifacts.file_digest, item["original_filepath"])}
+    plan = {}
+    for node, params in (("stage1", stage1_params(prompt)), ("spaced", spacing_params(expansion_percentage)),
+                         ("layers", stage2_params())):
+        if inputs is None:
+            plan[node] = {"state": "stale", "key": None}
+            continue
+        key = artifacts.node_key(node, inputs, params)
+        build = builds.get(node)
+        # A restorable node is re-run through its stage (cheaply) so the queue status follows
+        current = item["status"] in NODE_STATUSES[node] and await asyncio.to_thread(
+            artifacts.is_current, build, key, build_paths(city_id, node)
+        )
+        if current:
+            state, digest = "current", build["digest"]
+        else:
+            cached = await asyncio.to_thread(build_cache.lookup, city_id, node, key)
+            state, digest = ("cached", cached["build"]["digest"]) if cached else ("stale", None)
+        plan[node] = {"state": state, "key": key}
+        inputs = {node: digest} if digest else None
+    return plan
+
+async def find_buildable(city_id: str) -> dict:
+    item = await db.queue.find_one({"id": city_id}, {"_id": 0})
+    if not item:
+        raise HTTPException(status_code=404, detail="City not found")
+    if item["status"] in job_leases.IN_FLIGHT_STATUSES:
+        raise HTTPException(status_code=409, detail="This city is already being processed")
+    return item
+
+@api_router.get("/process/build/{city_id}")
+async def get_build_plan(city_id: str, expansion_percentage: Optional[int] = None):
+    """Which pipeline artifacts are up to date for a spacing"""
+    item = await find_buildable(city_id)
+    expansion_percentage = target_percentage(item, expansion_percentage)
+    return {"city_id": city_id, "expansion_percentage": expansion_percentage,
+            "nodes": await build_plan(item, expansion_percentage)}
+
+@api_router.post("/process/build/{city_id}")
+async def build_city(city_id: str, body: BuildInput):
+    """Bring `target` and the artifacts it depends on up to date, reusing every current one"""
+    if body.target not in artifacts.NODES:
+        raise HTTPException(status_code=400, detail=f"Target must be one of {', '.join(artifacts.NODES)}")
+    steps = {}
+    for node in artifacts.NODES[:artifacts.NODES.index(body.target) + 1]:
+        # Re-plan after every step: a rebuilt node changes the keys of the ones after it
+        item = await find_buildable(city_id)
+        expansion_percentage = target_percentage(item, body.expansion_percentage)
+        if (await build_plan(item, expansion_percentage))[node]["state"] == "current":
+            steps[node] = "current"
+            continue
+        if node == "stage1":
+            result = await process_stage1(city_id, idempotency_key=None)
+        elif node == "spaced":
+            result = await apply_spacing(city_id, SpacingInput(expansion_percentage=expansion_percentage))
+        else:
+            result = await process_stage2(city_id, idempotency_key=None)
+        steps[node] = result["build"]
+    logger.info(f"Build of {body.target} for {city_id}: {steps}")
+    return {"city_id": city_id, "target": body.target, "expansion_percentage": expansion_percentage, "steps": steps}
+
+# City summary read model: the slim, path-free view served by the public routes
+CITY_SUMMARY_FIELDS = (
+    "id", "city_name", "style_id", "style_name", "layer_count", "expansion_percentage",
+    "original_width", "original_height", "new_width", "original_aspect_ratio", "new_aspect_ratio",
+    "created_at", "processed_at", "cut_stats",
+)
+CITY_CARD_PROJECTION = {"_id": 0, "id": 1, "city_name": 1, "style_name": 1, "layer_count": 1, "expansion_percentage": 1}
+
+def city_summary(processed_doc: dict) -> dict:
+    """Denormalised public view of a processed document (no filesystem paths)"""
+    summary = {field: processed_doc.get(field) for field in CITY_SUMMARY_FIELDS}
+    summary["expansion_percentage"] = summary["expansion_percentage"] or 0
+    summary["layers"] = {
+        f"layer_{n}": f"/api/cities/{processed_doc['id']}/layer/{n}"
+        for n in range(1, (processed_doc.get("layer_count") or 3) + 1)
+    }
+    return summary
+
+async def sync_city_summaries():
+    """Index the read model and backfill summaries for cities processed before it existed"""
+    await db.city_summaries.create_index("id", unique=True)
+    await db.city_summaries.create_index([("processed_at", -1)])
+    known = {doc["id"] async for doc in db.city_summaries.find({}, {"_id": 0, "id": 1})}
+    backfilled = 0
+    async for doc in db.processed.find({"id": {"$nin": list(known)}}, {"_id": 0, **{f: 1 for f in CITY_SUMMARY_FIELDS}}):
+        await db.city_summaries.replace_one({"id": doc["id"]}, city_summary(doc), upsert=True)
+        backfilled += 1
+    if backfilled:
+        logger.info(f"Backfilled {backfilled} city summaries")
 
 # Public API - Processed Cities
+# Reads are coalesced: concurrent identical requests share one query and one encode
+async def fetch_cities() -> bytes:
+    cities = await db.city_summaries.find(
+        {}, {**CITY_CARD_PROJECTION, "created_at": 1, "processed_at": 1}
+    ).sort("processed_at", -1).to_list(100)
+    for c in cities:
+        c["created_at"] = c.pop("processed_at", None) or c.get("created_at")
+    return orjson.dumps(cities)
+
 @api_router.get("/cities")
 async def list_cities():
     """List all processed cities"""
-    cities = await db.processed.find({}, {"_id": 0}).sort("processed_at", -1).to_list(100)
-    return [{
-        "id": c["id"],
-        "city_name": c["city_name"],
-        "style_name": c["style_name"],
-        "layer_count": c["layer_count"],
-        "expansion_percentage": c.get("expansion_percentage", 0),
-        "created_at": c.get("processed_at", c.get("created_at"))
-    } for c in cities]
+    return json_response(await read_flights.do("cities", fetch_cities))
 
-@api_router.get("/cities/search")
-async def search_cities(q: str):
-    """Search for a city by name"""
-    cities = await db.processed.find(
+async def fetch_search(q: str) -> bytes:
+    cities = await db.city_summaries.find(
         {"city_name": {"$regex": q, "$options": "i"}},
-        {"_id": 0}
+        CITY_CARD_PROJECTION
     ).to_list(20)
     
     if not cities:
-        all_cities = await db.processed.find({}, {"_id": 0, "city_name": 1, "id": 1}).to_list(100)
-        return {"found": False, "message": f"Sorry, we don't have '{q}' yet", "suggestions": all_cities[:6]}
+        suggestions = await db.city_summaries.find({}, {"_id": 0, "city_name": 1, "id": 1}).to_list(6)
+        return orjson.dumps({"found": False, "message": f"Sorry, we don't have '{q}' yet", "suggestions": suggestions})
     
-    return {"found": True, "cities": cities}
+    return orjson.dumps({"found": True, "cities": cities})
+
+@api_router.get("/cities/search")
+async def search_cities(q: str):
+    """Search for a city by name"""
+    return json_response(await read_flights.do(("search", q), fetch_search, q))
+
+async def fetch_city(city_id: str):
+    city = await db.city_summaries.find_one({"id": city_id}, {"_id": 0})
+    return orjson.dumps(city) if city else None
 
 @api_router.get("/cities/{city_id}")
 async def get_city(city_id: str):
     """Get a processed city by ID"""
-    city = await db.processed.find_one({"id": city_id}, {"_id": 0})
-    if not city:
+    body = await read_flights.do(("city", city_id), fetch_city, city_id)
+    if body is None:
         raise HTTPException(status_code=404, detail="City not found")
-    return city
+    return json_response(body)
+
+async def find_city_file(city_id: str, field: str):
+    """(city name, path) of a processed artifact, or None if the city doesn't exist"""
+    city = await db.processed.find_one({"id": city_id}, {"_id": 0, "city_name": 1, field: 1})
+    if not city:
+        return None
+    return city["city_name"], Path(city.get(field) or "")
 
 @api_router.get("/cities/{city_id}/layer/{layer_num}")
 async def download_layer(city_id: str, layer_num: int):
@@ -871,29 +1819,198 @@ async def download_layer(city_id: str, layer_num: int):
     if layer_num not in [1, 2, 3]:
         raise HTTPException(status_code=400, detail="Layer must be 1, 2, or 3")
     
-    city = await db.processed.find_one({"id": city_id}, {"_id": 0})
-    if not city:
+    field = f"layer_{layer_num}_path"
+    found = await read_flights.do((field, city_id), find_city_file, city_id, field)
+    if not found:
         raise HTTPException(status_code=404, detail="City not found")
     
-    layer_path = Path(city.get(f"layer_{layer_num}_path", ""))
+    city_name, layer_path = found
     if not layer_path.exists():
         raise HTTPException(status_code=404, detail=f"Layer {layer_num} not found")
     
     return FileResponse(
         layer_path,
         media_type="image/svg+xml",
-        filename=f"{city['city_name'].replace(' ', '_')}_layer_{layer_num}.svg"
+        filename=f"{city_name.replace(' ', '_')}_layer_{layer_num}.svg"
+    )
+
+# Laser toolpaths (DXF / G-code) with optimised cut order
+TOOLPATH_FORMATS = {
+    "gcode": ("text/x-gcode", "gcode"),
+    "dxf": ("application/dxf", "dxf"),
+}
+
+def build_layer_toolpath(layer_path: Path, plan_path: Path):
+    """Polylines and cut plan for a layer; the plan is cached next to other derivatives"""
+    with open(layer_path, "r") as f:
+        store = geometry.parse_svg(f.read())
+    polylines = store.polylines()
+    # Plan from machine home so the reported travel is the program's G0 moves
+    origin = list(toolpath.canvas_origin(store.viewbox))
+    plan = None
+    if plan_path.exists() and plan_path.stat().st_mtime >= layer_path.stat().st_mtime:
+        plan = json.loads(plan_path.read_text())
+        if plan.get("paths") != len(polylines) or plan.get("origin") != origin:
+            plan = None
+    if plan is None:
+        plan = toolpath.plan(polylines, origin)
+        write_text_atomic(plan_path, json.dumps(plan))
+    return polylines, plan
+
+async def load_layer_toolpath(city_id: str, layer_num: int):
+    if layer_num not in [1, 2, 3]:
+        raise HTTPException(status_code=400, detail="Layer must be 1, 2, or 3")
+    
+    field = f"layer_{layer_num}_path"
+    found = await read_flights.do((field, city_id), find_city_file, city_id, field)
+    if not found:
+        raise HTTPException(status_code=404, detail="City not found")
+    
+    city_name, layer_path = found
+    if not layer_path.exists():
+        raise HTTPException(status_code=404, detail=f"Layer {layer_num} not found")
+    
+    plan_path = UPLOAD_DIR / "cache" / f"{city_id}_layer_{layer_num}_toolpath.json"
+    polylines, plan = await artifact_flights.do(
+        ("toolpath", str(plan_path)), asyncio.to_thread, build_layer_toolpath, layer_path, plan_path
+    )
+    return city_name, polylines, plan
+
+def toolpath_report(plan: dict, scale: float) -> dict:
+    before, after = plan["travel_before"] * scale, plan["travel_after"] * scale
+    return {
+        "paths": plan["paths"],
+        "travel_before_mm": round(before, 1),
+        "travel_after_mm": round(after, 1),
+        "travel_saved_percent": round(100 * (before - after) / before, 1) if before else 0.0
+    }
+
+@api_router.get("/cities/{city_id}/layer/{layer_num}/toolpath")
+async def get_layer_toolpath(city_id: str, layer_num: int, scale: float = Query(1.0, gt=0)):
+    """Travel distance of the layer's cut order before/after optimisation"""
+    _, _, plan = await load_layer_toolpath(city_id, layer_num)
+    return {"city_id": city_id, "layer": layer_num, **toolpath_report(plan, scale)}
+
+# Cut-time and material estimates; per-layer geometry stats (SVG units) are
+# cached on the processed city and its summary. The cache key, each layer
+# file's mtime, is kept apart (processed.cut_stats_mtimes) so it isn't published
+async def load_cut_stats(city_id: str) -> dict:
+    layer_fields = {f"layer_{n}_path": 1 for n in (1, 2, 3)}
+    city = await db.processed.find_one(
+        {"id": city_id}, {"_id": 0, "layer_count": 1, "cut_stats": 1, "cut_stats_mtimes": 1, **layer_fields}
+    )
+    if not city:
+        raise HTTPException(status_code=404, detail="City not found")
+    cached, cached_mtimes = city.get("cut_stats") or {}, city.get("cut_stats_mtimes") or {}
+    stats, mtimes = {}, {}
+    for layer_num in range(1, (city.get("layer_count") or 3) + 1):
+        key = f"layer_{layer_num}"
+        layer_path = Path(city.get(f"{key}_path") or "")
+        if not layer_path.exists():
+            raise HTTPException(status_code=404, detail=f"Layer {layer_num} not found")
+        mtimes[key] = layer_path.stat().st_mtime
+        entry = cached.get(key)
+        if not entry or cached_mtimes.get(key) != mtimes[key]:
+            # The cut plan (for travel) is shared with the toolpath exports
+            _, polylines, plan = await load_layer_toolpath(city_id, layer_num)
+            entry = {**await asyncio.to_thread(toolpath.cut_stats, polylines), "travel": plan["travel_after"]}
+        stats[key] = entry
+    if mtimes != cached_mtimes:
+        await db.processed.update_one({"id": city_id}, {"$set": {"cut_stats": stats, "cut_stats_mtimes": mtimes}})
+        await db.city_summaries.update_one({"id": city_id}, {"$set": {"cut_stats": stats}})
+    return stats
+
+def cut_estimate(stats: dict, scale: float, profiles: dict) -> dict:
+    """Per-layer and total lengths (mm), material area (mm², bounding boxes) and cut time (s) per profile"""
+    layers = {}
+    totals = {"paths": 0, "pierces": 0, "cut_length_mm": 0.0, "travel_mm": 0.0, "material_area_mm2": 0.0,
+              "time_s": dict.fromkeys(profiles, 0.0)}
+    for key, layer in stats.items():
+        cut, travel = layer["cut_length"] * scale, layer["travel"] * scale
+        min_x, min_y, max_x, max_y = layer["bbox"] or (0, 0, 0, 0)
+        width, height = (max_x - min_x) * scale, (max_y - min_y) * scale
+        times = {
+            name: cut / p["cut_mm_s"] + travel / p["travel_mm_s"] + layer["pierces"] * p["pierce_s"]
+            for name, p in profiles.items()
+        }
+        layers[key] = {
+            "paths": layer["paths"],
+            "pierces": layer["pierces"],
+            "cut_length_mm": round(cut, 1),
+            "travel_mm": round(travel, 1),
+            "width_mm": round(width, 1),
+            "height_mm": round(height, 1),
+            "material_area_mm2": round(width * height, 1),
+            "time_s": {name: round(t, 1) for name, t in times.items()},
+        }
+        totals["paths"] += layer["paths"]
+        totals["pierces"] += layer["pierces"]
+        totals["cut_length_mm"] += cut
+        totals["travel_mm"] += travel
+        totals["material_area_mm2"] += width * height
+        for name, t in times.items():
+            totals["time_s"][name] += t
+    for field in ("cut_length_mm", "travel_mm", "material_area_mm2"):
+        totals[field] = round(totals[field], 1)
+    totals["time_s"] = {name: round(t, 1) for name, t in totals["time_s"].items()}
+    return {"layers": layers, "totals": totals}
+
+@api_router.get("/cities/{city_id}/estimate")
+async def get_cut_estimate(
+    city_id: str,
+    scale: float = Query(1.0, gt=0),  # mm per SVG unit
+    profile: Optional[str] = None  # one of MACHINE_PROFILES (default: all)
+):
+    """Cut length, pierce count, material area and laser time per layer"""
+    if profile and profile not in MACHINE_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile; choose from {', '.join(MACHINE_PROFILES)}")
+    profiles = {profile: MACHINE_PROFILES[profile]} if profile else MACHINE_PROFILES
+    stats = await artifact_flights.do(("cut_stats", city_id), load_cut_stats, city_id)
+    return {"city_id": city_id, "scale": scale, "profiles": profiles, **cut_estimate(stats, scale, profiles)}
+
+@api_router.get("/cities/{city_id}/layer/{layer_num}/export/{fmt}")
+async def export_layer_toolpath(
+    city_id: str,
+    layer_num: int,
+    fmt: str,
+    scale: float = Query(1.0, gt=0),  # mm per SVG unit
+    feed: float = Query(1000, gt=0),  # mm/min (G-code)
+    power: float = Query(1000, ge=0)  # spindle/laser S value (G-code)
+):
+    """Download a layer as DXF or G-code, paths ordered to minimise laser-off travel"""
+    if fmt not in TOOLPATH_FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be gcode or dxf")
+    
+    city_name, polylines, plan = await load_layer_toolpath(city_id, layer_num)
+    name = f"{city_name.replace(' ', '_')}_layer_{layer_num}"
+    if fmt == "gcode":
+        args = (toolpath.to_gcode, polylines, plan, scale, feed, power, name)
+    else:
+        args = (toolpath.to_dxf, polylines, plan, scale, f"LAYER_{layer_num}")
+    content = await artifact_flights.do((fmt, city_id, layer_num, scale, feed, power), asyncio.to_thread, *args)
+    
+    media_type, ext = TOOLPATH_FORMATS[fmt]
+    report = toolpath_report(plan, scale)
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{name}.{ext}"',
+            "X-Travel-Before-Mm": str(report["travel_before_mm"]),
+            "X-Travel-After-Mm": str(report["travel_after_mm"]),
+            "X-Travel-Saved-Percent": str(report["travel_saved_percent"])
+        }
     )
 
 @api_router.get("/cities/{city_id}/all-layers")
 async def download_all_layers(city_id: str):
     """Get all layer paths for download"""
-    city = await db.processed.find_one({"id": city_id}, {"_id": 0})
-    if not city:
+    body = await read_flights.do(("city", city_id), fetch_city, city_id)
+    if body is None:
         raise HTTPException(status_code=404, detail="City not found")
     
     return {
-        "city_name": city["city_name"],
+        "city_name": orjson.loads(body)["city_name"],
         "layers": {
             "layer_1": f"/api/cities/{city_id}/layer/1",
             "layer_2": f"/api/cities/{city_id}/layer/2",
@@ -904,44 +2021,130 @@ async def download_all_layers(city_id: str):
 @api_router.get("/cities/{city_id}/stage1")
 async def get_stage1_svg(city_id: str):
     """Get Stage 1 SVG (single layer)"""
-    city = await db.processed.find_one({"id": city_id}, {"_id": 0})
-    if not city:
+    found = await read_flights.do(("stage1_svg_path", city_id), find_city_file, city_id, "stage1_svg_path")
+    if not found:
         raise HTTPException(status_code=404, detail="City not found")
     
-    svg_path = Path(city.get("stage1_svg_path", ""))
+    city_name, svg_path = found
     if not svg_path.exists():
         raise HTTPException(status_code=404, detail="Stage 1 SVG not found")
     
     return FileResponse(
         svg_path,
         media_type="image/svg+xml",
-        filename=f"{city['city_name'].replace(' ', '_')}_stage1.svg"
+        filename=f"{city_name.replace(' ', '_')}_stage1.svg"
     )
 
 # Featured cities
 @api_router.get("/featured")
 async def get_featured():
     """Get featured cities for homepage"""
-    cities = await db.processed.find({}, {"_id": 0}).sort("processed_at", -1).to_list(9)
-    return [{
-        "id": c["id"],
-        "city_name": c["city_name"],
-        "style_name": c["style_name"],
-        "layer_count": c["layer_count"],
-        "expansion_percentage": c.get("expansion_percentage", 0)
-    } for c in cities]
+    return json_response(await read_flights.do("featured", fetch_featured))
+
+async def fetch_featured() -> bytes:
+    cities = await db.city_summaries.find({}, CITY_CARD_PROJECTION).sort("processed_at", -1).to_list(9)
+    return orjson.dumps(cities)
+
+# Prometheus metrics (served outside /api so scrapers hit the backend directly)
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Metrics in Prometheus text exposition format"""
+    counts = {}
+    async for row in db.queue.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+        counts[row["_id"]] = row["count"]
+    metrics.set_queue_depth(counts)
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
 
 # Include the router
 app.include_router(api_router)
 
+app.add_middleware(metrics.PrometheusMiddleware)
+
+app.add_middleware(
+    admission.AdmissionMiddleware,
+    limits=ROUTE_LIMITS,
+    trust_forwarded=RATE_LIMIT_TRUST_FORWARDED,
+    enabled=RATE_LIMIT_ENABLED,
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browser code read the metadata and range headers set above
+    expose_headers=[
+        "Accept-Ranges", "Content-Range", "Content-Disposition", "Retry-After",
+        "X-Original-Width", "X-Original-Height", "X-Original-Aspect-Ratio",
+        "X-Expansion-Percentage", "X-New-Width", "X-New-Aspect-Ratio",
+        "X-Travel-Before-Mm", "X-Travel-After-Mm", "X-Travel-Saved-Percent",
+    ],
 )
 
+# Background maintenance
+async def background_maintenance():
+    """Periodic housekeeping: reap expired job leases, artifact GC"""
+    last_gc = time.monotonic()
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL_SECONDS)
+        try:
+            await job_leases.reap_expired_leases(db, JOB_LEASE_SECONDS)
+        except Exception as e:
+            logger.error(f"Lease reaper error: {e}")
+        try:
+            await resume_auto_pipelines()
+        except Exception as e:
+            logger.error(f"Auto pipeline resume error: {e}")
+        if GC_INTERVAL_SECONDS > 0 and time.monotonic() - last_gc >= GC_INTERVAL_SECONDS:
+            last_gc = time.monotonic()
+            try:
+                await run_gc()
+            except Exception as e:
+                logger.error(f"GC error: {e}")
+
+maintenance_task = None
+warmup_task = None
+photo_index_task = None
+
+async def warm_up_pipeline():
+    """Import the lazily loaded pipeline modules off the event loop"""
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(lazy_imports.warm_up)
+        logger.info(f"Pipeline modules warmed up in {time.perf_counter() - started:.2f}s: {lazy_imports.status()}")
+    except Exception as e:
+        logger.error(f"Pipeline warm-up failed: {e}")
+
+async def index_photos():
+    """Backfill missing photo hashes and load the duplicate index in the background"""
+    try:
+        await backfill_photo_hashes()
+        logger.info(f"Photo index loaded: {len(photo_index)} photos")
+    except Exception as e:
+        logger.error(f"Photo index error: {e}")
+
+@app.on_event("startup")
+async def start_background_maintenance():
+    global maintenance_task, warmup_task, photo_index_task
+    maintenance_task = asyncio.create_task(background_maintenance())
+    if PIPELINE_WARMUP and not lazy_imports.all_loaded():
+        warmup_task = asyncio.create_task(warm_up_pipeline())
+    try:
+        await sync_city_summaries()
+    except Exception as e:
+        logger.error(f"City summary sync error: {e}")
+    photo_index_task = asyncio.create_task(index_photos())
+    try:
+        await resume_auto_pipelines()
+    except Exception as e:
+        logger.error(f"Auto pipeline resume error: {e}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if maintenance_task:
+        maintenance_task.cancel()
+    if photo_index_task:
+        photo_index_task.cancel()
     client.close()
@@ -0,0 +1,47 @@
+"""
+Single-flight coalescing of identical concurrent work.
+
+When many clients ask for the same thing at once (a freshly featured
+city, its layer downloads) every request would otherwise run its own
+Mongo query, file read and JSON encoding. `Group.do(key, fn)` runs `fn`
+for the first caller of a key; callers arriving while it is in flight
+await the same task and get the same result (or exception). Nothing is
+cached: the key is dropped as soon as the call finishes, so the next
+request after that sees fresh data.
+
+The shared task is shielded, so a client disconnecting mid-request does
+not cancel the work for the others. Results are shared objects - callers
+must not mutate them.
+"""
+import asyncio
+
+import metrics
+
+
+class Group:
+    """One namespace of in-flight calls, labelled `name` in the metrics"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+
+    async def do(self, key, fn, *args):
+        """Await `fn(*args)`, sharing the call with concurrent callers of the same key"""
+        task = self._calls.get(key)
+        if task is None:
+            metrics.SINGLEFLIGHT_CALLS.labels(self.name, "leader").inc()
+            task = asyncio.ensure_future(fn(*args))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            metrics.SINGLEFLIGHT_CALLS.labels(self.name, "coalesced").inc()
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved; waiters re-raise it themselves
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,192 @@
+"""
+Static export of the public catalog, for serving from a static host or CDN.
+
+The public routes only change when Stage 2 publishes a city, so their
+responses can be written out ahead of time:
+
+    featured.json          body of /api/featured
+    cities.json            body of /api/cities
+    search.json            [{id, city_name}] of every city, for client-side search
+    cities/{id}.json       body of /api/cities/{id}; `layers` and `stage1` link the files below
+    svg/{sha256}.svg       layer and Stage 1 SVGs named by content hash (cacheable forever)
+    manifest.json          what was exported, for the next incremental run
+
+Every file gets a gzip -9 copy next to it (`.gz`) for hosts that serve
+precompressed files (nginx gzip_static, S3/CloudFront with
+Content-Encoding metadata). Files are written atomically and only when
+their content changed, so a sync to the CDN uploads just the difference.
+
+Runs are incremental: a city whose processed_at matches the manifest (and
+whose SVGs are still in the bundle) keeps its files; only new or
+republished cities are hashed and compressed again. Files of removed
+cities stay until --prune, so pages cached with old JSON keep working.
+
+Usage (from backend/, with the API's .env):
+    python -m static_export /srv/catalog
+    python -m static_export /srv/catalog --base-url https://cdn.example.com/catalog/ --prune
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+MANIFEST_NAME = "manifest.json"
+DIGEST_CHARS = 20
+PROCESSED_FIELDS = {
+    "_id": 0, "id": 1, "processed_at": 1, "layer_count": 1, "stage1_svg_path": 1,
+    "layer_1_path": 1, "layer_2_path": 1, "layer_3_path": 1,
+}
+
+
+def write_if_changed(path: Path, data: bytes) -> bool:
+    """Write `data` and its .gz copy atomically unless the file already holds it"""
+    gz = path.with_name(path.name + ".gz")
+    try:
+        if gz.exists() and path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for target, content in ((gz, gzip.compress(data, 9, mtime=0)), (path, data)):
+        tmp = target.with_name(target.name + ".tmp")
+        tmp.write_bytes(content)
+        os.replace(tmp, target)
+    return True
+
+
+def export_svg(out: Path, source: Path) -> dict:
+    """Copy one SVG into the bundle under its content hash"""
+    data = source.read_bytes()
+    relative = f"svg/{hashlib.sha256(data).hexdigest()[:DIGEST_CHARS]}.svg"
+    target = out / relative
+    if not (target.exists() and target.with_name(target.name + ".gz").exists()):
+        write_if_changed(target, data)
+    return {"path": relative, "bytes": len(data), "gzip_bytes": target.with_name(target.name + ".gz").stat().st_size}
+
+
+def export_city_files(out: Path, doc: dict) -> dict:
+    """{layer_n / stage1: file entry} for a processed city; blocking (hashing, gzip)"""
+    files = {}
+    sources = {f"layer_{n}": doc.get(f"layer_{n}_path") for n in range(1, (doc.get("layer_count") or 3) + 1)}
+    sources["stage1"] = doc.get("stage1_svg_path")
+    for name, source in sources.items():
+        if source and Path(source).exists():
+            files[name] = export_svg(out, Path(source))
+    return files
+
+
+def files_present(out: Path, files: dict) -> bool:
+    return all((out / entry["path"]).exists() and (out / (entry["path"] + ".gz")).exists() for entry in files.values())
+
+
+def city_page(summary: dict, files: dict, base_url: str) -> dict:
+    """The /api/cities/{id} body with links into the bundle"""
+    page = dict(summary)
+    page["layers"] = {name: base_url + entry["path"] for name, entry in files.items() if name.startswith("layer_")}
+    page["stage1"] = base_url + files["stage1"]["path"] if "stage1" in files else None
+    page["files"] = {name: {"bytes": entry["bytes"], "gzip_bytes": entry["gzip_bytes"]} for name, entry in files.items()}
+    return page
+
+
+def read_manifest(out: Path) -> dict:
+    try:
+        return json.loads((out / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return {"cities": {}}
+
+
+async def export(server, out: Path, base_url: str, full: bool, prune: bool, workers: int) -> dict:
+    """Bring the bundle in `out` up to date; returns counts for the summary line"""
+    import orjson
+
+    out.mkdir(parents=True, exist_ok=True)
+    previous = {} if full else read_manifest(out)["cities"]
+    summaries = {doc["id"]: doc async for doc in server.db.city_summaries.find({}, {"_id": 0})}
+    processed = {doc["id"]: doc async for doc in server.db.processed.find({"id": {"$in": list(summaries)}}, PROCESSED_FIELDS)}
+    stats = {"cities": len(processed), "regenerated": 0, "unchanged": 0, "removed": 0, "written": 0, "pruned": 0}
+
+    # SVGs: only for cities published (again) since the last run
+    slots = asyncio.Semaphore(workers)
+    cities = {}
+
+    async def export_city(city_id: str, doc: dict):
+        entry = previous.get(city_id)
+        if entry and entry.get("processed_at") == doc.get("processed_at") and files_present(out, entry["files"]):
+            stats["unchanged"] += 1
+            cities[city_id] = entry
+            return
+        async with slots:
+            files = await asyncio.to_thread(export_city_files, out, doc)
+        stats["regenerated"] += 1
+        cities[city_id] = {"processed_at": doc.get("processed_at"), "files": files}
+
+    await asyncio.gather(*[export_city(city_id, doc) for city_id, doc in processed.items()])
+
+    # JSON is cheap: rebuilt every run, written only when it changed
+    documents = {
+        "featured.json": await server.fetch_featured(),
+        "cities.json": await server.fetch_cities(),
+        "search.json": orjson.dumps(sorted(
+            ({"id": s["id"], "city_name": s["city_name"]} for s in summaries.values() if s["id"] in cities),
+            key=lambda c: c["city_name"].lower()
+        )),
+    }
+    for city_id, entry in cities.items():
+        documents[f"cities/{city_id}.json"] = orjson.dumps(city_page(summaries[city_id], entry["files"], base_url))
+    for relative, data in documents.items():
+        stats["written"] += await asyncio.to_thread(write_if_changed, out / relative, data)
+
+    for city_id in set(previous) - set(cities):
+        for suffix in ("", ".gz"):
+            (out / f"cities/{city_id}.json{suffix}").unlink(missing_ok=True)
+        stats["removed"] += 1
+    if prune:
+        referenced = {entry["path"] for city in cities.values() for entry in city["files"].values()}
+        for path in (out / "svg").glob("*.svg"):
+            if f"svg/{path.name}" not in referenced:
+                path.unlink()
+                path.with_name(path.name + ".gz").unlink(missing_ok=True)
+                stats["pruned"] += 1
+
+    manifest = {"generated_at": datetime.now(timezone.utc).isoformat(), "base_url": base_url, "cities": cities}
+    tmp = out / (MANIFEST_NAME + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1))
+    os.replace(tmp, out / MANIFEST_NAME)
+    return stats
+
+
+async def run(args) -> int:
+    import server
+
+    out = Path(args.out)
+    base_url = args.base_url
+    if base_url and not base_url.endswith("/"):
+        base_url += "/"
+    started = time.monotonic()
+    stats = await export(server, out, base_url, args.full, args.prune, args.workers)
+    pruned = f", {stats['pruned']} SVGs pruned" if args.prune else ""
+    print(f"{stats['cities']} cities: {stats['regenerated']} regenerated, {stats['unchanged']} unchanged, "
+          f"{stats['removed']} removed; {stats['written']} JSON files written{pruned} "
+          f"in {time.monotonic() - started:.1f}s -> {out}", file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the public catalog as a static bundle")
+    parser.add_argument("out", help="bundle directory")
+    parser.add_argument("--base-url", default="", help="prefix for file links in the JSON (default: relative to the bundle)")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and re-export every city")
+    parser.add_argument("--prune", action="store_true", help="delete SVGs no exported city links to any more")
+    parser.add_argument("--workers", type=int, default=4, help="cities hashed/compressed at once")
+    args = parser.parse_args(argv)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
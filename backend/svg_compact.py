@@ -0,0 +1,207 @@
+"""
+Compact SVG serialisation of a GeometryStore for stored and served artifacts.
+
+`GeometryStore.to_svg` writes every coordinate with fixed decimals and
+absolute commands, and repeats each element's presentation attributes.
+`serialize` writes the same drawing much smaller:
+
+- Coordinates are quantised once to `precision` decimals and written
+  without trailing zeros or leading "0" ("0.50" -> ".5").
+- Each command is written absolute or relative, whichever is shorter.
+  Relative offsets are taken between the *quantised* points, so rounding
+  never accumulates: every point is within 0.5 * 10**-precision of the
+  store's (the tolerance reported as `max_error` by `size_report`).
+- Horizontal/vertical lines become H/V. Cubic and quadratic curves whose
+  first control point mirrors the previous one become S/T. Repeated
+  command letters and unnecessary separators are dropped.
+- Inherited presentation attributes shared by every element (typically
+  stroke="#000000" fill="none") are hoisted to one parent <g>, and hex
+  colours are shortened.
+
+`relative=False` keeps absolute commands, for SVG shown to the model in
+prompts, where positions should be readable at a glance.
+"""
+import re
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+
+import geometry
+
+# Presentation attributes that children inherit from a <g>, so hoisting them doesn't change rendering
+INHERITED_ATTRS = {
+    "stroke", "stroke-width", "stroke-linecap", "stroke-linejoin", "stroke-miterlimit",
+    "stroke-dasharray", "stroke-dashoffset", "stroke-opacity", "fill", "fill-opacity",
+    "fill-rule", "clip-rule", "color", "visibility", "shape-rendering",
+}
+COLOR_ATTRS = {"stroke", "fill", "color"}
+_SHORT_HEX = re.compile(r"#([0-9a-fA-F])\1([0-9a-fA-F])\2([0-9a-fA-F])\3$")
+
+
+def _short_color(value: str) -> str:
+    match = _SHORT_HEX.match(value)
+    return f"#{match.group(1)}{match.group(2)}{match.group(3)}".lower() if match else value
+
+
+class _NumberFormat:
+    """Integer multiples of 10**-precision as the shortest decimal text, memoised"""
+
+    def __init__(self, precision: int):
+        self.precision = precision
+        self._cache = {}
+
+    def __call__(self, value: int) -> str:
+        text = self._cache.get(value)
+        if text is None:
+            digits = str(abs(value))
+            if self.precision:
+                digits = digits.rjust(self.precision + 1, "0")
+                digits = f"{digits[:-self.precision]}.{digits[-self.precision:]}".rstrip("0").rstrip(".")
+                if digits.startswith("0."):
+                    digits = digits[1:]
+            text = ("-" if value < 0 and digits != "0" else "") + digits
+            self._cache[value] = text
+        return text
+
+
+def _join(numbers: list, previous: str) -> str:
+    """
+    Numbers with separators only where the parser needs them; `previous`
+    is the number written just before (empty after a command letter).
+    """
+    out = []
+    for number in numbers:
+        if previous and not (number[0] == "-" or (number[0] == "." and "." in previous)):
+            out.append(" ")
+        out.append(number)
+        previous = number
+    return "".join(out)
+
+
+def _encode(points: np.ndarray, cmds: list, fmt: _NumberFormat, relative: bool) -> str:
+    """One element's path data from quantised integer points"""
+    parts = []
+    last_letter = last_number = ""
+    x = y = start_x = start_y = 0
+    reflect = None  # (kind, control point) of the previous curve, for S/T
+    p = 0
+
+    def emit(letter: str, numbers: list):
+        nonlocal last_letter, last_number
+        # A repeated letter may be omitted, except after M/m (which would turn it into L/l)
+        if letter != last_letter or letter in "Mm":
+            parts.append(letter)
+            last_number = ""
+        parts.append(_join(numbers, last_number))
+        last_letter, last_number = letter, numbers[-1]
+
+    def pick(upper: str, absolute: list, offsets: list):
+        absolute = [fmt(v) for v in absolute]
+        if not relative or not parts:
+            emit(upper, absolute)
+            return
+        offsets = [fmt(v) for v in offsets]
+        if sum(map(len, offsets)) < sum(map(len, absolute)):
+            emit(upper.lower(), offsets)
+        else:
+            emit(upper, absolute)
+
+    for code in cmds:
+        n = geometry.POINTS_PER_CMD[code]
+        pts = points[p:p + n]
+        p += n
+        if code == geometry.MOVE:
+            nx, ny = pts[0]
+            pick("M", [nx, ny], [nx - x, ny - y])
+            x, y = start_x, start_y = nx, ny
+            reflect = None
+        elif code == geometry.LINE:
+            nx, ny = pts[0]
+            if ny == y and nx != x:
+                pick("H", [nx], [nx - x])
+            elif nx == x and ny != y:
+                pick("V", [ny], [ny - y])
+            else:
+                pick("L", [nx, ny], [nx - x, ny - y])
+            x, y = nx, ny
+            reflect = None
+        elif code == geometry.CUBIC:
+            (c1x, c1y), (c2x, c2y), (nx, ny) = pts
+            if reflect and reflect[0] == "C" and (c1x, c1y) == (2 * x - reflect[1], 2 * y - reflect[2]):
+                pick("S", [c2x, c2y, nx, ny], [c2x - x, c2y - y, nx - x, ny - y])
+            else:
+                pick("C", [c1x, c1y, c2x, c2y, nx, ny],
+                     [c1x - x, c1y - y, c2x - x, c2y - y, nx - x, ny - y])
+            reflect = ("C", c2x, c2y)
+            x, y = nx, ny
+        elif code == geometry.QUAD:
+            (cx, cy), (nx, ny) = pts
+            if reflect and reflect[0] == "Q" and (cx, cy) == (2 * x - reflect[1], 2 * y - reflect[2]):
+                pick("T", [nx, ny], [nx - x, ny - y])
+            else:
+                pick("Q", [cx, cy, nx, ny], [cx - x, cy - y, nx - x, ny - y])
+            reflect = ("Q", cx, cy)
+            x, y = nx, ny
+        elif code == geometry.CLOSE:
+            parts.append("z")
+            last_letter, last_number = "z", ""
+            x, y = start_x, start_y
+            reflect = None
+    return "".join(parts)
+
+
+def _attrs(attrs: dict) -> str:
+    return "".join(
+        f" {k}={quoteattr(_short_color(v) if k in COLOR_ATTRS else v)}" for k, v in attrs.items()
+    )
+
+
+def serialize(store: "geometry.GeometryStore", precision: int = 2, relative: bool = True) -> str:
+    """Compact SVG text for `store`, every point within 0.5 * 10**-precision"""
+    scale = 10 ** precision
+    quantised = np.rint(store.coords * scale).astype(np.int64).tolist() if len(store.coords) else []
+    fmt = _NumberFormat(precision)
+
+    used = sorted(set(store.attr_index.tolist()))
+    attr_sets = store.meta["attr_sets"]
+    shared = {}
+    if used:
+        first = attr_sets[used[0]]
+        shared = {k: v for k, v in first.items()
+                  if k in INHERITED_ATTRS and all(attr_sets[i].get(k) == v for i in used)}
+    own = [_attrs({k: v for k, v in attrs.items() if k not in shared}) for attrs in attr_sets]
+
+    root_attrs = {k: v for k, v in store.meta["root_attrs"].items() if k not in ("viewBox", "xmlns")}
+    out = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n',
+        f'<svg xmlns="{geometry.SVG_NS}" viewBox="{store.viewbox_attr}"{_attrs(root_attrs)}>',
+    ]
+    if shared:
+        out.append(f"<g{_attrs(shared)}>")
+    cmds = store.cmds.tolist()
+    cmd_offsets = store.cmd_offsets.tolist()
+    point_offsets = store.point_offsets.tolist()
+    attr_index = store.attr_index.tolist()
+    for e in range(store.element_count):
+        d = _encode(quantised[point_offsets[e]:point_offsets[e + 1]], cmds[cmd_offsets[e]:cmd_offsets[e + 1]],
+                    fmt, relative)
+        out.append(f'<path d="{d}"{own[attr_index[e]]}/>')
+    if shared:
+        out.append("</g>")
+    out.extend(store.passthrough_xml())
+    out.append("</svg>\n")
+    return "".join(out)
+
+
+def size_report(store: "geometry.GeometryStore", svg: str, precision: int, compare: bool = False) -> dict:
+    """
+    Size and rounding error of `svg`. With `compare`, also its size against
+    `to_svg` at the same precision, which serialises the store a second time.
+    """
+    size = len(svg.encode())
+    report = {"bytes": size, "precision": precision, "max_error": 0.5 / 10 ** precision}
+    if compare:
+        verbose_bytes = len(store.to_svg(precision).encode())
+        report["verbose_bytes"] = verbose_bytes
+        report["saved_percent"] = round(100 * (1 - size / verbose_bytes), 1) if verbose_bytes else 0.0
+    return report
@@ -0,0 +1,220 @@
+"""
+Tiling of large inputs so each Gemini call stays small.
+
+Stage 1: `plan_tiles` cuts a high-resolution photo into a grid of
+overlapping tiles, each vectorised on its own. `merge_tiles` maps every
+tile's SVG back onto the full canvas (GeometryStore.place) and keeps an
+element only if its centre lies in that tile's core, so the overlap is
+drawn once; the pieces of outlines cut by a seam are joined by
+dedupe.dedupe_store afterwards.
+
+Stage 2: a panorama's spaced SVG can be too big to embed in one layer-separation
+prompt. `plan_strips` cuts it into vertical strips at gaps between
+buildings (buildings are x-disjoint clusters, see
+geometry.assign_buildings), balancing the number of points per strip.
+Each strip owns a *core* x-range; its *window* reaches `overlap` further
+on both sides, and every building touching the window is sent whole, so
+the model sees the neighbourhood of the seam.
+
+`stitch` reassembles one layer from the per-strip results: a building (or
+canvas-wide element) of a strip's output is kept only if its centre lies
+in that strip's core. A building drawn by two strips therefore survives
+once; lines continuing across a seam (the ground line) are left for
+dedupe.dedupe_store to merge.
+"""
+import io
+import logging
+import math
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+from PIL import Image
+
+import geometry
+import svg_compact
+
+logger = logging.getLogger(__name__)
+
+
+def _in_range(values: np.ndarray, lo: float, hi: float, last: bool) -> np.ndarray:
+    return (values >= lo) & ((values <= hi) if last else (values < hi))
+
+
+@dataclass
+class Tile:
+    index: int
+    core: tuple  # (x0, y0, x1, y1) pixels this tile owns in the merged drawing
+    window: tuple  # (x0, y0, x1, y1) pixels cropped from the photo
+
+    @property
+    def size(self) -> tuple:
+        x0, y0, x1, y1 = self.window
+        return x1 - x0, y1 - y0
+
+
+def _edges(length: int, count: int) -> list:
+    return [round(length * i / count) for i in range(count + 1)]
+
+
+def plan_tiles(width: int, height: int, tile_pixels: int, overlap: float = 0.1) -> list:
+    """
+    Grid of tiles with cores of at most `tile_pixels` per side; each
+    window reaches `overlap` of the core size further on every side.
+    """
+    cols, rows = math.ceil(width / tile_pixels), math.ceil(height / tile_pixels)
+    xs, ys = _edges(width, cols), _edges(height, rows)
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            core = (xs[col], ys[row], xs[col + 1], ys[row + 1])
+            margin_x = round(overlap * (core[2] - core[0]))
+            margin_y = round(overlap * (core[3] - core[1]))
+            window = (max(0, core[0] - margin_x), max(0, core[1] - margin_y),
+                      min(width, core[2] + margin_x), min(height, core[3] + margin_y))
+            tiles.append(Tile(len(tiles), core, window))
+    return tiles
+
+
+def crop_tile(image: Image.Image, tile: Tile) -> bytes:
+    """JPEG of the tile's window; `image` must already be loaded"""
+    crop = image.crop(tile.window)
+    if crop.mode not in ("RGB", "L"):
+        crop = crop.convert("RGB")
+    out = io.BytesIO()
+    crop.save(out, format="JPEG", quality=92)
+    return out.getvalue()
+
+
+def merge_tiles(tiles: list, svgs: list, width: int, height: int) -> geometry.GeometryStore:
+    """
+    One drawing on the full `width` x `height` canvas from per-tile SVGs
+    (same order as `tiles`). Tiles whose SVG doesn't parse are left out;
+    raises ValueError if none does.
+    """
+    kept, root_attrs = [], None
+    for tile, svg in zip(tiles, svgs):
+        try:
+            part = geometry.parse_svg(svg).place(tile.window)
+        except Exception as e:
+            logger.warning(f"Tile {tile.index} returned unparseable SVG, leaving it out: {e}")
+            continue
+        if root_attrs is None:
+            root_attrs = {k: v for k, v in part.meta["root_attrs"].items() if k not in ("width", "height")}
+        x0, y0, x1, y1 = tile.core
+        if part.element_count:
+            boxes = part.element_bboxes()
+            cx, cy = (boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2
+            keep = _in_range(cx, x0, x1, x1 >= width) & _in_range(cy, y0, y1, y1 >= height)
+        else:
+            keep = np.zeros(0, dtype=bool)
+        # Passthrough anchors only have an x: take them from the top row of tiles
+        passthrough = [item for item in part.meta["passthrough"]
+                       if (item["x"] is None and tile.index == 0)
+                       or (item["x"] is not None and y0 == 0
+                           and _in_range(np.array([item["x"]]), x0, x1, x1 >= width)[0])]
+        kept.append(part.subset(keep, passthrough=passthrough))
+    if not kept:
+        raise ValueError(f"None of the {len(tiles)} tiles returned a usable SVG")
+    logger.debug(f"Merged {len(kept)}/{len(tiles)} tiles into {sum(p.element_count for p in kept)} elements")
+    return geometry.concat(kept, {"viewbox": [0.0, 0.0, float(width), float(height)], "root_attrs": root_attrs})
+
+
+@dataclass
+class Strip:
+    index: int
+    core: tuple  # (lo, hi) x-range this strip owns in the stitched result
+    window: tuple  # (lo, hi) x-range of the strip's viewBox
+    store: geometry.GeometryStore
+
+    @cached_property
+    def svg(self) -> str:
+        return svg_compact.serialize(self.store, relative=False)
+
+
+def plan_strips(store: geometry.GeometryStore, count: int, overlap: float = 0.1) -> list:
+    """
+    Split `store` into at most `count` strips (fewer if it has fewer
+    buildings). `overlap` is a fraction of the average strip width.
+    """
+    min_x, min_y, width, height = store.viewbox
+    boxes = store.building_bboxes()
+    if count < 2 or len(boxes) < 2:
+        return [Strip(0, (min_x, min_x + width), (min_x, min_x + width), store)]
+
+    # Points per building, in left-to-right order
+    order = np.argsort(boxes[:, 0], kind="stable")
+    points = np.diff(store.point_offsets)
+    weight = np.bincount(store.building[store.building >= 0], weights=points[store.building >= 0],
+                         minlength=len(boxes))[order]
+    cumulative = np.cumsum(weight)
+    # Cut after the building where the cumulative weight crosses k / count of the total
+    targets = cumulative[-1] * np.arange(1, count) / count
+    after = np.unique(np.clip(np.searchsorted(cumulative, targets), 0, len(order) - 2))
+    cuts = (boxes[order[after], 2] + boxes[order[after + 1], 0]) / 2
+    edges = np.concatenate([[min_x], cuts, [min_x + width]])
+    margin = overlap * width / len(edges[:-1])
+
+    member = store.building >= 0
+    strips = []
+    for i, (lo, hi) in enumerate(zip(edges[:-1], edges[1:])):
+        window_lo, window_hi = lo - margin, hi + margin
+        touching = (boxes[:, 2] >= window_lo) & (boxes[:, 0] <= window_hi)
+        selected = np.where(member, touching[np.maximum(store.building, 0)], True)
+        # Widen the window to whole buildings so none is cut off at the strip edge
+        if touching.any():
+            window_lo = min(window_lo, float(boxes[touching, 0].min()))
+            window_hi = max(window_hi, float(boxes[touching, 2].max()))
+        window_lo, window_hi = max(window_lo, min_x), min(window_hi, min_x + width)
+        passthrough = [item for item in store.meta["passthrough"]
+                       if (item["x"] is None and i == 0)
+                       or (item["x"] is not None and window_lo <= item["x"] <= window_hi)]
+        strip_store = store.subset(selected, viewbox=(window_lo, min_y, window_hi - window_lo, height),
+                                   passthrough=passthrough)
+        strips.append(Strip(i, (float(lo), float(hi)), (window_lo, window_hi), strip_store))
+    logger.debug(f"Split {store.element_count} elements into {len(strips)} strips at x={[round(float(c), 1) for c in cuts]}")
+    return strips
+
+
+def height_reference(store: geometry.GeometryStore) -> tuple:
+    """(street level y, top of the tallest building y) over the whole skyline"""
+    boxes = store.building_bboxes()
+    if not len(boxes):
+        min_x, min_y, width, height = store.viewbox
+        return min_y + height, min_y
+    return float(boxes[:, 3].max()), float(boxes[:, 1].min())
+
+
+def _in_core(x: np.ndarray, strip: Strip, last: bool) -> np.ndarray:
+    return _in_range(x, *strip.core, last)
+
+
+def stitch(strips: list, fragments: list, meta: dict) -> geometry.GeometryStore:
+    """
+    One layer from per-strip SVG fragments (same order as `strips`).
+    A fragment that doesn't parse is replaced by the strip's own input.
+    """
+    kept = []
+    for strip, fragment in zip(strips, fragments):
+        last = strip.index == len(strips) - 1
+        try:
+            part = geometry.parse_svg(fragment)
+        except Exception as e:
+            logger.warning(f"Strip {strip.index} returned unparseable SVG, using its input: {e}")
+            part = strip.store
+        if part.element_count:
+            element_boxes = part.element_bboxes()
+            centers = (element_boxes[:, 0] + element_boxes[:, 2]) / 2
+            member = part.building >= 0
+            if member.any():
+                building_boxes = part.building_bboxes()
+                building_centers = (building_boxes[:, 0] + building_boxes[:, 2]) / 2
+                centers[member] = building_centers[part.building[member]]
+            keep = _in_core(centers, strip, last)
+        else:
+            keep = np.zeros(0, dtype=bool)
+        passthrough = [item for item in part.meta["passthrough"]
+                       if (item["x"] is None and strip.index == 0)
+                       or (item["x"] is not None and _in_core(np.array([item["x"]]), strip, last)[0])]
+        kept.append(part.subset(keep, passthrough=passthrough))
+    return geometry.concat(kept, meta)
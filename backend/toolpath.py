@@ -0,0 +1,264 @@
+"""
+Laser toolpaths: cut order optimisation and DXF / G-code writers.
+
+Gemini emits paths in arbitrary order, so the head would spend much of
+the job travelling with the laser off. `plan` orders the polylines of a
+layer with a nearest-neighbour tour from the machine origin, then
+improves it with 2-opt. Any path may be cut backwards (closed paths start
+and end at the same point anyway), which 2-opt exploits: reversing a run
+of the tour also reverses each path in it, so only the two boundary
+travel moves change. Both passes share `time_budget`: the export routes
+are public, so a dense city gets a partly optimised order (the rest in
+input order) rather than holding a worker.
+
+`origin` is the SVG point that the writers put at machine (0, 0): the
+bottom-left of the canvas, since machine y points up. Travel is measured
+from there and back, as the G-code starts at home and ends with
+`G0 X0 Y0`, so the reported distances are the program's rapid moves.
+"""
+import time
+
+import numpy as np
+
+
+def _endpoints(polylines: list) -> tuple:
+    """(first points, last points) of `polylines` as two (n, 2) arrays"""
+    starts = np.array([points[0] for points, _ in polylines], dtype=float).reshape(-1, 2)
+    ends = np.array([points[-1] for points, _ in polylines], dtype=float).reshape(-1, 2)
+    return starts, ends
+
+
+def travel_distance(polylines: list, order, reversed_flags, origin=(0.0, 0.0)) -> float:
+    """Total laser-off travel from `origin`, through `polylines` in the given order, back to `origin`"""
+    origin = np.asarray(origin, dtype=float)
+    order = np.asarray(order, dtype=np.int64)
+    if not len(order):
+        return 0.0
+    flipped = np.asarray(reversed_flags, dtype=bool)[:, None]
+    starts, ends = _endpoints(polylines)
+    entries = np.where(flipped, ends[order], starts[order])
+    exits = np.where(flipped, starts[order], ends[order])
+    moves = np.vstack([entries, [origin]]) - np.vstack([[origin], exits])
+    return float(np.hypot(*moves.T).sum())
+
+
+def _nearest_free(cells: dict, points: np.ndarray, remaining: np.ndarray, position, lo, size: float) -> int:
+    """
+    Index into `points` of the nearest endpoint of a remaining path. Rings
+    of grid cells are searched outwards from the cell of `position` until
+    no closer point can lie further out; once a ring would cover more
+    cells than are still occupied, the rest are compared at once instead.
+    """
+    count = len(remaining)
+    cx, cy = np.floor((position - lo) / size).astype(np.int64).tolist()
+    best, best_distance = -1, np.inf
+    radius = 0
+    while (2 * radius + 1) ** 2 <= len(cells):
+        ring = [(x, y) for x in range(cx - radius, cx + radius + 1) for y in (cy - radius, cy + radius)]
+        ring += [(x, y) for x in (cx - radius, cx + radius) for y in range(cy - radius + 1, cy + radius)]
+        for key in set(ring):
+            bucket = cells.get(key)
+            if bucket is None:
+                continue
+            bucket[:] = [index for index in bucket if remaining[index % count]]
+            if not bucket:
+                del cells[key]
+                continue
+            distances = np.hypot(*(points[bucket] - position).T)
+            nearest = int(distances.argmin())
+            if distances[nearest] < best_distance:
+                best, best_distance = bucket[nearest], float(distances[nearest])
+        # Anything outside this ring is more than radius * size away
+        if best_distance <= radius * size:
+            return best
+        radius += 1
+    candidates = np.flatnonzero(np.concatenate([remaining, remaining]))
+    return int(candidates[np.hypot(*(points[candidates] - position).T).argmin()])
+
+
+def _nearest_neighbour(starts: np.ndarray, ends: np.ndarray, origin: np.ndarray, deadline: float):
+    """
+    Greedy tour from `origin`, always cutting next the path with the nearest
+    free endpoint. Endpoints are bucketed in a uniform grid (about one path
+    per cell) so a step looks at the neighbourhood, not every path. Paths
+    not reached by `deadline` follow in input order.
+    """
+    count = len(starts)
+    points = np.concatenate([starts, ends])
+    lo = points.min(axis=0)
+    size = max(float((points.max(axis=0) - lo).max()) / np.sqrt(count), 1e-9)
+    cells = {}
+    for index, key in enumerate(map(tuple, np.floor((points - lo) / size).astype(np.int64).tolist())):
+        cells.setdefault(key, []).append(index)
+    remaining = np.ones(count, dtype=bool)
+    order = np.empty(count, dtype=np.int64)
+    flipped = np.zeros(count, dtype=bool)
+    position = origin
+    visited = 0
+    while visited < count and time.monotonic() < deadline:
+        nearest = _nearest_free(cells, points, remaining, position, lo, size)
+        index = nearest % count
+        order[visited], flipped[visited] = index, nearest >= count
+        position = starts[index] if flipped[visited] else ends[index]
+        remaining[index] = False
+        visited += 1
+    order[visited:] = np.flatnonzero(remaining)
+    return order, flipped
+
+
+def _two_opt(entries: np.ndarray, exits: np.ndarray, order, flipped, origin, time_budget: float):
+    """
+    Improve the tour (origin -> paths -> origin) in place. entries/exits
+    are per tour position; reversing positions i..j swaps entry/exit of
+    each and reverses them.
+    """
+    count = len(order)
+    deadline = time.monotonic() + time_budget
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for i in range(count):
+            previous = origin if i == 0 else exits[i - 1]
+            js = np.arange(i, count)
+            # Removed edges: previous -> entry[i] and exit[j] -> entry[j + 1]
+            # (entry[count] is the return to the origin)
+            next_entries = np.vstack([entries[i + 1:], [origin]])
+            old = np.hypot(*(previous - entries[i])) + np.hypot(*(exits[js] - next_entries).T)
+            # Added edges: previous -> exit[j] and entry[i] -> entry[j + 1]
+            new = np.hypot(*(previous - exits[js]).T) + np.hypot(*(entries[i] - next_entries).T)
+            gain = old - new
+            best = int(gain.argmax())
+            if gain[best] > 1e-9:
+                j = i + best
+                entries[i:j + 1], exits[i:j + 1] = exits[i:j + 1][::-1].copy(), entries[i:j + 1][::-1].copy()
+                order[i:j + 1] = order[i:j + 1][::-1].copy()
+                flipped[i:j + 1] = ~flipped[i:j + 1][::-1]
+                improved = True
+            if time.monotonic() >= deadline:
+                break
+    return order, flipped
+
+
+def plan(polylines: list, origin=(0.0, 0.0), time_budget: float = 2.0) -> dict:
+    """
+    Cut order for `polylines` ([(points, closed), ...]) starting and
+    ending at `origin` (SVG coordinates of machine home), spending at
+    most about `time_budget` seconds on it.
+
+    Returns order, per-path reversed flags, the origin, and travel
+    distance of the original order vs. the optimised one (in input units).
+    """
+    origin = np.asarray(origin, dtype=float)
+    count = len(polylines)
+    identity = np.arange(count)
+    no_flip = np.zeros(count, dtype=bool)
+    before = travel_distance(polylines, identity, no_flip, origin)
+    if count < 2:
+        return {"order": identity.tolist(), "reversed": no_flip.tolist(), "origin": origin.tolist(),
+                "travel_before": before, "travel_after": before, "paths": count}
+
+    starts, ends = _endpoints(polylines)
+    deadline = time.monotonic() + time_budget
+    order, flipped = _nearest_neighbour(starts, ends, origin, deadline)
+    entries = np.where(flipped[:, None], ends[order], starts[order])
+    exits = np.where(flipped[:, None], starts[order], ends[order])
+    order, flipped = _two_opt(entries, exits, order, flipped, origin, max(0.0, deadline - time.monotonic()))
+    after = travel_distance(polylines, order, flipped, origin)
+    if after > before:
+        # Nothing to gain (e.g. already ordered input)
+        order, flipped, after = identity, no_flip, before
+    return {
+        "order": order.tolist(),
+        "reversed": flipped.tolist(),
+        "origin": origin.tolist(),
+        "travel_before": before,
+        "travel_after": after,
+        "paths": count,
+    }
+
+
+def cut_stats(polylines: list) -> dict:
+    """
+    Cut length, pierce count (one per polyline) and bounding box of a
+    layer, in input units; computed over all segments at once.
+    """
+    if not polylines:
+        return {"paths": 0, "pierces": 0, "cut_length": 0.0, "bbox": None}
+    points = np.concatenate([points for points, _ in polylines])
+    segments = np.hypot(*np.diff(points, axis=0).T)
+    # The jumps from one polyline's last point to the next one's first are travel, not cuts
+    counts = np.fromiter((len(points) for points, _ in polylines), dtype=np.int64, count=len(polylines))
+    segments[np.cumsum(counts)[:-1] - 1] = 0.0
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    return {
+        "paths": len(polylines),
+        "pierces": len(polylines),
+        "cut_length": float(segments.sum()),
+        "bbox": [float(lo[0]), float(lo[1]), float(hi[0]), float(hi[1])],
+    }
+
+
+def ordered(polylines: list, toolpath: dict):
+    """Polylines in cut order, reversed where the plan says so"""
+    for index, flipped in zip(toolpath["order"], toolpath["reversed"]):
+        points, closed = polylines[index]
+        yield (points[::-1] if flipped else points), closed
+
+
+def canvas_origin(viewbox) -> tuple:
+    """SVG point of the canvas's bottom-left corner, i.e. machine (0, 0)"""
+    min_x, min_y, width, height = viewbox
+    return (float(min_x), float(min_y + height))
+
+
+def _machine_xy(points: np.ndarray, origin, scale: float) -> np.ndarray:
+    """SVG (y down) to machine coordinates (y up, `origin` at 0, 0), in mm"""
+    out = np.empty_like(points)
+    out[:, 0] = (points[:, 0] - origin[0]) * scale
+    out[:, 1] = (origin[1] - points[:, 1]) * scale
+    return out
+
+
+def to_gcode(polylines: list, toolpath: dict, scale: float = 1.0,
+             feed: float = 1000, power: float = 1000, name: str = "") -> str:
+    """
+    GRBL-style G-code: G0 travel with the laser off, G1 cuts with M3 on.
+    Starts and ends at machine home, the plan's origin.
+    """
+    lines = [
+        f"; {name}".rstrip(),
+        f"; {toolpath['paths']} paths, travel {toolpath['travel_before'] * scale:.1f} mm -> {toolpath['travel_after'] * scale:.1f} mm",
+        "G21 ; mm",
+        "G90 ; absolute",
+        "M5",
+    ]
+    for points, _ in ordered(polylines, toolpath):
+        xy = _machine_xy(points, toolpath["origin"], scale)
+        lines.append(f"G0 X{xy[0, 0]:.3f} Y{xy[0, 1]:.3f}")
+        lines.append(f"M3 S{power:g}")
+        lines.append(f"G1 X{xy[1, 0]:.3f} Y{xy[1, 1]:.3f} F{feed:g}")
+        lines.extend(f"G1 X{x:.3f} Y{y:.3f}" for x, y in xy[2:].tolist())
+        lines.append("M5")
+    lines += ["G0 X0 Y0", "M2", ""]
+    return "\n".join(lines)
+
+
+def to_dxf(polylines: list, toolpath: dict, scale: float = 1.0, layer: str = "0") -> str:
+    """
+    AutoCAD R12 ASCII DXF with one POLYLINE entity per path, in cut order.
+    R12 has no units header ($INSUNITS is R2000+): coordinates are mm.
+    """
+    out = ["0", "SECTION", "2", "HEADER", "9", "$ACADVER", "1", "AC1009", "0", "ENDSEC",
+           "0", "SECTION", "2", "ENTITIES"]
+    for points, closed in ordered(polylines, toolpath):
+        xy = _machine_xy(points, toolpath["origin"], scale)
+        if closed:
+            xy = xy[:-1]  # the closed flag repeats the first vertex
+        # R12 POLYLINE headers carry a (dummy) point; the vertices follow
+        out += ["0", "POLYLINE", "8", layer, "66", "1", "10", "0.0", "20", "0.0", "30", "0.0",
+                "70", "1" if closed else "0"]
+        for x, y in xy.tolist():
+            out += ["0", "VERTEX", "8", layer, "10", f"{x:.4f}", "20", f"{y:.4f}", "30", "0.0"]
+        out += ["0", "SEQEND", "8", layer]
+    out += ["0", "ENDSEC", "0", "EOF", ""]
+    return "\n".join(out)
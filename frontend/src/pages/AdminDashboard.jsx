@@ -48,11 +48,15 @@ export default function AdminDashboard() {
   const [cityName, setCityName] = useState("");
   const [selectedStyle, setSelectedStyle] = useState(null);
   const [uploading, setUploading] = useState(false);
+  const [autoRun, setAutoRun] = useState(false);
+  const [autoPercentage, setAutoPercentage] = useState(0);
+  const [reviewFirst, setReviewFirst] = useState(false);
   
   // Styles state
   const [styles, setStyles] = useState([]);
   const [newStyleName, setNewStyleName] = useState("");
   const [newStyleDesc, setNewStyleDesc] = useState("");
+  const [newStyleAutoPct, setNewStyleAutoPct] = useState("");
   const [stylePdf, setStylePdf] = useState(null);
   const [uploadingStyle, setUploadingStyle] = useState(false);
   
@@ -69,12 +73,17 @@ export default function AdminDashboard() {
   // City Bank state
   const [processedCities, setProcessedCities] = useState([]);
 
+  // Profiler state
+  const [profileJobs, setProfileJobs] = useState(1);
+  const [profiler, setProfiler] = useState({ jobs_remaining: 0, profiles: [] });
+
   // Fetch data on mount
   useEffect(() => {
     if (isAdmin) {
       fetchStyles();
       fetchQueue();
       fetchProcessedCities();
+      fetchProfiler();
       const interval = setInterval(fetchQueue, 10000);
       return () => clearInterval(interval);
     }
@@ -100,6 +109,31 @@ export default function AdminDashboard() {
     }
   };
 
+  const fetchProfiler = async () => {
+    try {
+      const res = await fetch(`${API}/admin/profiler`);
+      const data = await res.json();
+      setProfiler(data);
+    } catch (e) {
+      console.error("Failed to fetch profiler state:", e);
+    }
+  };
+
+  const handleArmProfiler = async (jobs) => {
+    try {
+      const res = await fetch(`${API}/admin/profiler`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ jobs }),
+      });
+      const data = await res.json();
+      toast.success(data.jobs_remaining ? `Profiling the next ${data.jobs_remaining} job(s)` : "Profiler off");
+      fetchProfiler();
+    } catch (e) {
+      toast.error("Could not update profiler");
+    }
+  };
+
   const fetchProcessedCities = async () => {
     try {
       const res = await fetch(`${API}/cities`);
@@ -194,6 +228,11 @@ export default function AdminDashboard() {
     formData.append("file", cityImage.file);
     formData.append("city_name", cityName);
     formData.append("style_id", selectedStyle);
+    formData.append("auto", autoRun);
+    if (autoRun) {
+      formData.append("expansion_percentage", autoPercentage);
+      formData.append("review", reviewFirst);
+    }
     
     try {
       const res = await fetch(`${API}/cities/upload`, {
@@ -206,6 +245,8 @@ export default function AdminDashboard() {
         setCityImage(null);
         setCityName("");
         setSelectedStyle(null);
+        setAutoRun(false);
+        setReviewFirst(false);
         fetchQueue();
         setActiveTab("queue");
       } else {
@@ -230,6 +271,7 @@ export default function AdminDashboard() {
     formData.append("file", stylePdf);
     formData.append("name", newStyleName);
     formData.append("description", newStyleDesc);
+    if (newStyleAutoPct !== "") formData.append("auto_expansion_percentage", newStyleAutoPct);
     
     try {
       const res = await fetch(`${API}/styles`, {
@@ -242,6 +284,7 @@ export default function AdminDashboard() {
         setStylePdf(null);
         setNewStyleName("");
         setNewStyleDesc("");
+        setNewStyleAutoPct("");
         fetchStyles();
       } else {
         const err = await res.json();
@@ -253,6 +296,31 @@ export default function AdminDashboard() {
     setUploadingStyle(false);
   };
 
+  // Select a style, taking over its auto pipeline default
+  const handleSelectStyle = (style) => {
+    setSelectedStyle(style.id);
+    const hasDefault = style.auto_expansion_percentage !== null && style.auto_expansion_percentage !== undefined;
+    setAutoRun(hasDefault);
+    if (hasDefault) setAutoPercentage(style.auto_expansion_percentage);
+  };
+
+  // Approve an item paused for review (or flag it)
+  const handleSetReview = async (itemId, review) => {
+    try {
+      const res = await fetch(`${API}/queue/${itemId}/review`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ review }),
+      });
+      if (res.ok) {
+        toast.success(review ? "Will pause after Stage 1" : "Approved - continuing automatically");
+        fetchQueue();
+      }
+    } catch (e) {
+      toast.error("Failed to update review flag");
+    }
+  };
+
   // Delete style
   const handleDeleteStyle = async (styleId) => {
     if (!window.confirm("Delete this style?")) return;
@@ -265,11 +333,12 @@ export default function AdminDashboard() {
     }
   };
 
-  // Process Stage 1
-  const handleProcessStage1 = async (cityId) => {
+  // Process Stage 1 (`force` asks Gemini for a fresh drawing instead of the cached one)
+  const handleProcessStage1 = async (cityId, force = false) => {
+    if (force && !window.confirm("Generate a new Stage 1 drawing? Spacing and layers will need to be redone.")) return;
     setProcessing(true);
     try {
-      const res = await fetch(`${API}/process/stage1/${cityId}`, { method: "POST" });
+      const res = await fetch(`${API}/process/stage1/${cityId}${force ? "?force=true" : ""}`, { method: "POST" });
       const data = await res.json();
       
       if (res.ok) {
@@ -352,6 +421,7 @@ export default function AdminDashboard() {
       case "waiting": return "bg-yellow-100 text-yellow-800";
       case "stage1_processing": return "bg-blue-100 text-blue-800";
       case "stage1_complete": return "bg-purple-100 text-purple-800";
+      case "spacing_processing": return "bg-indigo-100 text-indigo-800";
       case "spacing_applied": return "bg-indigo-100 text-indigo-800";
       case "stage2_processing": return "bg-cyan-100 text-cyan-800";
       case "done": return "bg-green-100 text-green-800";
@@ -366,6 +436,7 @@ export default function AdminDashboard() {
       case "waiting": return "Waiting";
       case "stage1_processing": return "Stage 1: Stylizing...";
       case "stage1_complete": return "Stage 1 Done → Adjust Spacing";
+      case "spacing_processing": return "Applying Spacing...";
       case "spacing_applied": return "Spacing Set → Ready for Stage 2";
       case "stage2_processing": return "Stage 2: Creating Layers...";
       case "done": return "Complete!";
@@ -541,7 +612,7 @@ export default function AdminDashboard() {
                   ) : (
                     <div className="style-grid mt-2">
                       {styles.map((style) => (
-                        <div key={style.id} className={`style-card ${selectedStyle === style.id ? "selected" : ""}`} onClick={() => setSelectedStyle(style.id)} data-testid={`style-card-${style.id}`}>
+                        <div key={style.id} className={`style-card ${selectedStyle === style.id ? "selected" : ""}`} onClick={() => handleSelectStyle(style)} data-testid={`style-card-${style.id}`}>
                           <FileText className="w-8 h-8 mx-auto mb-2 text-gray-400" />
                           <p className="font-medium text-sm truncate">{style.name}</p>
                         </div>
@@ -549,6 +620,25 @@ export default function AdminDashboard() {
                     </div>
                   )}
                 </div>
+
+                <div className="space-y-3" data-testid="auto-pipeline-options">
+                  <label className="flex items-center gap-2 text-sm">
+                    <input type="checkbox" checked={autoRun} onChange={(e) => setAutoRun(e.target.checked)} data-testid="auto-run-checkbox" />
+                    Run automatically (Stage 1 → spacing → Stage 2)
+                  </label>
+                  {autoRun && (
+                    <>
+                      <div>
+                        <Label>Spacing: {autoPercentage}%</Label>
+                        <Slider value={[autoPercentage]} onValueChange={([v]) => setAutoPercentage(v)} min={0} max={200} step={5} className="mt-2" />
+                      </div>
+                      <label className="flex items-center gap-2 text-sm">
+                        <input type="checkbox" checked={reviewFirst} onChange={(e) => setReviewFirst(e.target.checked)} />
+                        Pause after Stage 1 for review
+                      </label>
+                    </>
+                  )}
+                </div>
               </div>
             </div>
             
@@ -591,6 +681,10 @@ export default function AdminDashboard() {
                     <Label>Description</Label>
                     <Textarea value={newStyleDesc} onChange={(e) => setNewStyleDesc(e.target.value)} placeholder="Optional description" rows={3} />
                   </div>
+                  <div>
+                    <Label>Auto spacing % (optional)</Label>
+                    <Input type="number" min={0} max={200} value={newStyleAutoPct} onChange={(e) => setNewStyleAutoPct(e.target.value)} placeholder="Leave empty for manual processing" />
+                  </div>
                 </div>
                 <div className="flex items-end">
                   <Button className="w-full" onClick={handleUploadStyle} disabled={!stylePdf || !newStyleName || uploadingStyle} data-testid="upload-style-btn">
@@ -612,6 +706,9 @@ export default function AdminDashboard() {
                       <FileText className="w-10 h-10 text-gray-400 mb-3" />
                       <h3 className="font-medium">{style.name}</h3>
                       {style.description && <p className="text-sm text-gray-500 mt-1">{style.description}</p>}
+                      {style.auto_expansion_percentage !== null && style.auto_expansion_percentage !== undefined && (
+                        <p className="text-xs text-blue-600 mt-1">Auto: +{style.auto_expansion_percentage}% spacing</p>
+                      )}
                       <Button variant="ghost" size="sm" className="mt-3 text-red-600 hover:text-red-700 hover:bg-red-50" onClick={() => handleDeleteStyle(style.id)}>
                         <Trash2 className="w-4 h-4 mr-1" /> Delete
                       </Button>
@@ -644,7 +741,13 @@ export default function AdminDashboard() {
 
             <div className="flex items-center justify-between">
               <h2 className="text-lg font-semibold">Processing Queue</h2>
-              <Button variant="outline" size="sm" onClick={fetchQueue}><RefreshCw className="w-4 h-4 mr-1" /> Refresh</Button>
+              <div className="flex items-center gap-2">
+                <Input type="number" min={0} value={profileJobs} onChange={(e) => setProfileJobs(parseInt(e.target.value || "0", 10))} className="w-20 h-8" data-testid="profiler-jobs-input" />
+                <Button variant="outline" size="sm" onClick={() => handleArmProfiler(profileJobs)} title="Samples the event loop and to_thread workers" data-testid="profiler-btn">
+                  Profile next {profileJobs} job(s){profiler.jobs_remaining ? ` (${profiler.jobs_remaining} armed)` : ""}
+                </Button>
+                <Button variant="outline" size="sm" onClick={() => { fetchQueue(); fetchProfiler(); }}><RefreshCw className="w-4 h-4 mr-1" /> Refresh</Button>
+              </div>
             </div>
 
             {queue.length === 0 ? (
@@ -659,7 +762,10 @@ export default function AdminDashboard() {
                     <div className="flex items-center justify-between mb-3">
                       <div>
                         <h3 className="font-semibold text-lg">{item.city_name}</h3>
-                        <p className="text-sm text-gray-500">{item.style_name}</p>
+                        <p className="text-sm text-gray-500">
+                          {item.style_name}
+                          {item.auto_pipeline && <span className="ml-2 text-blue-600">· Auto +{item.auto_pipeline.expansion_percentage}%{item.auto_pipeline.review ? " (review)" : ""}</span>}
+                        </p>
                       </div>
                       <span className={`status-badge ${getStatusColor(item.status)}`}>{getStatusLabel(item.status)}</span>
                     </div>
@@ -681,6 +787,12 @@ export default function AdminDashboard() {
                         </>
                       )}
 
+                      {item.status === "stage1_complete" && item.auto_pipeline?.review && (
+                        <Button size="sm" onClick={() => handleSetReview(item.id, false)}>
+                          <Check className="w-4 h-4 mr-1" /> Approve & Continue
+                        </Button>
+                      )}
+
                       {item.status === "stage1_complete" && (
                         <Button size="sm" variant="outline" onClick={() => setSelectedQueueItem(item.id)}>
                           <MoveHorizontal className="w-4 h-4 mr-1" /> Adjust Spacing
@@ -694,6 +806,12 @@ export default function AdminDashboard() {
                         </Button>
                       )}
 
+                      {["stage1_complete", "spacing_applied", "done", "error"].includes(item.status) && (
+                        <Button size="sm" variant="ghost" onClick={() => handleProcessStage1(item.id, true)} disabled={processing} title="Run Stage 1 again with a new Gemini call">
+                          <RefreshCw className="w-4 h-4 mr-1" /> Regenerate
+                        </Button>
+                      )}
+
                       {item.status === "done" && (
                         <a href={`/city/${item.id}`} target="_blank" rel="noopener noreferrer" className="inline-flex items-center gap-1 text-sm text-green-600 hover:text-green-800 font-medium">
                           <Eye className="w-4 h-4" /> View Result
@@ -705,6 +823,34 @@ export default function AdminDashboard() {
                       )}
                     </div>
 
+                    {/* Per-stage timing spans */}
+                    {item.timings && (
+                      <details className="mt-3 text-sm" data-testid={`timings-${item.id}`}>
+                        <summary className="cursor-pointer text-gray-600">
+                          Timings: {Object.entries(item.timings).map(([stage, t]) => `${stage} ${(t.total_ms / 1000).toFixed(2)}s`).join(" · ")}
+                        </summary>
+                        {Object.entries(item.timings).map(([stage, t]) => (
+                          <div key={stage} className="mt-2">
+                            <div className="font-medium">
+                              {stage} — {(t.total_ms / 1000).toFixed(2)}s
+                              {t.profile && (
+                                <a href={`${API}/admin/profiler/${t.profile}`} className="ml-2 text-blue-600 hover:underline">flamegraph</a>
+                              )}
+                            </div>
+                            {t.spans.map((span, i) => (
+                              <div key={i} className="flex items-center gap-2">
+                                <span className="w-32 text-gray-500">{span.name}</span>
+                                <div className="flex-1 bg-gray-100 h-2 rounded">
+                                  <div className="bg-gray-700 h-2 rounded" style={{ width: `${Math.max(1, (span.duration_ms / Math.max(t.total_ms, 1)) * 100)}%` }} />
+                                </div>
+                                <span className="w-20 text-right text-gray-500">{span.duration_ms.toFixed(0)} ms</span>
+                              </div>
+                            ))}
+                          </div>
+                        ))}
+                      </details>
+                    )}
+
                     {/* Spacing Control Panel - shows when item is selected and stage1 is complete */}
                     {selectedQueueItem === item.id && ["stage1_complete", "spacing_applied"].includes(item.status) && (
                       <div className="mt-4 p-4 bg-white rounded-lg border border-blue-200">
@@ -47,6 +47,10 @@ export default function CityPage() {
     window.open(`${API}/cities/${cityId}/layer/${layerNum}`, "_blank");
   };
 
+  const downloadToolpath = (layerNum, format) => {
+    window.open(`${API}/cities/${cityId}/layer/${layerNum}/export/${format}`, "_blank");
+  };
+
   const downloadStage1 = () => {
     window.open(`${API}/cities/${cityId}/stage1`, "_blank");
   };
@@ -134,6 +138,10 @@ export default function CityPage() {
                       <Download className="w-4 h-4 mr-2" /> SVG
                     </Button>
                   </div>
+                  <div className="flex gap-3 mt-2 text-sm">
+                    <button className="text-gray-600 hover:underline" onClick={() => downloadToolpath(layerNum, "dxf")} data-testid={`download-layer-${layerNum}-dxf`}>DXF</button>
+                    <button className="text-gray-600 hover:underline" onClick={() => downloadToolpath(layerNum, "gcode")} data-testid={`download-layer-${layerNum}-gcode`}>G-code</button>
+                  </div>
                 </div>
               ))}
             </div>
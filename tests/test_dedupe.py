@@ -0,0 +1,116 @@
+import math
+
+import numpy as np
+import pytest
+
+import dedupe
+import geometry
+
+
+def svg(*paths, width=1000):
+    body = "".join(f'<path d="{d}" stroke="black"/>' for d in paths)
+    return f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} 400">{body}</svg>'
+
+
+def test_exact_duplicate_dropped():
+    store = geometry.parse_svg(svg("M100 300 H200", "M200 300 H100"))
+    deduped, report = dedupe.dedupe_store(store)
+    assert report["duplicates_removed"] == 1
+    assert deduped.element_count == 1
+
+
+@pytest.mark.parametrize("offset, merged", [(0.0, True), (0.4, True), (0.6, False), (5.0, False)])
+def test_merges_only_within_tolerance(offset, merged):
+    segments = np.array([[0.0, 0.0, 100.0, 0.0], [50.0, offset, 150.0, offset]])
+    keep, result, owner, stats = dedupe.find_merges(segments, tolerance=0.5)
+    if merged:
+        assert keep.tolist() == [True, False]
+        assert owner.tolist() == [0, 0]
+        np.testing.assert_allclose(result[0, [0, 2]], [0, 150])
+        assert stats["overlaps_merged"] == 1
+        assert stats["length_removed"] == pytest.approx(50)
+    else:
+        assert keep.all()
+        np.testing.assert_array_equal(result, segments)
+
+
+@pytest.mark.parametrize("spacing, kept_rows", [(0.5, [0, 1, 2, 3, 4]), (0.3, [0, 2, 4])])
+def test_parallel_hatching_does_not_chain_into_one_line(spacing, kept_rows):
+    # Lines only merge with those within tolerance of the first line of their group
+    segments = np.array([[0.0, k * spacing, 100.0, k * spacing] for k in range(5)])
+    keep, result, owner, stats = dedupe.find_merges(segments, tolerance=0.5)
+    assert np.flatnonzero(keep).tolist() == kept_rows
+
+
+def test_gap_along_the_line_beyond_tolerance_is_kept():
+    segments = np.array([[0.0, 0.0, 100.0, 0.0], [100.4, 0.0, 150.0, 0.0], [151.0, 0.0, 200.0, 0.0]])
+    keep, result, owner, _ = dedupe.find_merges(segments, tolerance=0.5)
+    assert keep.tolist() == [True, False, True]
+    assert owner.tolist() == [0, 0, 2]
+    np.testing.assert_allclose(result[0], [0, 0, 150, 0])
+
+
+def test_angle_outside_tolerance_is_kept():
+    tilt = 100 * math.tan(math.radians(2))
+    segments = np.array([[0.0, 0.0, 100.0, 0.0], [0.0, 0.0, 100.0, tilt]])
+    keep, _, _, _ = dedupe.find_merges(segments, tolerance=0.5)
+    assert keep.all()
+
+
+def test_groups_keep_collinear_segments_apart():
+    segments = np.array([[0.0, 0.0, 100.0, 0.0], [0.0, 0.0, 100.0, 0.0], [0.0, 0.0, 100.0, 0.0]])
+    keep, _, owner, _ = dedupe.find_merges(segments, groups=np.array([0, 1, 0]))
+    assert keep.tolist() == [True, True, False]
+    assert owner.tolist() == [0, 1, 0]
+
+
+def test_window_on_outline_merges_within_building():
+    # The window's bottom edge lies on the building's floor line
+    store = geometry.parse_svg(svg("M100 300 V100 H200 V300 Z", "M120 300 V250 H150 V300 Z"))
+    assert store.building.tolist() == [0, 0]
+    deduped, report = dedupe.dedupe_store(store)
+    assert report["segments_removed"] == 1 and report["overlaps_merged"] == 1
+    assert deduped.building.tolist() == [0, 0]
+    np.testing.assert_allclose(deduped.element_bboxes()[0], store.element_bboxes()[0])
+
+
+def test_shared_ground_line_does_not_merge_buildings():
+    # Every building's bottom edge lies on the canvas-wide ground line
+    store = geometry.parse_svg(svg(
+        "M100 300 V100 H200 V300 Z",
+        "M400 300 V50 H550 V300 Z",
+        "M700 300 V120 H780 V300 Z",
+        "M0 300 H1000",
+    ))
+    deduped, report = dedupe.dedupe_store(store)
+    assert deduped.building.tolist() == [0, 1, 2, -1]
+    np.testing.assert_allclose(deduped.element_bboxes(), store.element_bboxes())
+
+    expanded = deduped.expand_horizontal(100)
+    boxes = expanded.element_bboxes()
+    # Buildings move rigidly, the ground line stretches
+    np.testing.assert_allclose(boxes[:3, 2] - boxes[:3, 0], [100, 150, 80])
+    assert (boxes[3, 0], boxes[3, 2]) == pytest.approx((0, 2000))
+    # Each building still has its bottom edge (closed outline back to y=300)
+    for polyline, closed in expanded.subset([0, 1, 2]).polylines():
+        assert closed and np.isclose(polyline[:, 1], 300).sum() >= 2
+
+
+def test_dedupe_then_expand_matches_expand_for_clean_input():
+    store = geometry.parse_svg(svg("M100 300 V100 H200 V300 Z", "M400 300 V50 H550 V300 Z", "M0 300 H1000"))
+    deduped, report = dedupe.dedupe_store(store)
+    assert report["segments_removed"] == 0
+    np.testing.assert_allclose(deduped.expand_horizontal(50).coords, store.expand_horizontal(50).coords)
+
+
+def test_ground_line_fragments_are_joined_and_regrouped():
+    # Overlapping pieces of one ground line chain all buildings into one cluster
+    store = geometry.parse_svg(svg(
+        "M0 300 H400", "M300 300 H700", "M600 300 H1000",
+        "M100 300 V100 H200 V300 Z", "M750 300 V120 H850 V300 Z",
+    ))
+    assert store.building.tolist() == [0, 0, 0, 0, 0]
+    deduped, report = dedupe.dedupe_store(store)
+    assert report["segments_removed"] == 2
+    assert deduped.building.tolist() == [-1, 0, 1]
+    np.testing.assert_allclose(deduped.element_bboxes()[:, [0, 2]], [[0, 1000], [100, 200], [750, 850]])
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+import geometry
+
+SKYLINE = """<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 1000 400">
+  <path d="M0 300 L1000 300" stroke="black"/>
+  <rect x="100" y="100" width="100" height="200" fill="none" stroke="black"/>
+  <rect x="120" y="150" width="20" height="30" fill="none" stroke="black"/>
+  <rect x="400" y="50" width="150" height="250" fill="none" stroke="black"/>
+  <g transform="translate(700 0)">
+    <path d="M0 300 V120 H80 V300" fill="none" stroke="black"/>
+  </g>
+  <text x="450" y="380">Label</text>
+</svg>"""
+
+
+def x_extents(store):
+    boxes = store.element_bboxes()
+    return boxes[:, 0], boxes[:, 2]
+
+
+def test_parse_assigns_buildings_and_spanning():
+    store = geometry.parse_svg(SKYLINE)
+    assert store.element_count == 5
+    # Ground line is canvas-wide; the window belongs to the first building
+    assert store.building.tolist() == [-1, 0, 0, 1, 2]
+    assert store.viewbox == [0.0, 0.0, 1000.0, 400.0]
+
+
+@pytest.mark.parametrize("percentage", [0, 25, 100])
+def test_expand_moves_buildings_rigidly(percentage):
+    store = geometry.parse_svg(SKYLINE)
+    expanded = store.expand_horizontal(percentage)
+    factor = 1 + percentage / 100
+    assert expanded.viewbox[2] == pytest.approx(1000 * factor)
+
+    before, after = store.building_bboxes(), expanded.building_bboxes()
+    # Widths and heights of every building are unchanged
+    np.testing.assert_allclose(after[:, 2] - after[:, 0], before[:, 2] - before[:, 0])
+    np.testing.assert_allclose(after[:, [1, 3]], before[:, [1, 3]])
+    # Each building keeps its shape: all its points move by the same amount
+    point_building = np.repeat(store.building, np.diff(store.point_offsets))
+    shift = expanded.coords[:, 0] - store.coords[:, 0]
+    for b in range(store.building_count):
+        assert np.ptp(shift[point_building == b]) == pytest.approx(0)
+    # Order is kept and gaps never shrink
+    gaps_before = before[1:, 0] - before[:-1, 2]
+    gaps_after = after[1:, 0] - after[:-1, 2]
+    assert np.all(gaps_after >= gaps_before - 1e-9)
+    # Canvas-wide elements stretch with the canvas
+    lo, hi = x_extents(expanded)
+    assert (lo[0], hi[0]) == pytest.approx((0, 1000 * factor))
+    np.testing.assert_array_equal(np.diff(store.coords[:, 1]), np.diff(expanded.coords[:, 1]))
+
+
+def test_expand_moves_passthrough_with_canvas():
+    expanded = geometry.parse_svg(SKYLINE).expand_horizontal(100)
+    (label,) = expanded.meta["passthrough"]
+    assert label["x"] == pytest.approx(900)
+    assert 'transform="matrix(1 0 0 1 450 0)"' in expanded.passthrough_xml()[0]
+
+
+def test_to_svg_round_trip_preserves_geometry_and_buildings():
+    expanded = geometry.parse_svg(SKYLINE).expand_horizontal(40)
+    reparsed = geometry.parse_svg(expanded.to_svg(precision=3))
+    assert reparsed.viewbox == pytest.approx(expanded.viewbox)
+    assert reparsed.cmds.tolist() == expanded.cmds.tolist()
+    np.testing.assert_allclose(reparsed.coords, expanded.coords, atol=0.5e-3)
+    assert reparsed.building.tolist() == expanded.building.tolist()
+
+
+def test_save_and_load(tmp_path):
+    store = geometry.parse_svg(SKYLINE)
+    store.save(tmp_path / "city.npz")
+    loaded = geometry.load(tmp_path / "city.npz")
+    np.testing.assert_array_equal(loaded.coords, store.coords)
+    assert loaded.building.tolist() == store.building.tolist()
+    assert loaded.to_svg() == store.to_svg()
+
+
+def test_save_keeps_coordinates_of_wide_drawings(tmp_path):
+    store = geometry.parse_svg(
+        '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 400000 300">'
+        '<path d="M 123456.789 12.345 L 398765.4321 287.654"/></svg>'
+    )
+    store.save(tmp_path / "wide.npz")
+    loaded = geometry.load(tmp_path / "wide.npz")
+    assert np.abs(loaded.coords - store.coords).max() < 0.5e-6
+    assert loaded.to_svg(2) == store.to_svg(2)
@@ -0,0 +1,59 @@
+import pytest
+
+import prompt_cache
+
+
+class ClientError(Exception):
+    def __init__(self, code, status, message):
+        super().__init__(f"{code} {status}. {message}")
+        self.code = code
+
+
+@pytest.mark.parametrize("error, missing", [
+    (ClientError(404, "NOT_FOUND", "CachedContent not found"), True),
+    (ClientError(403, "PERMISSION_DENIED", "CachedContent not found (or permission denied)"), True),
+    (ClientError(400, "INVALID_ARGUMENT", "Unable to process input image"), False),
+    (ClientError(403, "PERMISSION_DENIED", "API key not valid"), False),
+    (ClientError(429, "RESOURCE_EXHAUSTED", "Quota exceeded for cached_content requests"), False),
+    (ClientError(404, "NOT_FOUND", "models/gemini-x is not found"), False),
+])
+def test_only_missing_cache_errors_are_retried_inline(error, missing):
+    assert prompt_cache.cache_missing(error) is missing
+
+
+class FakeCaches:
+    def __init__(self):
+        self.created = []
+
+    async def create(self, model, config):
+        self.created.append(config["contents"][0])
+        return type("Cached", (), {"name": f"cachedContents/{len(self.created)}"})()
+
+    async def update(self, name, config):
+        pass
+
+
+class FakeClient:
+    def __init__(self):
+        self.aio = type("Aio", (), {})()
+        self.aio.caches = FakeCaches()
+
+
+def test_large_prefixes_are_created_then_hit_and_small_ones_skipped():
+    import asyncio
+
+    cache = prompt_cache.PromptCache(min_tokens=1000)
+    client = FakeClient()
+    short = "style " * 100
+    long = "style " * 1000
+
+    async def scenario():
+        assert await cache.get(client, "key", "model", short, "stage1") is None
+        created = await cache.get(client, "key", "model", long, "stage1")
+        hit = await cache.get(client, "key", "model", long, "stage1")
+        return created, hit
+
+    created, hit = asyncio.run(scenario())
+    assert created == hit == "cachedContents/1"
+    # The ineligible prefix never reached the provider nor marked the model unavailable
+    assert client.aio.caches.created == [long]
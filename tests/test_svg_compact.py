@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import geometry
+import svg_compact
+
+
+def random_svg(seed: int) -> str:
+    """Paths using every command kind, incl. H/V runs, mirrored curves (S/T) and several subpaths"""
+    rng = np.random.default_rng(seed)
+
+    def pt():
+        return " ".join(f"{v:.6f}" for v in rng.uniform(-50, 1050, 2))
+
+    paths = []
+    for _ in range(12):
+        x, y = rng.uniform(0, 1000, 2)
+        d = [f"M{x:.6f} {y:.6f}", f"H{x + 40.123456:.6f}", f"V{y - 30.987654:.6f}", f"L{pt()}",
+             f"C{pt()} {pt()} {pt()}", f"S{pt()} {pt()}", f"Q{pt()} {pt()}", "T" + pt(), "Z",
+             f"m{rng.uniform(-5, 5):.6f} {rng.uniform(-5, 5):.6f}", f"l{rng.uniform(-9, 9):.6f} 0", "z"]
+        paths.append(f'<path d="{" ".join(d)}" stroke="#000000" fill="none" stroke-width="{rng.integers(1, 3)}"/>')
+    paths.append('<text x="12.5" y="40">Label</text>')
+    return f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 1000 1000">{"".join(paths)}</svg>'
+
+
+@pytest.mark.parametrize("precision", [0, 1, 2, 3])
+@pytest.mark.parametrize("relative", [True, False])
+@pytest.mark.parametrize("seed", [1, 2])
+def test_round_trip_error_within_half_a_unit(precision, relative, seed):
+    store = geometry.parse_svg(random_svg(seed))
+    svg = svg_compact.serialize(store, precision, relative)
+    reparsed = geometry.parse_svg(svg)
+
+    # Same command kinds element by element (H/V and S/T normalise back to L and C/Q)
+    assert reparsed.cmds.tolist() == store.cmds.tolist()
+    assert reparsed.cmd_offsets.tolist() == store.cmd_offsets.tolist()
+    error = np.abs(reparsed.coords - store.coords).max()
+    assert error <= 0.5 * 10 ** -precision + 1e-9
+    assert svg_compact.size_report(store, svg, precision)["max_error"] == 0.5 * 10 ** -precision
+
+
+def test_compact_output_is_smaller_and_keeps_attributes():
+    store = geometry.parse_svg(random_svg(3))
+    svg = svg_compact.serialize(store, 2)
+    assert "verbose_bytes" not in svg_compact.size_report(store, svg, 2)
+    report = svg_compact.size_report(store, svg, 2, compare=True)
+    assert report["bytes"] < report["verbose_bytes"]
+    assert '<g stroke="#000" fill="none">' in svg
+    assert "<text" in svg
+
+    reparsed = geometry.parse_svg(svg)
+    # Hoisted attributes are inherited back onto every element
+    before = [store.meta["attr_sets"][i] for i in store.attr_index]
+    after = [reparsed.meta["attr_sets"][i] for i in reparsed.attr_index]
+    assert [a["stroke-width"] for a in after] == [b["stroke-width"] for b in before]
+    assert all(a["fill"] == "none" and a["stroke"] == "#000" for a in after)
+
+
+def test_absolute_mode_writes_no_relative_commands():
+    store = geometry.parse_svg(random_svg(4))
+    svg = svg_compact.serialize(store, 2, relative=False)
+    for chunk in svg.split('d="')[1:]:
+        assert not set(chunk.split('"')[0]) & set("mlhvcsqt")
+
+
+@pytest.mark.parametrize("precision, value, text", [
+    (2, 50, ".5"), (2, -50, "-.5"), (2, 12345, "123.45"), (2, 100, "1"), (2, 0, "0"),
+    (0, 7, "7"), (3, -1, "-.001"), (1, -0, "0"),
+])
+def test_number_format(precision, value, text):
+    assert svg_compact._NumberFormat(precision)(value) == text
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+import dedupe
+import geometry
+import tiling
+
+WIDTH, HEIGHT = 3000, 1000
+GROUND = 900
+# Rectangles (x0, y0, x1, y1); the second lies in the overlap of the first two tiles
+BUILDINGS = [(400, 300, 600, GROUND), (960, 500, 1040, GROUND), (2200, 200, 2500, GROUND)]
+
+
+def tile_svg(tile: tiling.Tile) -> str:
+    """What a tile's vectorisation returns: the scene clipped to its window, in window pixels"""
+    x0, y0, x1, y1 = tile.window
+    paths = [f'<path d="M0 {GROUND - y0} H{x1 - x0}"/>']
+    for bx0, by0, bx1, by1 in BUILDINGS:
+        if bx0 >= x0 and bx1 <= x1:
+            paths.append(f'<path d="M{bx0 - x0} {by1 - y0} V{by0 - y0} H{bx1 - x0} V{by1 - y0} Z"/>')
+    return f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {x1 - x0} {y1 - y0}">{"".join(paths)}</svg>'
+
+
+def test_plan_tiles_cores_cover_the_canvas_once():
+    tiles = tiling.plan_tiles(WIDTH, HEIGHT, 1000, overlap=0.1)
+    coverage = np.zeros((HEIGHT // 100, WIDTH // 100), dtype=int)
+    for tile in tiles:
+        x0, y0, x1, y1 = tile.core
+        coverage[y0 // 100:y1 // 100, x0 // 100:x1 // 100] += 1
+        wx0, wy0, wx1, wy1 = tile.window
+        assert wx0 <= x0 and wy0 <= y0 and wx1 >= x1 and wy1 >= y1
+    assert (coverage == 1).all()
+
+
+def test_merged_tiles_are_seam_free():
+    tiles = tiling.plan_tiles(WIDTH, HEIGHT, 1000, overlap=0.1)
+    merged = tiling.merge_tiles(tiles, [tile_svg(t) for t in tiles], WIDTH, HEIGHT)
+    assert merged.viewbox == [0.0, 0.0, WIDTH, HEIGHT]
+    store, _ = dedupe.dedupe_store(merged)
+
+    boxes = store.element_bboxes()
+    # One ground line across every seam, canvas-wide again
+    ground = np.flatnonzero(store.building == -1)
+    assert len(ground) == 1
+    np.testing.assert_allclose(boxes[ground[0]], [0, GROUND, WIDTH, GROUND])
+    # Each building exactly once, including the one both tiles drew, with its bottom edge
+    np.testing.assert_allclose(boxes[store.building >= 0], BUILDINGS)
+    assert store.building_count == len(BUILDINGS)
+    assert all(closed for _, closed in store.subset(store.building >= 0).polylines())
+
+
+def test_unparseable_tile_is_left_out():
+    tiles = tiling.plan_tiles(WIDTH, HEIGHT, 1000, overlap=0.1)
+    svgs = [tile_svg(t) for t in tiles]
+    svgs[2] = "not svg"
+    merged = tiling.merge_tiles(tiles, svgs, WIDTH, HEIGHT)
+    # Two ground pieces and the two buildings of the remaining tiles
+    assert merged.element_count == 4
+    assert merged.bbox()[2] == tiles[1].window[2]
+    with pytest.raises(ValueError):
+        tiling.merge_tiles(tiles, ["x"] * len(tiles), WIDTH, HEIGHT)
+
+
+def skyline() -> geometry.GeometryStore:
+    paths = [f'<path d="M0 {GROUND} H{WIDTH}"/>']
+    for i, x in enumerate(range(100, WIDTH - 200, 250)):
+        top = 300 + (i * 137) % 400
+        paths.append(f'<path d="M{x} {GROUND} V{top} H{x + 150} V{GROUND} Z"/>')
+        paths.append(f'<path d="M{x + 20} {top + 40} h30 v40 h-30 Z"/>')
+    return geometry.parse_svg(
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {WIDTH} {HEIGHT}">{"".join(paths)}</svg>'
+    )
+
+
+@pytest.mark.parametrize("count", [2, 3, 5])
+def test_stitched_strips_keep_every_element_once(count):
+    store = skyline()
+    strips = tiling.plan_strips(store, count, overlap=0.1)
+    assert len(strips) == count
+    # Cores tile the canvas; windows hold whole buildings
+    edges = [s.core for s in strips]
+    assert edges[0][0] == 0 and edges[-1][1] == WIDTH
+    assert all(a[1] == b[0] for a, b in zip(edges, edges[1:]))
+
+    # Identity "model": each strip returns its own input
+    stitched = tiling.stitch(strips, [s.svg for s in strips], store.meta)
+    result, report = dedupe.dedupe_store(stitched)
+    assert report["segments_removed"] == 0
+    assert result.element_count == store.element_count
+
+    def key(s):
+        return sorted(map(tuple, np.round(s.element_bboxes(), 6)))
+    assert key(result) == key(store)
+    assert result.building.tolist().count(-1) == 1
@@ -0,0 +1,108 @@
+import re
+import time
+
+import numpy as np
+import pytest
+
+import toolpath
+
+VIEWBOX = [0.0, 0.0, 1000.0, 400.0]
+
+
+def squares():
+    """Six closed squares and an open stroke scattered over the canvas, in poor order"""
+    rng = np.random.default_rng(7)
+    polylines = []
+    for x, y in rng.uniform(50, 350, size=(6, 2)) * (2.5, 1):
+        points = np.array([[x, y], [x + 20, y], [x + 20, y + 20], [x, y + 20], [x, y]])
+        polylines.append((points, True))
+    polylines.append((np.array([[900.0, 50.0], [960.0, 80.0], [990.0, 60.0]]), False))
+    return polylines
+
+
+def rapid_distance(gcode: str) -> float:
+    """Sum of G0 move lengths, starting from machine home"""
+    position, total = np.zeros(2), 0.0
+    for line in gcode.splitlines():
+        match = re.match(r"G[01] X(\S+) Y(\S+)", line)
+        if not match:
+            continue
+        target = np.array([float(match[1]), float(match[2])])
+        if line.startswith("G0"):
+            total += float(np.hypot(*(target - position)))
+        position = target
+    return total
+
+
+def test_plan_visits_every_path_once_and_shortens_travel():
+    polylines = squares()
+    plan = toolpath.plan(polylines, toolpath.canvas_origin(VIEWBOX))
+    assert sorted(plan["order"]) == list(range(len(polylines)))
+    assert plan["travel_after"] <= plan["travel_before"]
+    assert plan["travel_after"] == pytest.approx(
+        toolpath.travel_distance(polylines, plan["order"], plan["reversed"], plan["origin"])
+    )
+
+
+@pytest.mark.parametrize("scale", [1.0, 0.25])
+def test_reported_travel_matches_gcode_rapids(scale):
+    polylines = squares()
+    plan = toolpath.plan(polylines, toolpath.canvas_origin(VIEWBOX))
+    gcode = toolpath.to_gcode(polylines, plan, scale)
+    assert gcode.rstrip().splitlines()[-2] == "G0 X0 Y0"
+    assert rapid_distance(gcode) == pytest.approx(plan["travel_after"] * scale, abs=0.01)
+
+
+def test_gcode_puts_canvas_bottom_left_at_machine_origin():
+    polylines = [(np.array([[0.0, 400.0], [10.0, 390.0]]), False)]
+    plan = toolpath.plan(polylines, toolpath.canvas_origin(VIEWBOX))
+    assert "G0 X0.000 Y0.000" in toolpath.to_gcode(polylines, plan)
+    assert plan["travel_before"] == pytest.approx(np.hypot(10, 10))
+
+
+def test_dxf_is_r12_with_polyline_header_points():
+    polylines = squares()
+    plan = toolpath.plan(polylines, toolpath.canvas_origin(VIEWBOX))
+    tags = toolpath.to_dxf(polylines, plan, layer="LAYER_1").split("\n")
+    pairs = list(zip(tags[0::2], tags[1::2]))
+    assert ("1", "AC1009") in pairs
+    assert ("9", "$INSUNITS") not in pairs
+    assert pairs[-1] == ("0", "EOF")
+    starts = [i for i, pair in enumerate(pairs) if pair == ("0", "POLYLINE")]
+    assert len(starts) == len(polylines)
+    for i in starts:
+        header = dict(pairs[i + 1:i + 8])
+        assert {"8", "66", "10", "20", "30", "70"} <= set(header)
+    assert sum(pair == ("0", "VERTEX") for pair in pairs) == 6 * 4 + 3
+
+
+def segments(count, seed=3):
+    rng = np.random.default_rng(seed)
+    starts = rng.uniform(0, 1000, size=(count, 2))
+    return [(np.array([start, start + rng.uniform(-5, 5, size=2)]), False) for start in starts]
+
+
+def test_grid_search_gives_the_greedy_tour():
+    polylines = segments(300)
+    starts, ends = toolpath._endpoints(polylines)
+    origin = np.array([0.0, 1000.0])
+    order, flipped = toolpath._nearest_neighbour(starts, ends, origin, time.monotonic() + 60)
+
+    # Brute force: scan every remaining endpoint at each step
+    remaining, position, expected = set(range(len(polylines))), origin, []
+    while remaining:
+        index, flip = min(((i, f) for i in remaining for f in (False, True)),
+                          key=lambda c: np.hypot(*((ends if c[1] else starts)[c[0]] - position)))
+        expected.append((index, flip))
+        position = starts[index] if flip else ends[index]
+        remaining.remove(index)
+    assert list(zip(order.tolist(), flipped.tolist())) == expected
+
+
+def test_plan_keeps_to_the_time_budget_on_dense_layers():
+    polylines = segments(20000)
+    started = time.monotonic()
+    plan = toolpath.plan(polylines, (0.0, 1000.0), time_budget=0.5)
+    assert time.monotonic() - started < 2.0
+    assert sorted(plan["order"]) == list(range(len(polylines)))
+    assert plan["travel_after"] <= plan["travel_before"]